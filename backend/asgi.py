@@ -0,0 +1,172 @@
+"""
+ASGI entry point. Serves the read routes from coroutines on the server's event
+loop, sharing one async Supabase client, and every other route from the Flask app.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5001 --workers 4
+
+A request waiting on PostgREST here holds no thread, so one worker can keep
+many reads in flight instead of one per WSGI thread. The Flask routes run on
+WSGI_THREADS threads of each worker.
+"""
+import asyncio
+import json
+import time
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.middleware import Middleware
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route
+
+from config import WSGI_THREADS
+from main import app as flask_app
+from utils import get_pest_history_page, get_contacts_for_supplier_page
+import async_utils
+import metrics
+
+
+class _AsyncRoute:
+    """
+    Does for an async route what main.py's request hooks and Flask-CORS do for the Flask routes:
+    labels and times the request for /metrics and adds the CORS response headers.
+
+    Args:
+        app: The ASGI app of the route.
+        rule (str): The Flask rule of the same route, so both serving paths share metric series.
+    """
+
+    def __init__(self, app, rule: str):
+        self.app = app
+        self.rule = rule
+
+    async def __call__(self, scope, receive, send):
+        token = metrics.current_route.set(self.rule)
+        origin = Headers(scope=scope).get('origin')
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_headers(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                if origin:
+                    headers = MutableHeaders(scope=message)
+                    headers['Access-Control-Allow-Origin'] = origin
+                    headers['Access-Control-Allow-Credentials'] = 'true'
+                    headers.add_vary_header('Origin')
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            metrics.request_latency.observe((self.rule, scope['method'], str(status)), time.perf_counter() - start)
+            metrics.current_route.reset(token)
+
+
+async def _json_body(request):
+    try:
+        data = await request.json()
+    except json.JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _bad_request():
+    return JSONResponse({'error': 'Request body must be a JSON object'}, status_code=400)
+
+
+async def schemes_route(request):
+    schemes = await async_utils.get_schemes_by_location(request.path_params['location'])
+    if schemes:
+        return JSONResponse({'schemes': schemes})
+    return JSONResponse({'error': 'Schemes not found'}, status_code=404)
+
+
+async def user_name_route(request):
+    data = await _json_body(request)
+    if data is None:
+        return _bad_request()
+    name = await async_utils.get_user_name(data.get('user_id'), data.get('email'))
+    if name:
+        return JSONResponse({'name': name})
+    return JSONResponse({'error': 'User not found'}, status_code=404)
+
+
+async def last_pest_images_route(request):
+    data = await _json_body(request)
+    if data is None:
+        return _bad_request()
+    images = await async_utils.get_last_4_pest_images(data.get('user_id'))
+    return JSONResponse({'images': images})
+
+
+async def _page(get_page, key: str, request):
+    # Keyset pages use the sync client; they are one indexed query, so a thread is fine
+    try:
+        page = await asyncio.to_thread(get_page, request.path_params[key], request.query_params.get('limit'), request.query_params.get('cursor'))
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    return JSONResponse(page)
+
+
+async def pest_history_route(request):
+    if 'limit' in request.query_params or 'cursor' in request.query_params:
+        return await _page(get_pest_history_page, 'user_id', request)
+    history = await async_utils.get_pest_history(request.path_params['user_id'])
+    return JSONResponse({'history': history})
+
+
+async def last_contacted_route(request):
+    contacts = await async_utils.get_last_contacted_suppliers(request.path_params['farmer_id'])
+    if contacts:
+        return JSONResponse({'contacts': contacts})
+    return JSONResponse({'error': 'No contact information found'}, status_code=404)
+
+
+async def supplier_inventory_route(request):
+    inventory = await async_utils.get_supplier_inventory(request.path_params['supplier_id'])
+    if inventory:
+        return JSONResponse({'inventory': inventory})
+    return JSONResponse({'error': 'Inventory not found'}, status_code=404)
+
+
+async def supplier_details_route(request):
+    data = await _json_body(request)
+    if data is None:
+        return _bad_request()
+    suppliers = await async_utils.get_supplier_details(data.get('pesticide_name'), fuzzy=bool(data.get('fuzzy')))
+    return JSONResponse({'suppliers': suppliers})
+
+
+async def user_info_route(request):
+    info = await async_utils.get_user_info(request.path_params['user_id'])
+    if info:
+        return JSONResponse(info)
+    return JSONResponse({'error': 'User not found'}, status_code=404)
+
+
+async def contacts_for_supplier_route(request):
+    if 'limit' in request.query_params or 'cursor' in request.query_params:
+        return await _page(get_contacts_for_supplier_page, 'supplier_id', request)
+    contacts = await async_utils.get_contacts_for_supplier(request.path_params['supplier_id'])
+    return JSONResponse({'contacts': contacts})
+
+
+def _route(rule: str, path: str, endpoint, method: str):
+    return Route(path, endpoint, methods=[method], middleware=[Middleware(_AsyncRoute, rule=rule)])
+
+
+app = Starlette(routes=[
+    _route('/schemes/<location>', '/schemes/{location}', schemes_route, 'GET'),
+    _route('/user_name', '/user_name', user_name_route, 'POST'),
+    _route('/last_pest_images', '/last_pest_images', last_pest_images_route, 'POST'),
+    _route('/pest_history/<user_id>', '/pest_history/{user_id}', pest_history_route, 'GET'),
+    _route('/last_contacted_suppliers/<farmer_id>', '/last_contacted_suppliers/{farmer_id}', last_contacted_route, 'GET'),
+    _route('/supplier_inventory/<supplier_id>', '/supplier_inventory/{supplier_id}', supplier_inventory_route, 'GET'),
+    _route('/supplier_details', '/supplier_details', supplier_details_route, 'POST'),
+    _route('/user_info/<user_id>', '/user_info/{user_id}', user_info_route, 'GET'),
+    _route('/contacts_for_supplier/<supplier_id>', '/contacts_for_supplier/{supplier_id}', contacts_for_supplier_route, 'GET'),
+    # Everything else, including CORS preflights for the routes above, is served by Flask
+    Mount('/', WSGIMiddleware(flask_app, workers=WSGI_THREADS)),
+])
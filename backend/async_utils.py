@@ -0,0 +1,311 @@
+import asyncio
+import weakref
+
+from supabase import acreate_client
+
+from config import SUPABASE_URL, SUPABASE_KEY, IN_FILTER_CHUNK_SIZE
+from cache import cached_async, user_info_cache, user_name_cache, inventory_cache, schemes_cache
+from utils import first_schemes, format_shop_value, location_key, location_pattern
+from pesticide_index import resolve_pesticide_name
+from metrics import InstrumentedClient
+from images import thumbnail_url
+
+_clients = weakref.WeakKeyDictionary()
+_client_locks = weakref.WeakKeyDictionary()
+
+
+async def get_async_db():
+    """
+    Returns the async Supabase client of the running event loop, creating it on first use.
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is not None:
+        return client
+    lock = _client_locks.setdefault(loop, asyncio.Lock())
+    async with lock:
+        if loop not in _clients:
+            _clients[loop] = InstrumentedClient(await acreate_client(SUPABASE_URL, SUPABASE_KEY))
+        return _clients[loop]
+
+
+async def _fetch_rows_by_ids(table: str, columns: str, key: str, ids, **filters):
+    """
+    Async counterpart of utils._fetch_rows_by_ids.
+    """
+    ids = list(dict.fromkeys(i for i in ids if i is not None))
+    if not ids:
+        return {}
+    db = await get_async_db()
+    rows = {}
+    for start in range(0, len(ids), IN_FILTER_CHUNK_SIZE):
+        query = db.table(table).select(columns).in_(key, ids[start:start + IN_FILTER_CHUNK_SIZE])
+        for column, value in filters.items():
+            query = query.eq(column, value)
+        result = await query.execute()
+        for row in result.data or []:
+            rows.setdefault(row.get(key), row)
+    return rows
+
+
+@cached_async(schemes_cache, key=lambda location: location_key(location))
+async def get_schemes_by_location(location: str):
+    """
+    Retrieves schemes for a given location.
+
+    Args:
+        location (str): The location string, matched regardless of case and whitespace.
+    """
+    db = await get_async_db()
+    result = await db.table('weather_scheme_cache').select('schemes').filter('location', 'imatch', location_pattern(location)).execute()
+    return first_schemes(result.data)
+
+
+@cached_async(user_name_cache, key=lambda user_id=None, email=None: ('id', user_id) if user_id is not None else ('email', email))
+async def get_user_name(user_id=None, email=None):
+    """
+    Retrieves the name of a user by user_id or email.
+
+    Args:
+        user_id (int, optional): The user's ID.
+        email (str, optional): The user's email.
+    """
+    db = await get_async_db()
+    if user_id is not None:
+        result = await db.table('users').select('name').eq('id', user_id).limit(1).execute()
+    elif email is not None:
+        result = await db.table('users').select('name').eq('email', email).limit(1).execute()
+    else:
+        return None
+    if result.data:
+        return result.data[0]['name']
+    return None
+
+
+async def get_last_4_pest_images(user_id: str):
+    """
+    Retrieves the thumbnail URLs of the last 4 pests searched by a user.
+
+    Args:
+        user_id (int): The user's ID.
+    """
+    db = await get_async_db()
+    result = await db.table('pest_inference_results').select('image_url').eq('user_id', user_id).order('prediction_time', desc=True).limit(4).execute()
+    if result.data:
+        return [thumbnail_url(row['image_url']) for row in result.data]
+    return []
+
+
+async def get_pest_history(user_id: str):
+    """
+    Retrieves the pest detection history for a user.
+
+    Args:
+        user_id (int): The user's ID.
+    """
+    try:
+        db = await get_async_db()
+        result = await db.table('pest_inference_results').select('image_url, pest_name, pesticide, prediction_time').eq('user_id', user_id).order('prediction_time', desc=True).execute()
+        if result.data:
+            return [
+                {
+                    'img_url': row['image_url'],
+                    'pest_name': row['pest_name'],
+                    'pesticide': row['pesticide'],
+                    'prediction_time': row['prediction_time']
+                }
+                for row in result.data
+            ]
+        return []
+    except Exception as e:
+        print(f"Error retrieving pest history: {e}")
+        return []
+
+
+async def get_last_contacted_suppliers(farmer_id: str):
+    """
+    Retrieves all suppliers contacted by a farmer.
+
+    Args:
+        farmer_id (int): The farmer's ID.
+    """
+    try:
+        db = await get_async_db()
+        result = await db.table('suppliers_contacted').select('supplier_id, pesticide_name, contact_time').eq('farmer_id', farmer_id).order('contact_time', desc=True).limit(25).execute()
+        if not result.data:
+            return []
+        supplier_ids = [row.get('supplier_id') for row in result.data]
+        # Registered suppliers come from users, the rest from shop_list
+        users = await _fetch_rows_by_ids('users', 'id, name, phone, email', 'id', supplier_ids, role='supplier')
+        details, shops = await asyncio.gather(
+            _fetch_rows_by_ids('supplier_details', 'supplier_id, shop_name, address', 'supplier_id', list(users)),
+            _fetch_rows_by_ids('shop_list', 'id, shop_name, address, phone, district', 'id', [i for i in supplier_ids if i not in users])
+        )
+        contacts = []
+        for row in result.data:
+            supplier_id = row.get('supplier_id')
+            supplier = users.get(supplier_id)
+            if supplier:
+                supplier_details = details.get(supplier_id, {'shop_name': None, 'address': None})
+                contacts.append({
+                    'supplier_id': supplier_id,
+                    'supplier_name': supplier.get('name'),
+                    'shop_name': supplier_details.get('shop_name'),
+                    'address': supplier_details.get('address'),
+                    'pesticide': row.get('pesticide_name'),
+                    'contact_time': row.get('contact_time')
+                })
+            elif supplier_id in shops:
+                shop = shops[supplier_id]
+                contacts.append({
+                    'supplier_id': supplier_id,
+                    'supplier_name': format_shop_value(shop.get('shop_name')),
+                    'shop_name': format_shop_value(shop.get('shop_name')),
+                    'address': format_shop_value(shop.get('address')),
+                    'phone': format_shop_value(shop.get('phone')),
+                    'district': format_shop_value(shop.get('district')),
+                    'pesticide': row.get('pesticide_name'),
+                    'contact_time': row.get('contact_time')
+                })
+            else:
+                print(f"Error: Supplier with ID {supplier_id} not found in users or shop_list.")
+        return contacts
+    except Exception as e:
+        print(f"Error retrieving contacted suppliers: {e}")
+        return []
+
+
+async def get_contacts_for_supplier(supplier_id: str):
+    """
+    Retrieves all contact records for a supplier.
+
+    Args:
+        supplier_id (str): The supplier's ID.
+    """
+    try:
+        db = await get_async_db()
+        result = await db.table('suppliers_contacted').select('farmer_id, pesticide_name, contact_time').eq('supplier_id', supplier_id).order('contact_time', desc=True).execute()
+        if not result.data:
+            return []
+        return result.data
+    except Exception as e:
+        print(f"Error retrieving contacts for supplier: {e}")
+        return []
+
+
+@cached_async(inventory_cache, key=lambda supplier_id: supplier_id)
+async def get_supplier_inventory(supplier_id):
+    """
+    Retrieves supplier inventory information.
+
+    Args:
+        supplier_id: The supplier's ID (string UUID).
+    """
+    try:
+        db = await get_async_db()
+        result = await db.table('pesticide_listings').select('*').eq('supplier_id', supplier_id).execute()
+        if result.data:
+            return result.data
+        return []
+    except Exception as e:
+        print(f"Error retrieving supplier inventory: {e}")
+        return []
+
+
+async def get_supplier_details(pesticide_name: str, fuzzy: bool = False):
+    """
+    Returns a list of suppliers who have the given pesticide.
+
+    Args:
+        pesticide_name (str): The name of the pesticide.
+        fuzzy (bool): Resolve the name to the closest known pesticide first.
+    """
+    try:
+        if fuzzy:
+            # The index is built with the sync client, so keep its first load off the event loop
+            pesticide_name = await asyncio.to_thread(resolve_pesticide_name, pesticide_name)
+        db = await get_async_db()
+        result, product_result = await asyncio.gather(
+            db.table('pesticide_listings').select('supplier_id, price, stock').eq('pesticide', pesticide_name).execute(),
+            db.table('products_list').select('supplier_id, pesticide, price, stock').eq('pesticide', pesticide_name).execute()
+        )
+        supplier_ids = [row.get('supplier_id') for row in result.data or []]
+        users, details, shops = await asyncio.gather(
+            _fetch_rows_by_ids('users', 'id, name', 'id', supplier_ids, role='supplier'),
+            _fetch_rows_by_ids('supplier_details', 'supplier_id, shop_name, address', 'supplier_id', supplier_ids),
+            _fetch_rows_by_ids('shop_list', 'id, shop_name, address, phone, district', 'id', [row.get('supplier_id') for row in product_result.data or []])
+        )
+        suppliers = []
+        # Registered suppliers
+        for row in result.data or []:
+            supplier_id = row.get('supplier_id')
+            supplier = users.get(supplier_id)
+            if supplier:
+                supplier_details = details.get(supplier_id, {'shop_name': None, 'address': None})
+                suppliers.append({
+                    'supplier_id': supplier_id,
+                    'supplier_name': supplier.get('name'),
+                    'shop_name': supplier_details.get('shop_name'),
+                    'address': supplier_details.get('address'),
+                    'price': row.get('price'),
+                    'stock': row.get('stock')
+                })
+        # Unregistered suppliers from product_list/shop_list
+        for row in product_result.data or []:
+            supplier_id = row.get('supplier_id')
+            shop = shops.get(supplier_id, {'shop_name': None, 'address': None, 'phone': None, 'district': None})
+            suppliers.append({
+                'supplier_id': supplier_id,
+                'supplier_name': format_shop_value(shop.get('shop_name')),
+                'shop_name': format_shop_value(shop.get('shop_name')),
+                'address': format_shop_value(shop.get('address')),
+                'phone': format_shop_value(shop.get('phone')),
+                'district': format_shop_value(shop.get('district')),
+                'price': format_shop_value(row.get('price')),
+                'stock': format_shop_value(row.get('stock'))
+            })
+        return suppliers
+    except Exception as e:
+        print(f"Error retrieving supplier details: {e}")
+        return []
+
+
+@cached_async(user_info_cache, key=lambda user_id: user_id)
+async def get_user_info(user_id):
+    """
+    Retrieves all user info and role-specific details.
+
+    Args:
+        user_id (int): The user's ID.
+    """
+    try:
+        db = await get_async_db()
+        user_result = await db.table('users').select('*').eq('id', user_id).limit(1).execute()
+        if not user_result.data:
+            return None
+        user = user_result.data[0]
+        role = user.get('role', '').lower()
+        if role == 'farmer':
+            details_result = await db.table('farmer_details').select('farm_size, main_crop, irrigation_type, soil_type').eq('farmer_id', user_id).limit(1).execute()
+            user['details'] = details_result.data[0] if details_result.data else {
+                'farm_size': None,
+                'main_crop': None,
+                'irrigation_type': None,
+                'soil_type': None
+            }
+        elif role == 'supplier':
+            details_result = await db.table('supplier_details').select('*').eq('supplier_id', user_id).limit(1).execute()
+            user['details'] = details_result.data[0] if details_result.data else {
+                'shop_name': None,
+                'address': None,
+                'latitude': None,
+                'longitude': None,
+                'approved': False
+            }
+        elif role == 'admin':
+            details_result = await db.table('admin_details').select('*').eq('admin_id', user_id).limit(1).execute()
+            user['details'] = details_result.data[0] if details_result.data else None
+        return user
+    except Exception as e:
+        print(f"Error retrieving user info: {e}")
+        return None
@@ -0,0 +1,86 @@
+"""
+Load test comparing the read routes served by Flask on a fixed number of WSGI
+threads with the same routes served by asgi.py's coroutines.
+
+Every database call waits --latency seconds, as a PostgREST round trip would.
+The Flask routes can keep at most --threads requests in flight; the async
+routes keep as many as the clients send, so requests per second should grow
+with --concurrency until the event loop is CPU bound.
+
+    python benchmarks/async_serving.py --requests 2000 --concurrency 200 --latency 0.02
+"""
+import argparse
+import asyncio
+import time
+
+from common import setup, report
+
+
+async def _load(app, paths, concurrency: int):
+    import httpx
+
+    latencies, statuses = [], {}
+    queue = asyncio.Queue()
+    for path in paths:
+        queue.put_nowait(path)
+
+    # Requests go straight to the app, so the numbers measure how it handles waiting
+    # on the database rather than the cost of sockets on the benchmark machine
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://benchmark', timeout=120) as client:
+        async def worker():
+            while not queue.empty():
+                path = queue.get_nowait()
+                started = time.perf_counter()
+                response = await client.get(path)
+                latencies.append(time.perf_counter() - started)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return latencies, statuses, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.02, help="seconds per database call")
+    parser.add_argument('--threads', type=int, default=16, help="WSGI_THREADS")
+    parser.add_argument('--farmers', type=int, default=100)
+    args = parser.parse_args()
+
+    client = setup(WSGI_THREADS=args.threads, WRITE_BEHIND='false')
+    from a2wsgi import WSGIMiddleware
+    import async_utils
+    from fake_supabase import AsyncFakeClient
+    from asgi import app as asgi_app
+    from main import app as flask_app
+
+    async def create_client(url, key):
+        return AsyncFakeClient(client)
+    async_utils.acreate_client = create_client
+
+    client.tables.update({
+        'suppliers_contacted': [
+            {'farmer_id': f"farmer-{f}", 'supplier_id': f"supplier-{(f + i) % 50}", 'pesticide_name': 'Neem Oil',
+             'contact_time': f"2024-05-{i + 1:02d}"}
+            for f in range(args.farmers) for i in range(10)
+        ],
+        'users': [{'id': f"supplier-{s}", 'name': f"Supplier {s}", 'phone': '1', 'email': '', 'role': 'supplier'} for s in range(25)],
+        'supplier_details': [{'supplier_id': f"supplier-{s}", 'shop_name': f"Shop {s}", 'address': ''} for s in range(25)],
+        'shop_list': [{'id': f"supplier-{s}", 'shop_name': f"Local {s}", 'address': '', 'phone': '2', 'district': 'Pune'} for s in range(25, 50)],
+    })
+    client.latency = args.latency
+    paths = [f"/last_contacted_suppliers/farmer-{i % args.farmers}" for i in range(args.requests)]
+
+    print(f"{args.requests} requests from {args.concurrency} clients, {args.latency * 1000:.0f}ms per database call")
+    for name, app in ((f"Flask on {args.threads} threads", WSGIMiddleware(flask_app, workers=args.threads)),
+                      ("asgi.py", asgi_app)):
+        client.executed.clear()
+        latencies, statuses, elapsed = asyncio.run(_load(app, paths, args.concurrency))
+        report(name, latencies, elapsed)
+        print(f"{'':<28} statuses={dict(sorted(statuses.items()))} queries/request={client.queries() / len(paths):.1f}")
+
+
+if __name__ == '__main__':
+    main()
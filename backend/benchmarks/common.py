@@ -0,0 +1,81 @@
+"""
+Shared setup for the benchmarks.
+
+Call setup() before importing any backend module: it points the settings at
+temporary directories and replaces the Supabase client with the in-memory fake
+used by the tests, so the benchmarks need no credentials or network access.
+"""
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup(**settings):
+    """
+    Configures the backend for a benchmark run and returns the fake Supabase client.
+
+    Args:
+        **settings: Environment settings to override, e.g. HASH_WORKERS=2.
+    """
+    state_dir = tempfile.mkdtemp(prefix='agri-bench-')
+    os.environ.setdefault('SUPABASE_URL', 'https://project.supabase.co')
+    os.environ.setdefault('SUPABASE_KEY', 'header.payload.signature')
+    os.environ.update({
+        'MAIL_TRANSPORT': 'fake',
+        'IMAGE_STORAGE': 'fake',
+        'MAIL_SPOOL_DIR': os.path.join(state_dir, 'mail_spool'),
+        'UPLOAD_SPOOL_DIR': os.path.join(state_dir, 'upload_spool'),
+        'WRITE_BEHIND_JOURNAL_DIR': os.path.join(state_dir, 'write_journal'),
+    })
+    os.environ.update({name: str(value) for name, value in settings.items()})
+    sys.path[:0] = [BACKEND_DIR, os.path.join(BACKEND_DIR, 'tests')]
+
+    import config
+    from metrics import InstrumentedClient
+    from fake_supabase import FakeClient
+
+    client = FakeClient()
+    config.db = InstrumentedClient(client)
+    return client
+
+
+def serve(app):
+    """
+    Serves a WSGI app with a thread per request on a free local port.
+
+    Returns:
+        tuple: The base URL and a function that stops the server.
+    """
+    from werkzeug.serving import make_server
+
+    # Per-request access logs would dominate the output and the timings
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server.shutdown
+
+
+def percentile(values, pct: float):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def report(name: str, latencies, elapsed: float = None):
+    """
+    Prints the count, throughput and latency percentiles of a set of timings in seconds.
+    """
+    line = f"{name:<28} n={len(latencies):<6}"
+    if elapsed:
+        line += f" {len(latencies) / elapsed:9.1f}/s"
+    if latencies:
+        line += (f"  p50={percentile(latencies, 50) * 1000:8.2f}ms"
+                 f"  p99={percentile(latencies, 99) * 1000:8.2f}ms"
+                 f"  mean={statistics.mean(latencies) * 1000:8.2f}ms")
+    print(line)
@@ -0,0 +1,77 @@
+"""
+Benchmark of /supplier_inventory/<id>/import with a large CSV or XLSX file.
+
+Every database call waits --latency seconds, as a PostgREST round trip would.
+Reports the wall time, rows per second, the number of upserts and the peak
+Python memory of the import. The peak includes the fake client's copy of every
+written row, about 0.5 KB per row.
+
+    python benchmarks/inventory_import.py --rows 50000 --format xlsx
+"""
+import argparse
+import csv
+import io
+import time
+import tracemalloc
+
+from common import setup
+
+
+def _file(rows: int, fmt: str, duplicates: int) -> bytes:
+    header = ['pesticide', 'price', 'stock', 'name']
+    # Every duplicates-th row repeats the previous pesticide, so it supersedes a row in the same chunk
+    values = [[f"Pesticide {i - (1 if duplicates and i % duplicates == 0 else 0)}", 100 + i % 50, i % 200, '']
+              for i in range(rows)]
+    if fmt == 'xlsx':
+        import openpyxl
+
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append(header)
+        for row in values:
+            sheet.append(row)
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+        return buffer.getvalue()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    writer.writerows(values)
+    return buffer.getvalue().encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--format', choices=('csv', 'xlsx'), default='csv')
+    parser.add_argument('--duplicates', type=int, default=100, help="make every Nth row a duplicate, 0 for none")
+    parser.add_argument('--latency', type=float, default=0.005, help="seconds per database call")
+    args = parser.parse_args()
+
+    client = setup()
+    from main import app
+
+    client.tables['users'] = [{'id': 'supplier-1', 'role': 'supplier'}]
+    client.latency = args.latency
+    data = _file(args.rows, args.format, args.duplicates)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    response = app.test_client().post(
+        '/supplier_inventory/supplier-1/import',
+        data={'file': (io.BytesIO(data), f"inventory.{args.format}")}, content_type='multipart/form-data'
+    )
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = response.get_json()
+    print(f"{args.rows} {args.format} rows ({len(data) / 2 ** 20:.1f} MB), {args.latency * 1000:.0f}ms per database call")
+    print(f"status={response.status_code} written={result['rows_written']} skipped={result['rows_skipped']} "
+          f"errors={result['error_count']}")
+    print(f"{elapsed:.2f}s  {args.rows / elapsed:,.0f} rows/s  upserts={client.queries('pesticide_listings')}  "
+          f"peak={peak / 2 ** 20:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
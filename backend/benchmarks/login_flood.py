@@ -0,0 +1,83 @@
+"""
+Floods /login with concurrent requests and measures how the bcrypt pool's
+admission control keeps the rest of the server responsive.
+
+Logins beyond HASH_WORKERS + HASH_QUEUE_DEPTH are answered with 503 at once
+instead of queueing, so the latency of a cheap route probed during the flood
+should stay close to its idle latency.
+
+    python benchmarks/login_flood.py --requests 400 --concurrency 64
+"""
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import setup, serve, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--rounds', type=int, default=12, help="BCRYPT_ROUNDS")
+    parser.add_argument('--workers', type=int, default=2, help="HASH_WORKERS")
+    parser.add_argument('--queue-depth', type=int, default=16, help="HASH_QUEUE_DEPTH")
+    args = parser.parse_args()
+
+    client = setup(BCRYPT_ROUNDS=args.rounds, HASH_WORKERS=args.workers, HASH_QUEUE_DEPTH=args.queue_depth)
+    import httpx
+    from hashing import _hash
+    from main import app
+
+    client.tables['users'] = [{
+        'id': 1, 'email': 'farmer@example.com', 'name': 'Farmer', 'phone': '9999999999',
+        'password': _hash('correct horse'), 'role': 'farmer', 'district': 'Pune'
+    }]
+    base_url, stop = serve(app)
+    http = httpx.Client(base_url=base_url, timeout=60, limits=httpx.Limits(max_connections=args.concurrency + 1))
+
+    probe = []
+    start = time.perf_counter()
+    http.get('/')
+    idle = time.perf_counter() - start
+
+    flooding = threading.Event()
+
+    def probe_loop():
+        while not flooding.is_set():
+            started = time.perf_counter()
+            http.get('/')
+            probe.append(time.perf_counter() - started)
+            time.sleep(0.02)
+
+    statuses = {}
+    latencies = {}
+
+    def login(_):
+        started = time.perf_counter()
+        response = http.post('/login', json={'email': 'farmer@example.com', 'password': 'correct horse'})
+        latencies.setdefault(response.status_code, []).append(time.perf_counter() - started)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    prober = threading.Thread(target=probe_loop)
+    prober.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(login, range(args.requests)))
+    elapsed = time.perf_counter() - start
+    flooding.set()
+    prober.join()
+    stop()
+
+    print(f"{args.requests} logins from {args.concurrency} clients, bcrypt cost {args.rounds}, "
+          f"{args.workers} workers, queue depth {args.queue_depth}: {elapsed:.2f}s")
+    print(f"statuses: {dict(sorted(statuses.items()))}")
+    for status, values in sorted(latencies.items()):
+        report(f"login -> {status}", values, elapsed)
+    print(f"idle / latency: {idle * 1000:.2f}ms")
+    report("/ during flood", probe)
+
+
+if __name__ == '__main__':
+    main()
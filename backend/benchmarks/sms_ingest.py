@@ -0,0 +1,47 @@
+"""
+Throughput benchmark of /sms/ingest with an NDJSON body.
+
+Every database call waits --latency seconds, as a PostgREST round trip would.
+With --bad-every N, every Nth record is rejected by the database, so each
+chunk holding one is bisected down to the bad record; the number of inserts
+shows what that costs.
+
+    python benchmarks/sms_ingest.py --records 100000 --bad-every 5000
+"""
+import argparse
+import json
+import time
+
+from common import setup
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=100000)
+    parser.add_argument('--bad-every', type=int, default=0, help="reject every Nth record, 0 for none")
+    parser.add_argument('--latency', type=float, default=0.005, help="seconds per database call")
+    args = parser.parse_args()
+
+    client = setup()
+    from main import app
+
+    body = ''.join(
+        json.dumps({'user_phone': f"+91{i:010d}", 'query_type': 'price', 'message': f"message {i}"}) + '\n'
+        for i in range(args.records)
+    ).encode()
+    if args.bad_every:
+        client.rejects['sms_logs'] = lambda row: int(row['message'].split()[1]) % args.bad_every == args.bad_every - 1
+    client.latency = args.latency
+
+    start = time.perf_counter()
+    response = app.test_client().post('/sms/ingest', data=body, content_type='application/x-ndjson')
+    elapsed = time.perf_counter() - start
+
+    result = response.get_json()
+    print(f"{args.records} records ({len(body) / 2 ** 20:.1f} MB), {args.latency * 1000:.0f}ms per database call")
+    print(f"status={response.status_code} written={result['records_written']} errors={result['error_count']}")
+    print(f"{elapsed:.2f}s  {args.records / elapsed:,.0f} records/s  inserts={client.queries('sms_logs')}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Benchmark of the supplier location index with many suppliers.
+
+Builds a GridIndex of --suppliers suppliers spread over India, then times
+radius queries three ways: GridIndex.nearby,
+a numpy scan of every supplier and a pure Python scan of every supplier. Also
+times nearby() restricted to a small allowed set, as /nearby_suppliers does
+for a pesticide stocked by few suppliers.
+
+    python benchmarks/supplier_geo.py --suppliers 100000 --queries 500 --radius 50
+"""
+import argparse
+import random
+import time
+
+from common import setup, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--suppliers', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--radius', type=float, default=50, help="kilometres")
+    parser.add_argument('--allowed', type=int, default=200, help="size of the allowed set")
+    args = parser.parse_args()
+
+    setup()
+    import numpy as np
+    from supplier_geo import GridIndex, haversine_km, haversine_km_array
+
+    rng = random.Random(1)
+    ids = [f"supplier-{i:06d}" for i in range(args.suppliers)]
+    latitudes = np.array([rng.uniform(8, 35) for _ in ids])
+    longitudes = np.array([rng.uniform(68, 97) for _ in ids])
+    points = list(zip(ids, latitudes.tolist(), longitudes.tolist()))
+
+    # Time the index itself; paging the rows out of the fake database would dominate get_index()
+    start = time.perf_counter()
+    index = GridIndex()
+    for supplier_id, lat, lon in points:
+        index.upsert(supplier_id, lat, lon)
+    print(f"Built the index of {len(index)} suppliers in {time.perf_counter() - start:.2f}s")
+
+    allowed = set(rng.sample(ids, min(args.allowed, len(ids))))
+    queries = [(rng.uniform(8, 35), rng.uniform(68, 97)) for _ in range(args.queries)]
+
+    def numpy_scan(lat, lon):
+        distances = haversine_km_array(lat, lon, latitudes, longitudes)
+        within = np.flatnonzero(distances <= args.radius)
+        return [ids[n] for n in within[np.argsort(distances[within], kind='stable')]]
+
+    def python_scan(lat, lon):
+        found = [(haversine_km(lat, lon, p_lat, p_lon), i) for i, p_lat, p_lon in points]
+        return [i for d, i in sorted(found) if d <= args.radius]
+
+    runs = (
+        ("GridIndex.nearby", lambda lat, lon: [i for i, _ in index.nearby(lat, lon, args.radius)]),
+        (f"nearby, {len(allowed)} allowed", lambda lat, lon: [i for i, _ in index.nearby(lat, lon, args.radius, allowed)]),
+        ("numpy scan", numpy_scan),
+        ("python scan", python_scan),
+    )
+    print(f"{args.queries} queries within {args.radius:g}km")
+    found = {}
+    for name, query in runs:
+        # The full Python scan is slow, so it only runs a sample of the queries
+        sample = queries if name != "python scan" else queries[:max(1, args.queries // 20)]
+        latencies, results = [], []
+        start = time.perf_counter()
+        for lat, lon in sample:
+            started = time.perf_counter()
+            results.append(query(lat, lon))
+            latencies.append(time.perf_counter() - started)
+        report(name, latencies, time.perf_counter() - start)
+        found[name] = results
+    assert found["GridIndex.nearby"] == found["numpy scan"]
+    assert found["python scan"] == found["numpy scan"][:len(found["python scan"])]
+    assert all(set(a) == set(b) & allowed for a, b in zip(found[f"nearby, {len(allowed)} allowed"], found["numpy scan"]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Micro-benchmark of the weather API client against a local stub of the
+WeatherAPI server.
+
+Compares the shared client from weather_client.get_weather_api(), whose pool
+keeps connections alive, with a new client per call, which opens a connection
+for every forecast. The stub answers every request after --latency seconds and
+counts the connections it accepts.
+
+    python benchmarks/weather_client.py --calls 2000 --threads 8 --latency 0.002
+"""
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from common import setup, report
+
+FORECAST = json.dumps({
+    'location': {'name': 'Ludhiana', 'region': 'Punjab', 'country': 'India'},
+    'current': {'temp_c': 31.0, 'humidity': 40},
+    'forecast': {'forecastday': [{'date': f"2024-05-0{day}", 'day': {'maxtemp_c': 38.0}} for day in range(1, 4)]},
+}).encode()
+
+
+class _StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency: float):
+        super().__init__(('127.0.0.1', 0), _StubHandler)
+        self.latency = latency
+        self.connections = 0
+        self._lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        with self._lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so clients can reuse the connection. Headers and body are written
+    # separately, so without TCP_NODELAY a reused connection waits on delayed ACKs
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(FORECAST)))
+        self.end_headers()
+        self.wfile.write(FORECAST)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _run(get_api, calls: int, threads: int):
+    from weather_client import REQUEST_TIMEOUT
+
+    latencies = []
+
+    def forecast(i):
+        started = time.perf_counter()
+        get_api().forecast_weather(q='Ludhiana', days=3, aqi='yes', alerts='yes', _request_timeout=REQUEST_TIMEOUT)
+        latencies.append(time.perf_counter() - started)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(forecast, range(calls)))
+    return latencies, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.002, help="seconds the stub waits before answering")
+    args = parser.parse_args()
+
+    setup(WEATHER_POOL_SIZE=args.threads, WEATHER_API_KEY='benchmark')
+    import weatherapi
+    import weather_client
+
+    server = _StubServer(args.latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    weather_client.configuration.host = f"http://127.0.0.1:{server.server_port}/v1"
+
+    print(f"{args.calls} forecasts from {args.threads} threads, stub answers after {args.latency * 1000:.0f}ms")
+    runs = (
+        ("shared pooled client", weather_client.get_weather_api),
+        ("new client per call", lambda: weatherapi.APIsApi(weatherapi.ApiClient(weather_client.configuration))),
+    )
+    for name, get_api in runs:
+        server.connections = 0
+        latencies, elapsed = _run(get_api, args.calls, args.threads)
+        report(name, latencies, elapsed)
+        print(f"{'':<28} connections={server.connections}")
+    weather_client.close_weather_api()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from config import (
+    CACHE_MAXSIZE, USER_INFO_CACHE_TTL, USER_NAME_CACHE_TTL, INVENTORY_CACHE_TTL, SCHEMES_CACHE_TTL,
+    SUPPLIER_DASHBOARD_CACHE_TTL, IMAGE_DEDUP_TTL, IMAGE_DEDUP_MAXSIZE, PEST_TRENDS_CACHE_TTL
+)
+
+
+class TTLCache:
+    """
+    A thread-safe in-process cache with a per-entry time to live and LRU eviction.
+
+    Args:
+        name (str): The name of the cache, used in stats.
+        ttl (float): Seconds an entry stays valid after it is stored.
+        maxsize (int): The maximum number of entries kept before the least recently used is evicted.
+    """
+
+    def __init__(self, name: str, ttl: float, maxsize: int = CACHE_MAXSIZE):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        # Key -> the counter value when the key was last deleted. Keys that are not
+        # tracked, including evicted ones, share _floor, which only ever grows.
+        self._generations = OrderedDict()
+        self._counter = 0
+        self._floor = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """
+        Returns a (found, value) tuple for the given key.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def generation(self, key):
+        """
+        Returns a token that changes whenever the key is deleted or the cache is cleared.
+
+        Read it before loading a value and pass it to set(), so a value loaded
+        before an invalidation is not stored after it.
+        """
+        with self._lock:
+            return self._generations.get(key, self._floor)
+
+    def set(self, key, value, generation=None):
+        """
+        Stores a value, unless a generation is given and the key was invalidated since it was read.
+
+        Returns:
+            bool: Whether the value was stored.
+        """
+        with self._lock:
+            if generation is not None and self._generations.get(key, self._floor) != generation:
+                return False
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            return True
+
+    def delete(self, *keys):
+        with self._lock:
+            self._counter += 1
+            for key in keys:
+                self._entries.pop(key, None)
+                self._generations[key] = self._counter
+                self._generations.move_to_end(key)
+            while len(self._generations) > self.maxsize:
+                _, generation = self._generations.popitem(last=False)
+                self._floor = max(self._floor, generation)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+            self._counter += 1
+            self._floor = self._counter
+
+    def stats(self):
+        with self._lock:
+            return {
+                'name': self.name,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+
+def cached(cache: TTLCache, key):
+    """
+    Caches the return value of a function in the given cache.
+
+    Falsy results (None, empty lists) are never stored, so lookups that failed
+    or found nothing are retried on the next call. A result whose key was
+    deleted while it was being loaded is returned but not stored.
+
+    Args:
+        cache (TTLCache): The cache to store results in.
+        key (callable): Builds the cache key from the function's arguments.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            cache_key = key(*args, **kwargs)
+            found, value = cache.get(cache_key)
+            if found:
+                return value
+            generation = cache.generation(cache_key)
+            value = func(*args, **kwargs)
+            if value:
+                cache.set(cache_key, value, generation)
+            return value
+        return wrapper
+    return decorator
+
+
+def cached_async(cache: TTLCache, key):
+    """
+    Async counterpart of cached() for coroutine functions.
+    """
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            cache_key = key(*args, **kwargs)
+            found, value = cache.get(cache_key)
+            if found:
+                return value
+            generation = cache.generation(cache_key)
+            value = await func(*args, **kwargs)
+            if value:
+                cache.set(cache_key, value, generation)
+            return value
+        return wrapper
+    return decorator
+
+
+user_info_cache = TTLCache('user_info', USER_INFO_CACHE_TTL)
+user_name_cache = TTLCache('user_name', USER_NAME_CACHE_TTL)
+inventory_cache = TTLCache('supplier_inventory', INVENTORY_CACHE_TTL)
+schemes_cache = TTLCache('schemes', SCHEMES_CACHE_TTL)
+supplier_dashboard_cache = TTLCache('supplier_dashboard', SUPPLIER_DASHBOARD_CACHE_TTL)
+pest_trends_cache = TTLCache('pest_trends', PEST_TRENDS_CACHE_TTL)
+# SHA-256 of an uploaded image -> the storage paths and URLs it was stored under
+image_hash_cache = TTLCache('image_hash', IMAGE_DEDUP_TTL, maxsize=IMAGE_DEDUP_MAXSIZE)
+
+CACHES = [user_info_cache, user_name_cache, inventory_cache, schemes_cache, supplier_dashboard_cache, pest_trends_cache, image_hash_cache]
+
+
+def cache_stats():
+    """
+    Returns the hit/miss counters of every read cache.
+    """
+    return [c.stats() for c in CACHES]
@@ -3,11 +3,126 @@ import os
 from supabase import create_client
 from dotenv import load_dotenv
 
+from metrics import InstrumentedClient
+
 load_dotenv()
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-db = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Wrapped so every PostgREST call is timed per route for /metrics
+db = InstrumentedClient(create_client(SUPABASE_URL, SUPABASE_KEY))
 
 app = Flask(__name__)
+
+# In-process read cache settings (seconds / entries)
+CACHE_MAXSIZE = int(os.getenv("CACHE_MAXSIZE", "2048"))
+USER_INFO_CACHE_TTL = float(os.getenv("USER_INFO_CACHE_TTL", "60"))
+USER_NAME_CACHE_TTL = float(os.getenv("USER_NAME_CACHE_TTL", "300"))
+INVENTORY_CACHE_TTL = float(os.getenv("INVENTORY_CACHE_TTL", "60"))
+SCHEMES_CACHE_TTL = float(os.getenv("SCHEMES_CACHE_TTL", "900"))
+SUPPLIER_DASHBOARD_CACHE_TTL = float(os.getenv("SUPPLIER_DASHBOARD_CACHE_TTL", "30"))
+
+# Weather cache refresh policy (minutes). Rows younger than the fresh window are
+# served as-is, rows within the max-stale window after that are served while a
+# background refresh runs, and anything older is refreshed before responding.
+WEATHER_FRESH_MINUTES = float(os.getenv("WEATHER_FRESH_MINUTES", "30"))
+WEATHER_MAX_STALE_MINUTES = float(os.getenv("WEATHER_MAX_STALE_MINUTES", "360"))
+
+# Weather API client pool settings
+WEATHER_POOL_SIZE = int(os.getenv("WEATHER_POOL_SIZE", "10"))
+WEATHER_CONNECT_TIMEOUT = float(os.getenv("WEATHER_CONNECT_TIMEOUT", "3"))
+WEATHER_READ_TIMEOUT = float(os.getenv("WEATHER_READ_TIMEOUT", "10"))
+WEATHER_RETRIES = int(os.getenv("WEATHER_RETRIES", "2"))
+WEATHER_RETRY_BACKOFF = float(os.getenv("WEATHER_RETRY_BACKOFF", "0.3"))
+
+# Outbound mail queue settings
+MAIL_TRANSPORT = os.getenv("MAIL_TRANSPORT", "sendgrid")
+MAIL_WORKERS = int(os.getenv("MAIL_WORKERS", "2"))
+MAIL_QUEUE_SIZE = int(os.getenv("MAIL_QUEUE_SIZE", "1000"))
+MAIL_MAX_ATTEMPTS = int(os.getenv("MAIL_MAX_ATTEMPTS", "5"))
+MAIL_RETRY_BACKOFF = float(os.getenv("MAIL_RETRY_BACKOFF", "1"))
+MAIL_SPOOL_DIR = os.getenv("MAIL_SPOOL_DIR", os.path.join(".agri", "mail_spool"))
+
+# Password hashing pool settings
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", "2"))
+HASH_QUEUE_DEPTH = int(os.getenv("HASH_QUEUE_DEPTH", "16"))
+HASH_RETRY_AFTER = int(os.getenv("HASH_RETRY_AFTER", "1"))
+
+# Threads per worker that serve the Flask routes when running under asgi.py
+WSGI_THREADS = int(os.getenv("WSGI_THREADS", "16"))
+
+# Threads used to fan out the dashboard endpoints' queries
+DASHBOARD_WORKERS = int(os.getenv("DASHBOARD_WORKERS", "8"))
+
+# Keyset pagination page sizes
+PAGE_SIZE_DEFAULT = int(os.getenv("PAGE_SIZE_DEFAULT", "20"))
+PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", "100"))
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "1000"))
+
+# IDs sent per in_() filter by bulk lookups, which keeps query URLs short
+IN_FILTER_CHUNK_SIZE = int(os.getenv("IN_FILTER_CHUNK_SIZE", "100"))
+
+# Rows written per bulk upsert/insert call
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "500"))
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "1000"))
+
+# Fuzzy pesticide name index
+PESTICIDE_INDEX_REFRESH_SECONDS = float(os.getenv("PESTICIDE_INDEX_REFRESH_SECONDS", "600"))
+PESTICIDE_MATCH_THRESHOLD = float(os.getenv("PESTICIDE_MATCH_THRESHOLD", "0.45"))
+
+# Nearby supplier search
+SUPPLIER_GEO_REFRESH_SECONDS = float(os.getenv("SUPPLIER_GEO_REFRESH_SECONDS", "900"))
+SUPPLIER_GEO_CELL_DEGREES = float(os.getenv("SUPPLIER_GEO_CELL_DEGREES", "0.25"))
+NEARBY_MAX_RADIUS_KM = float(os.getenv("NEARBY_MAX_RADIUS_KM", "200"))
+
+# Pest outbreak rollups
+PEST_TRENDS_RETENTION_DAYS = int(os.getenv("PEST_TRENDS_RETENTION_DAYS", "365"))
+# Days recounted by each run of pest_trends_job.py, and how long /pest_trends answers are cached
+PEST_TRENDS_REFRESH_DAYS = int(os.getenv("PEST_TRENDS_REFRESH_DAYS", "2"))
+PEST_TRENDS_CACHE_TTL = float(os.getenv("PEST_TRENDS_CACHE_TTL", "60"))
+
+# Pest image uploads. Originals above the byte limit are rejected, and the display
+# image and thumbnail are re-encoded JPEGs scaled to fit the given edge length.
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(15 * 1024 * 1024)))
+UPLOAD_MAX_PIXELS = int(os.getenv("UPLOAD_MAX_PIXELS", "50000000"))
+DISPLAY_IMAGE_MAX_SIZE = int(os.getenv("DISPLAY_IMAGE_MAX_SIZE", "1600"))
+DISPLAY_IMAGE_QUALITY = int(os.getenv("DISPLAY_IMAGE_QUALITY", "82"))
+THUMBNAIL_MAX_SIZE = int(os.getenv("THUMBNAIL_MAX_SIZE", "320"))
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", "75"))
+
+# Uploaded image deduplication: how long and how many content hashes are remembered
+IMAGE_DEDUP_TTL = float(os.getenv("IMAGE_DEDUP_TTL", "604800"))
+IMAGE_DEDUP_MAXSIZE = int(os.getenv("IMAGE_DEDUP_MAXSIZE", "10000"))
+
+# Image storage backend: "supabase" or "fake", which keeps objects in memory
+IMAGE_STORAGE = os.getenv("IMAGE_STORAGE", "supabase")
+
+# Background image uploads. With UPLOAD_MODE=async, /upload-image spools the file to
+# disk and answers at once while a worker pool finishes the storage upload.
+UPLOAD_MODE = os.getenv("UPLOAD_MODE", "sync")
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "4"))
+UPLOAD_QUEUE_SIZE = int(os.getenv("UPLOAD_QUEUE_SIZE", "200"))
+UPLOAD_MAX_ATTEMPTS = int(os.getenv("UPLOAD_MAX_ATTEMPTS", "5"))
+UPLOAD_RETRY_BACKOFF = float(os.getenv("UPLOAD_RETRY_BACKOFF", "1"))
+UPLOAD_RETRY_AFTER = int(os.getenv("UPLOAD_RETRY_AFTER", "5"))
+UPLOAD_STATUS_TTL = float(os.getenv("UPLOAD_STATUS_TTL", "86400"))
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR", os.path.join(".agri", "upload_spool"))
+
+# Multi-image uploads: threads shared by all batch requests and photos accepted per request
+UPLOAD_BATCH_WORKERS = int(os.getenv("UPLOAD_BATCH_WORKERS", "4"))
+UPLOAD_BATCH_MAX_FILES = int(os.getenv("UPLOAD_BATCH_MAX_FILES", "10"))
+
+# Write-behind buffer for log inserts (detections, SMS logs, feedback). Rows are journaled
+# locally and written in bulk once WRITE_BEHIND_MAX_ROWS are pending or WRITE_BEHIND_FLUSH_MS
+# has passed. Set WRITE_BEHIND=false to insert on the request path instead.
+WRITE_BEHIND = os.getenv("WRITE_BEHIND", "true").lower() == "true"
+WRITE_BEHIND_MAX_ROWS = int(os.getenv("WRITE_BEHIND_MAX_ROWS", "200"))
+WRITE_BEHIND_FLUSH_MS = float(os.getenv("WRITE_BEHIND_FLUSH_MS", "250"))
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "10000"))
+WRITE_BEHIND_BLOCK_SECONDS = float(os.getenv("WRITE_BEHIND_BLOCK_SECONDS", "0.5"))
+WRITE_BEHIND_MAX_ATTEMPTS = int(os.getenv("WRITE_BEHIND_MAX_ATTEMPTS", "20"))
+WRITE_BEHIND_RETRY_AFTER = int(os.getenv("WRITE_BEHIND_RETRY_AFTER", "2"))
+WRITE_BEHIND_FSYNC = os.getenv("WRITE_BEHIND_FSYNC", "false").lower() == "true"
+WRITE_BEHIND_JOURNAL_DIR = os.getenv("WRITE_BEHIND_JOURNAL_DIR", os.path.join(".agri", "write_journal"))
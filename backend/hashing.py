@@ -0,0 +1,132 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+from config import BCRYPT_ROUNDS, HASH_WORKERS, HASH_QUEUE_DEPTH, HASH_RETRY_AFTER
+
+
+class HashingBusy(Exception):
+    """
+    Raised when the hashing pool already has HASH_QUEUE_DEPTH requests waiting.
+
+    Args:
+        retry_after (int): Seconds the client should wait before retrying.
+    """
+
+    def __init__(self, retry_after: int = HASH_RETRY_AFTER):
+        super().__init__("Password hashing is busy, try again later")
+        self.retry_after = retry_after
+
+
+_executors = {}
+_slots = threading.BoundedSemaphore(HASH_WORKERS + HASH_QUEUE_DEPTH)
+_rehash_slots = threading.BoundedSemaphore(HASH_QUEUE_DEPTH)
+_lock = threading.Lock()
+
+
+def _get_executor(name: str = 'bcrypt', workers: int = HASH_WORKERS):
+    # Executor threads do not survive a fork, so create them once per process
+    pid = os.getpid()
+    entry = _executors.get(name)
+    if entry is None or entry[0] != pid:
+        with _lock:
+            entry = _executors.get(name)
+            if entry is None or entry[0] != pid:
+                entry = _executors[name] = (pid, ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name))
+    return entry[1]
+
+
+def _submit(func, *args):
+    """
+    Runs func on the hashing pool, or raises HashingBusy if too many calls are waiting.
+
+    Returns:
+        Future: The pending result.
+    """
+    if not _slots.acquire(blocking=False):
+        raise HashingBusy()
+    try:
+        future = _get_executor().submit(func, *args)
+    except Exception:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    return future
+
+
+def _hash(password: str):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
+
+
+def _check(password: str, hashed: str):
+    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+
+def hash_password(password: str):
+    """
+    Hashes a password with the configured bcrypt cost on the hashing pool.
+
+    Raises:
+        HashingBusy: If the pool's queue is full.
+    """
+    return _submit(_hash, password).result()
+
+
+def check_password(password: str, hashed: str):
+    """
+    Checks a password against a bcrypt hash on the hashing pool.
+
+    Raises:
+        HashingBusy: If the pool's queue is full.
+    """
+    return _submit(_check, password, hashed).result()
+
+
+def needs_rehash(hashed: str):
+    """
+    Returns True if a bcrypt hash was made with a cost other than BCRYPT_ROUNDS.
+    """
+    try:
+        return int(hashed.split('$')[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+
+def rehash_in_background(password: str, on_hashed):
+    """
+    Hashes a password with the current cost without waiting for the result.
+
+    on_hashed runs on a separate thread, so its database write never holds a
+    bcrypt worker. The rehash is skipped when HASH_QUEUE_DEPTH rehashes are
+    already pending or the pool is busy; it will be retried on the next login.
+
+    Args:
+        password (str): The plain text password that was just verified.
+        on_hashed (callable): Called with the new hash once it is ready.
+    """
+    if not _rehash_slots.acquire(blocking=False):
+        return
+    try:
+        future = _submit(_hash, password)
+    except HashingBusy:
+        _rehash_slots.release()
+        return
+
+    def store(hashed):
+        try:
+            on_hashed(hashed)
+        except Exception as e:
+            print(f"Error storing rehashed password: {e}")
+        finally:
+            _rehash_slots.release()
+
+    def done(f):
+        try:
+            _get_executor('rehash', 1).submit(store, f.result())
+        except Exception as e:
+            _rehash_slots.release()
+            print(f"Error rehashing password: {e}")
+
+    future.add_done_callback(done)
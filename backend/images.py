@@ -0,0 +1,195 @@
+import hashlib
+import io
+import tempfile
+import threading
+
+from PIL import Image, ImageOps
+
+from config import (
+    UPLOAD_MAX_BYTES, UPLOAD_MAX_PIXELS, DISPLAY_IMAGE_MAX_SIZE, DISPLAY_IMAGE_QUALITY,
+    THUMBNAIL_MAX_SIZE, THUMBNAIL_QUALITY
+)
+
+CHUNK_SIZE = 64 * 1024
+
+# Pillow warns above this and refuses images twice this size; make_variants rejects them outright
+Image.MAX_IMAGE_PIXELS = UPLOAD_MAX_PIXELS
+
+DISPLAY_PREFIX = 'pest-images/display/'
+THUMBNAIL_PREFIX = 'pest-images/thumbs/'
+
+
+class UploadTooLarge(Exception):
+    """
+    Raised when an upload exceeds UPLOAD_MAX_BYTES.
+    """
+
+    def __init__(self, max_bytes: int = UPLOAD_MAX_BYTES):
+        super().__init__(f"Image exceeds the {max_bytes // (1024 * 1024)} MB upload limit")
+        self.max_bytes = max_bytes
+
+
+def read_capped(stream, max_bytes: int = UPLOAD_MAX_BYTES):
+    """
+    Copies an upload stream in chunks into a temporary file, stopping at the size limit.
+
+    Small uploads stay in memory and larger ones roll over to disk, so a request
+    never holds more than one chunk of a large photo in memory at a time. The
+    content is hashed as it is copied, for deduplication.
+
+    Args:
+        stream: A readable binary stream.
+        max_bytes (int): The largest accepted upload in bytes.
+
+    Returns:
+        tuple: The temporary file rewound to the start, the number of bytes read,
+        and the hex SHA-256 digest of the content.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLarge(max_bytes)
+            digest.update(chunk)
+            spool.write(chunk)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool, size, digest.hexdigest()
+
+
+def _encode_jpeg(image: Image.Image, max_size: int, quality: int):
+    copy = image.copy()
+    copy.thumbnail((max_size, max_size), Image.LANCZOS)
+    buffer = io.BytesIO()
+    copy.save(buffer, format='JPEG', quality=quality, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def _check_pixels(image: Image.Image):
+    # The header is read lazily, so this runs before any pixel data is decoded
+    if image.width * image.height > UPLOAD_MAX_PIXELS:
+        raise ValueError(f"Image is larger than {UPLOAD_MAX_PIXELS} pixels")
+
+
+def probe_image(fileobj):
+    """
+    Checks that a file is an image within the pixel limit by reading only its header.
+
+    The file is rewound afterwards.
+
+    Args:
+        fileobj: A binary file positioned at the start of the image.
+
+    Raises:
+        ValueError: If the file is not a readable image or is too large.
+    """
+    try:
+        with Image.open(fileobj) as image:
+            _check_pixels(image)
+    except (Image.DecompressionBombError, OSError, SyntaxError) as e:
+        print(f"Error reading uploaded image header: {e}")
+        raise ValueError("Invalid image file")
+    finally:
+        fileobj.seek(0)
+
+
+def image_paths(stem: str, extension: str):
+    """
+    Returns the storage paths of an upload's original, display image and thumbnail.
+
+    Args:
+        stem (str): The unique name shared by the three objects.
+        extension (str): The original file's extension.
+    """
+    return {
+        'original': f"pest-images/{stem}.{extension}",
+        'display': f"{DISPLAY_PREFIX}{stem}.jpg",
+        'thumbnail': f"{THUMBNAIL_PREFIX}{stem}.jpg"
+    }
+
+
+def make_variants(fileobj):
+    """
+    Decodes an uploaded image and renders its display and thumbnail JPEGs.
+
+    The EXIF orientation is applied first, since the metadata is dropped from the
+    re-encoded copies.
+
+    Args:
+        fileobj: A binary file positioned at the start of the image.
+
+    Returns:
+        dict: The 'display' and 'thumbnail' JPEG bytes.
+
+    Raises:
+        ValueError: If the file is not a readable image.
+    """
+    try:
+        with Image.open(fileobj) as image:
+            _check_pixels(image)
+            image.load()
+            image = ImageOps.exif_transpose(image)
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+    except (Image.DecompressionBombError, OSError, SyntaxError) as e:
+        print(f"Error decoding uploaded image: {e}")
+        raise ValueError("Invalid image file")
+    return {
+        'display': _encode_jpeg(image, DISPLAY_IMAGE_MAX_SIZE, DISPLAY_IMAGE_QUALITY),
+        'thumbnail': _encode_jpeg(image, THUMBNAIL_MAX_SIZE, THUMBNAIL_QUALITY)
+    }
+
+
+def thumbnail_url(url: str):
+    """
+    Maps the public URL of a display image to its thumbnail.
+
+    URLs of images uploaded before thumbnails existed are returned unchanged.
+
+    Args:
+        url (str): The display image URL stored with a pest detection.
+    """
+    if url and f"/{DISPLAY_PREFIX}" in url:
+        return url.replace(f"/{DISPLAY_PREFIX}", f"/{THUMBNAIL_PREFIX}", 1)
+    return url
+
+
+_dedup_lock = threading.Lock()
+_dedup_counters = {
+    'deduplicated': 0,
+    'stale': 0,
+    'bytes_saved': 0
+}
+
+
+def record_dedup(bytes_saved: int):
+    """
+    Counts an upload that was answered with an already stored image.
+    """
+    with _dedup_lock:
+        _dedup_counters['deduplicated'] += 1
+        _dedup_counters['bytes_saved'] += bytes_saved
+
+
+def record_stale_dedup():
+    """
+    Counts a remembered image that had been deleted from storage.
+    """
+    with _dedup_lock:
+        _dedup_counters['stale'] += 1
+
+
+def dedup_stats():
+    """
+    Returns the deduplication counters, including the storage bytes not uploaded again.
+    """
+    with _dedup_lock:
+        return dict(_dedup_counters)
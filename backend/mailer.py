@@ -0,0 +1,206 @@
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+
+from dotenv import load_dotenv
+from sendgrid import SendGridAPIClient
+from sendgrid.helpers.mail import Mail
+
+from metrics import upstream
+from spool import SpoolDir
+from config import (
+    MAIL_TRANSPORT, MAIL_WORKERS, MAIL_QUEUE_SIZE, MAIL_MAX_ATTEMPTS, MAIL_RETRY_BACKOFF, MAIL_SPOOL_DIR
+)
+
+load_dotenv()
+
+SENDGRID_API_KEY = os.getenv("SENDGRID_API_KEY")
+SENDGRID_SENDER_EMAIL = os.getenv("SENDGRID_SENDER_EMAIL")
+
+if MAIL_TRANSPORT != 'fake':
+    if not SENDGRID_API_KEY:
+        raise ValueError("SENDGRID_API_KEY not found in environment variables.")
+    if not SENDGRID_SENDER_EMAIL:
+        raise ValueError("SENDGRID_SENDER_EMAIL not found in environment variables.")
+
+
+class SendGridTransport:
+    """
+    Sends mail through a single shared SendGrid client.
+    """
+
+    def __init__(self, api_key: str = SENDGRID_API_KEY, sender: str = SENDGRID_SENDER_EMAIL):
+        self.client = SendGridAPIClient(api_key)
+        self.sender = sender
+
+    def send(self, mail: dict):
+        message = Mail(
+            from_email=self.sender,
+            to_emails=mail['to'],
+            subject=mail['subject'],
+            html_content=mail.get('html'),
+            plain_text_content=mail.get('text')
+        )
+        with upstream('sendgrid', 'send'):
+            response = self.client.send(message)
+        if response.status_code not in [200, 202]:
+            raise RuntimeError(f"SendGrid returned status code {response.status_code}")
+        return response.status_code
+
+
+class FakeTransport:
+    """
+    Records mail in memory instead of sending it. Used for tests and local development.
+    """
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, mail: dict):
+        self.sent.append(mail)
+        return 202
+
+
+class Mailer:
+    """
+    Sends mail from a bounded in-process queue using a pool of worker threads.
+
+    Every queued message is written to the spool directory first and removed once
+    it is sent or has failed MAIL_MAX_ATTEMPTS times, so mail accepted before a
+    restart is sent by the next process when it starts.
+
+    Args:
+        transport: The object whose send(mail) delivers a message.
+        workers (int): The number of worker threads.
+        queue_size (int): The maximum number of messages waiting to be sent.
+        spool_dir (str): The directory queued messages are persisted to.
+    """
+
+    def __init__(self, transport, workers: int = MAIL_WORKERS, queue_size: int = MAIL_QUEUE_SIZE,
+                 spool_dir: str = MAIL_SPOOL_DIR):
+        self.transport = transport
+        self.workers = workers
+        self.spool_dir = spool_dir
+        self._spool = SpoolDir(spool_dir, 'json')
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def start(self):
+        """
+        Starts the worker threads of this process and queues mail left behind by
+        processes that are no longer running. Safe to call more than once.
+        """
+        # Worker threads do not survive a fork, so start them once per process
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            self._pid = os.getpid()
+            self._spool.ensure()
+            for i in range(self.workers):
+                threading.Thread(target=self._work, name=f"mailer-{i}", daemon=True).start()
+            threading.Thread(target=self._recover_spool, name="mailer-recovery", daemon=True).start()
+
+    def _write_spool(self, mail: dict):
+        self._spool.write_json(mail['id'], mail)
+
+    def _remove_spool(self, mail: dict):
+        self._spool.remove(mail['id'])
+
+    def _recover_spool(self):
+        """
+        Queues spooled messages left behind by processes that are no longer running.
+        """
+        for mail_id, path in self._spool.claim_orphans():
+            try:
+                with open(path) as f:
+                    mail = json.load(f)
+                # Runs on its own thread, so waiting for room in the queue does not hold up startup
+                self._queue.put(mail)
+                print(f"Recovered spooled mail {mail_id}.")
+            except Exception as e:
+                print(f"Error recovering spooled mail {mail_id}: {e}")
+
+    def enqueue(self, to: str, subject: str, html: str = None, text: str = None):
+        """
+        Queues a message for delivery.
+
+        Returns:
+            bool: True if the message was queued, False if the queue is full or spooling failed.
+        """
+        self.start()
+        mail = {
+            'id': uuid.uuid4().hex,
+            'to': to,
+            'subject': subject,
+            'html': html,
+            'text': text
+        }
+        try:
+            self._write_spool(mail)
+            self._queue.put_nowait(mail)
+            return True
+        except queue.Full:
+            print(f"Error: Mail queue full, dropping mail to {to}.")
+            self._remove_spool(mail)
+            return False
+        except Exception as e:
+            print(f"Error queueing mail to {to}: {e}")
+            return False
+
+    def _work(self):
+        while True:
+            mail = self._queue.get()
+            try:
+                self._deliver(mail)
+            finally:
+                self._queue.task_done()
+
+    def _deliver(self, mail: dict):
+        for attempt in range(1, MAIL_MAX_ATTEMPTS + 1):
+            try:
+                status = self.transport.send(mail)
+                print(f"Mail {mail['id']} sent to {mail['to']} with status code: {status}")
+                break
+            except Exception as e:
+                print(f"Error sending mail {mail['id']} (attempt {attempt}/{MAIL_MAX_ATTEMPTS}): {e}")
+                if attempt < MAIL_MAX_ATTEMPTS:
+                    time.sleep(MAIL_RETRY_BACKOFF * 2 ** (attempt - 1))
+        self._remove_spool(mail)
+
+    def join(self):
+        """
+        Blocks until every queued message has been handled.
+        """
+        self._queue.join()
+
+
+def _default_transport():
+    if MAIL_TRANSPORT == 'fake':
+        return FakeTransport()
+    return SendGridTransport()
+
+
+mailer = Mailer(_default_transport())
+
+
+def send_mail(to: str, subject: str, html: str = None, text: str = None):
+    """
+    Queues an email for background delivery.
+
+    Args:
+        to (str): The recipient's email address.
+        subject (str): The subject line.
+        html (str, optional): The HTML body.
+        text (str, optional): The plain text body.
+
+    Returns:
+        bool: True if the email was queued.
+    """
+    return mailer.enqueue(to, subject, html=html, text=text)
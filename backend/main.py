@@ -1,24 +1,83 @@
-from flask import jsonify, request
+from flask import jsonify, request, Response, stream_with_context, url_for, g
 from flask_cors import CORS
+import time
 import uuid
 
-from config import app
+from config import app, UPLOAD_MAX_BYTES, UPLOAD_MODE, UPLOAD_BATCH_MAX_FILES
 from utils import (
     register_user, login_user, update_user_profile, update_supplier_details, update_farmer_details, update_admin_details,
     submit_feedback, log_sms_interaction, log_pest_detection, update_weather_data, get_schemes_by_location,
     get_user_name, get_last_4_pest_images, get_pest_history, get_last_contacted_suppliers,
     get_supplier_inventory, update_inventory, get_user_info, delete_account, get_supplier_details, call_supplier, update_password,
-    forgot_password, verify_otp_and_reset_password, upload_image, get_contacts_for_supplier
+    forgot_password, verify_otp_and_reset_password, upload_image, get_contacts_for_supplier, get_farmer_dashboard,
+    get_supplier_dashboard, get_pest_history_page, get_contacts_for_supplier_page,
+    export_table, EXPORT_TABLES, bulk_update_inventory, import_inventory,
+    get_nearby_suppliers, get_pest_trends, upload_pest_images,
+    ingest_sms_logs, iter_ndjson
     )
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
-import os
-
+from mailer import send_mail, mailer
+from hashing import HashingBusy
+from upload_queue import UploadQueueFull, upload_queue
+from write_buffer import WriteBufferFull
+from pesticide_index import search_pesticides
+from cache import cache_stats
+from images import dedup_stats
+from write_buffer import write_buffer
+import metrics
 
 # CORS(app, resources={r"/*": {"origins": "*"}})
 CORS(app, resources={r"/*": {"origins": "*"}}, allow_headers="*", supports_credentials=True)
+
+# Start the background workers now so work spooled by an earlier process is resumed at startup
+mailer.start()
+upload_queue.start()
+write_buffer.start()
+
+@app.errorhandler(HashingBusy)
+@app.errorhandler(UploadQueueFull)
+@app.errorhandler(WriteBufferFull)
+def busy_handler(e):
+    response = jsonify({'error': str(e)})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 503
+
+@app.errorhandler(413)
+def too_large_handler(e):
+    # Werkzeug answers bodies over max_content_length with an HTML page; clients expect JSON
+    limit = request.max_content_length
+    message = f"Request body exceeds the {limit // (1024 * 1024)} MB limit" if limit else "Request body is too large"
+    return jsonify({'error': message}), 413
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    # Label by the route template so IDs in the path do not create new series
+    metrics.current_route.set(request.url_rule.rule if request.url_rule else 'unmatched')
+
+@app.after_request
+def record_request_latency(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        labels = (metrics.current_route.get(), request.method, str(response.status_code))
+        metrics.request_latency.observe(labels, time.perf_counter() - start)
+    return response
+
+def _cache_samples(field):
+    return [({'cache': stats['name']}, stats[field]) for stats in cache_stats()]
+
+metrics.register_collector('agri_cache_entries', 'Entries held by each read cache.', lambda: _cache_samples('size'))
+metrics.register_collector('agri_cache_hits_total', 'Read cache hits.', lambda: _cache_samples('hits'), kind='counter')
+metrics.register_collector('agri_cache_misses_total', 'Read cache misses.', lambda: _cache_samples('misses'), kind='counter')
+metrics.register_collector('agri_image_dedup_bytes_saved_total', 'Storage bytes not uploaded again thanks to deduplication.',
+                           lambda: [({}, dedup_stats()['bytes_saved'])], kind='counter')
+metrics.register_collector('agri_write_buffer_pending_rows', 'Rows waiting in the write-behind buffer.', lambda: [({}, write_buffer.pending())])
+
 #---------------------------------Route functions--------------------------------------------------------------------------
 
+@app.route('/metrics', methods=['GET'])
+def metrics_route():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route("/")
 def home():
     return "AgroSaarthi Flask Backend is Live"
@@ -131,34 +190,93 @@ def sms_log_route():
     else:
         return jsonify({"error": "Failed to record SMS log"}), 400
         
+@app.route('/sms/ingest', methods=['POST'])
+def sms_ingest_route():
+    # Accepts a JSON array, or NDJSON (one record per line) which is read as it streams in
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        records = iter_ndjson(request.stream)
+    else:
+        records = request.get_json(silent=True)
+        if not isinstance(records, list):
+            return jsonify({"error": "Expected a JSON array or an NDJSON body"}), 400
+
+    result = ingest_sms_logs(records)
+    return jsonify(result), 200 if result["status"] == "success" else 400
+
 @app.route('/upload-image', methods=['POST'])
 def upload_image_endpoint():
-    print("FILES:", request.files)
-    print("FORM:", request.form)
-    
+    # Let werkzeug reject oversized bodies before parsing them, leaving room for the form fields
+    request.max_content_length = UPLOAD_MAX_BYTES + 64 * 1024
+
     if 'image' not in request.files:
-        print("1")
         return jsonify({"error": "No image file provided"}), 400
 
     image_file = request.files['image']
     if image_file.filename == '':
-        print("2")
         return jsonify({"error": "No selected file"}), 400
 
     pest_name = request.form.get('pest_name')  # ← form data
     user_id = request.form.get("user_id") 
-    print('pest_name:', pest_name)
 
     if not pest_name:
-        print("3")
         return jsonify({"error": "Pest name is required"}), 400
 
-    result = upload_image(image_file, pest_name, user_id)
+    # mode=sync or mode=async overrides UPLOAD_MODE for a single request
+    background = request.form.get('mode', UPLOAD_MODE) == 'async'
+    result = upload_image(image_file, pest_name, user_id, background=background)
 
     if result["status"] == "success":
         return jsonify(result), 200
-    else:
-        return jsonify({"error": result["message"]}), 500
+    if result["status"] == "queued":
+        result["status_url"] = url_for('upload_status_route', job_id=result["job_id"])
+        return jsonify(result), 202
+    status = {"too_large": 413, "invalid_image": 400}.get(result.get("code"), 500)
+    return jsonify({"error": result["message"]}), status
+
+
+@app.route('/upload-images', methods=['POST'])
+def upload_images_route():
+    # Repeated images/pest_names/confidences/pesticides fields are matched up by position
+    request.max_content_length = UPLOAD_MAX_BYTES * UPLOAD_BATCH_MAX_FILES + 64 * 1024
+
+    images = request.files.getlist('images')
+    user_id = request.form.get('user_id')
+    if not images:
+        return jsonify({"error": "No image files provided"}), 400
+    if len(images) > UPLOAD_BATCH_MAX_FILES:
+        return jsonify({"error": f"At most {UPLOAD_BATCH_MAX_FILES} images can be uploaded at once"}), 400
+    if not user_id:
+        return jsonify({"error": "User ID is required"}), 400
+
+    pest_names = request.form.getlist('pest_names')
+    confidences = request.form.getlist('confidences')
+    pesticides = request.form.getlist('pesticides')
+    if len(pest_names) != len(images) or len(confidences) != len(images):
+        return jsonify({"error": "Each image needs a pest name and a confidence"}), 400
+
+    items = []
+    for index, image_file in enumerate(images):
+        try:
+            confidence = float(confidences[index])
+        except ValueError:
+            confidence = None
+        items.append({
+            'image': image_file,
+            'pest_name': pest_names[index],
+            'confidence': confidence,
+            'pesticide': pesticides[index] if index < len(pesticides) else None
+        })
+
+    result = upload_pest_images(user_id, items)
+    return jsonify(result), 200
+
+
+@app.route('/upload-image/status/<job_id>', methods=['GET'])
+def upload_status_route(job_id):
+    job = upload_queue.status(job_id)
+    if job is None:
+        return jsonify({"error": "Upload not found"}), 404
+    return jsonify(job), 200
 
 
 @app.route('/pest_detection/log', methods=['POST'])
@@ -219,9 +337,26 @@ def last_pest_images_route():
 
 @app.route('/pest_history/<user_id>', methods=['GET'])
 def pest_history_route(user_id):
+    # Callers that pass limit or cursor get keyset pages; others keep the full list
+    if 'limit' in request.args or 'cursor' in request.args:
+        try:
+            page = get_pest_history_page(user_id, request.args.get('limit'), request.args.get('cursor'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify(page), 200
     history = get_pest_history(user_id)
     return jsonify({'history': history}), 200
 
+@app.route('/pest_trends', methods=['GET'])
+def pest_trends_route():
+    try:
+        trends = get_pest_trends(request.args.get('days', 7), request.args.get('district'), request.args.get('pest'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if trends is None:
+        return jsonify({'error': 'Pest trends are unavailable'}), 503
+    return jsonify(trends), 200
+
 @app.route('/last_contacted_suppliers/<farmer_id>', methods=['GET'])
 def last_contacted_route(farmer_id):
     contacts = get_last_contacted_suppliers(farmer_id)
@@ -251,13 +386,68 @@ def update_inventory_route(supplier_id):
     else:
         return jsonify({"error": "Inventory update failed"}), 400
 
+@app.route('/supplier_inventory/<supplier_id>/bulk', methods=['PUT'])
+def bulk_inventory_route(supplier_id):
+    items = request.get_json(silent=True)
+    if not isinstance(items, list):
+        return jsonify({"error": "Expected a JSON array of items"}), 400
+
+    result = bulk_update_inventory(supplier_id, items)
+    if result["status"] == "success":
+        return jsonify(result), 200
+    else:
+        return jsonify({"error": result["message"]}), 404
+
+@app.route('/supplier_inventory/<supplier_id>/import', methods=['POST'])
+def import_inventory_route(supplier_id):
+    if 'file' not in request.files:
+        return jsonify({"error": "No CSV or XLSX file provided"}), 400
+
+    upload = request.files['file']
+    default_format = 'xlsx' if (upload.filename or '').lower().endswith('.xlsx') else 'csv'
+    result = import_inventory(supplier_id, upload.stream, request.args.get('format', default_format))
+    if result.get("code") == 1:
+        return jsonify({"error": result["message"]}), 404
+    elif result.get("code") == 2:
+        return jsonify({"error": result["message"]}), 400
+    return jsonify(result), 200
+
 @app.route('/supplier_details', methods=['POST'])
 def supplier_details_route():
     data = request.get_json()
     pesticide_name = data.get('pesticide_name')
-    suppliers = get_supplier_details(pesticide_name)
+    suppliers = get_supplier_details(pesticide_name, fuzzy=bool(data.get('fuzzy')))
+    return jsonify({'suppliers': suppliers}), 200
+
+@app.route('/nearby_suppliers', methods=['GET'])
+def nearby_suppliers_route():
+    pesticide_name = request.args.get('pesticide')
+    if not pesticide_name:
+        return jsonify({'error': 'Pesticide is required'}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), 100)
+        suppliers = get_nearby_suppliers(
+            pesticide_name,
+            request.args.get('lat'),
+            request.args.get('lon'),
+            request.args.get('radius_km', 25),
+            limit
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid location or radius: {e}'}), 400
     return jsonify({'suppliers': suppliers}), 200
 
+@app.route('/pesticide_search', methods=['GET'])
+def pesticide_search_route():
+    query = request.args.get('q', '')
+    try:
+        limit = min(max(int(request.args.get('limit', 10)), 1), 50)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    if not query.strip():
+        return jsonify({'error': 'Query is required'}), 400
+    return jsonify({'results': search_pesticides(query, limit)}), 200
+
 @app.route('/call_supplier', methods=['POST'])
 def call_supplier_route():
     data = request.get_json()
@@ -278,6 +468,20 @@ def user_info_route(user_id):
     else:
         return jsonify({'error': 'User not found'}), 404
 
+@app.route('/farmer_dashboard/<farmer_id>', methods=['GET'])
+def farmer_dashboard_route(farmer_id):
+    dashboard = get_farmer_dashboard(farmer_id)
+    return jsonify(dashboard), 200
+
+@app.route('/supplier_dashboard/<supplier_id>', methods=['GET'])
+def supplier_dashboard_route(supplier_id):
+    dashboard = get_supplier_dashboard(supplier_id)
+    response = jsonify(dashboard)
+    # Let clients revalidate with If-None-Match and get a 304 when nothing changed
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.add_etag()
+    return response.make_conditional(request)
+
 @app.route('/delete_account/<user_id>', methods=['DELETE'])
 def delete_account_route(user_id):
     if delete_account(user_id):
@@ -329,27 +533,36 @@ def contact_route():
 
     # Compose email
     email_body = f"Message from {user_name} ({user_email}):\n\n{message}"
-    try:
-        sg = SendGridAPIClient(os.getenv('SENDGRID_API_KEY'))
-        mail = Mail(
-            from_email=os.getenv('SENDGRID_SENDER_EMAIL'),
-            to_emails='abhinavchaitanya6@gmail.com',
-            subject=title,
-            plain_text_content=email_body
-        )
-        response = sg.send(mail)
-        if response.status_code in [200, 202]:
-            return jsonify({'message': 'Message sent successfully'}), 200
-        else:
-            return jsonify({'error': 'Failed to send message'}), 500
-    except Exception as e:
-        return jsonify({'error': f'Error sending email: {str(e)}'}), 500
+    if send_mail(to='abhinavchaitanya6@gmail.com', subject=title, text=email_body):
+        return jsonify({'message': 'Message sent successfully'}), 200
+    else:
+        return jsonify({'error': 'Failed to send message'}), 500
 
 @app.route('/contacts_for_supplier/<supplier_id>', methods=['GET'])
 def contacts_for_supplier_route(supplier_id):
+    if 'limit' in request.args or 'cursor' in request.args:
+        try:
+            page = get_contacts_for_supplier_page(supplier_id, request.args.get('limit'), request.args.get('cursor'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify(page), 200
     contacts = get_contacts_for_supplier(supplier_id)
     return jsonify({'contacts': contacts}), 200
 
+@app.route('/export/<table>', methods=['GET'])
+def export_route(table):
+    fmt = request.args.get('format', 'ndjson')
+    spec = EXPORT_TABLES.get(table, {'filters': []})
+    filters = {column: request.args[column] for column in spec['filters'] if column in request.args}
+    try:
+        chunks = export_table(table, fmt, filters)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={table}.{fmt}'
+    return response
+
 #-------------------------------------------------------------------------------------------------
 
 if __name__=="__main__":
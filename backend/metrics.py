@@ -0,0 +1,241 @@
+import bisect
+import contextvars
+import inspect
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+# Latency buckets in seconds, shared by every histogram
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# The route template of the request being served, used to label database and upstream calls
+current_route = contextvars.ContextVar('current_route', default='background')
+
+
+class Histogram:
+    """
+    A Prometheus histogram with a fixed label set, kept in process memory.
+
+    Args:
+        name (str): The metric name.
+        help (str): The metric description.
+        labels (tuple): The label names, in the order observe() takes their values.
+    """
+
+    def __init__(self, name: str, help: str, labels: tuple):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_values: tuple, seconds: float):
+        index = bisect.bisect_left(BUCKETS, seconds)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # One count per bucket plus +Inf, then the sum
+                series = self._series[label_values] = [0] * (len(BUCKETS) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += seconds
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {key: list(series) for key, series in self._series.items()}
+        for label_values, series in sorted(snapshot.items()):
+            labels = _format_labels(self.labels, label_values)
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ('+Inf',), series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{{{labels},le=\"{bound}\"}} {cumulative}")
+            lines.append(f"{self.name}_sum{{{labels}}} {series[-1]}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+        return lines
+
+
+class Counter:
+    """
+    A Prometheus counter with a fixed label set, kept in process memory.
+    """
+
+    def __init__(self, name: str, help: str, labels: tuple):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_values: tuple, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            snapshot = dict(self._values)
+        for label_values, value in sorted(snapshot.items()):
+            lines.append(f"{self.name}{{{_format_labels(self.labels, label_values)}}} {value}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+request_latency = Histogram('agri_http_request_duration_seconds', 'Time spent serving HTTP requests.', ('route', 'method', 'status'))
+db_latency = Histogram('agri_db_call_duration_seconds', 'Time spent in PostgREST calls.', ('route', 'table', 'operation'))
+db_errors = Counter('agri_db_call_errors_total', 'PostgREST calls that raised.', ('route', 'table', 'operation'))
+upstream_latency = Histogram('agri_upstream_call_duration_seconds', 'Time spent calling external services.', ('route', 'service', 'operation'))
+upstream_errors = Counter('agri_upstream_call_errors_total', 'External service calls that raised.', ('route', 'service', 'operation'))
+
+METRICS = [request_latency, db_latency, db_errors, upstream_latency, upstream_errors]
+
+_collectors = []
+
+
+def register_collector(name: str, help: str, collect, kind: str = 'gauge'):
+    """
+    Adds a metric whose samples are read from elsewhere when /metrics is scraped.
+
+    Args:
+        name (str): The metric name.
+        help (str): The metric description.
+        collect (callable): Returns a list of (labels dict, value) samples.
+        kind (str): The Prometheus metric type, 'gauge' or 'counter'.
+    """
+    _collectors.append((name, help, collect, kind))
+
+
+def render():
+    """
+    Returns every metric of this process in the Prometheus text exposition format.
+    """
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    for name, help, collect, kind in _collectors:
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+        try:
+            samples = collect()
+        except Exception as e:
+            print(f"Error collecting metric {name}: {e}")
+            continue
+        for labels, value in samples:
+            label_text = _format_labels(labels.keys(), labels.values())
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+@contextmanager
+def upstream(service: str, operation: str):
+    """
+    Times a call to an external service and counts it as an error if it raises.
+
+    Args:
+        service (str): The service name, e.g. 'weather', 'sendgrid' or 'storage'.
+        operation (str): The kind of call, e.g. 'forecast' or 'upload'.
+    """
+    labels = (current_route.get(), service, operation)
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        upstream_errors.inc(labels)
+        raise
+    finally:
+        upstream_latency.observe(labels, time.perf_counter() - start)
+
+
+class ContextThreadPoolExecutor(ThreadPoolExecutor):
+    """
+    A ThreadPoolExecutor whose tasks run in the submitting thread's context,
+    so calls they make are attributed to the route that submitted them.
+    """
+
+    def submit(self, fn, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+_OPERATIONS = ('select', 'insert', 'upsert', 'update', 'delete')
+
+
+class _QueryProxy:
+    """
+    Wraps a PostgREST query builder and times its execute() call.
+    """
+
+    __slots__ = ('_builder', '_table', '_operation')
+
+    def __init__(self, builder, table: str, operation: str = None):
+        self._builder = builder
+        self._table = table
+        self._operation = operation
+
+    def __getattr__(self, name):
+        attr = getattr(self._builder, name)
+        if name == 'execute':
+            return self._execute
+        if not callable(attr):
+            # Properties such as not_ return another builder
+            return _QueryProxy(attr, self._table, self._operation) if hasattr(attr, 'execute') else attr
+        operation = self._operation or (name if name in _OPERATIONS else None)
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if hasattr(result, 'execute'):
+                return _QueryProxy(result, self._table, operation)
+            return result
+        return call
+
+    def _execute(self, *args, **kwargs):
+        labels = (current_route.get(), self._table, self._operation or 'other')
+        start = time.perf_counter()
+        try:
+            result = self._builder.execute(*args, **kwargs)
+        except BaseException:
+            db_errors.inc(labels)
+            db_latency.observe(labels, time.perf_counter() - start)
+            raise
+        if inspect.isawaitable(result):
+            return self._await(result, labels, start)
+        db_latency.observe(labels, time.perf_counter() - start)
+        return result
+
+    async def _await(self, awaitable, labels, start):
+        try:
+            return await awaitable
+        except BaseException:
+            db_errors.inc(labels)
+            raise
+        finally:
+            db_latency.observe(labels, time.perf_counter() - start)
+
+
+class InstrumentedClient:
+    """
+    Wraps a sync or async Supabase client so every table query and procedure call is timed per route.
+
+    Everything other than table() and rpc() is passed through to the wrapped client.
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    def table(self, name: str):
+        return _QueryProxy(self._client.table(name), name)
+
+    from_ = table
+
+    def rpc(self, name: str, params: dict = None):
+        # Stored procedures are timed with the procedure name in place of a table
+        return _QueryProxy(self._client.rpc(name, params or {}), name, 'rpc')
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
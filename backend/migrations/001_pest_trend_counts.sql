@@ -0,0 +1,31 @@
+-- Detection counts per district, pest and day, read by /pest_trends.
+--
+-- Logged detections add to their count through increment_pest_trend_counts();
+-- pest_trends_job.py recounts recent days from pest_inference_results to
+-- backfill the table and to correct counts the write path missed or repeated.
+
+create table if not exists public.pest_trend_counts (
+    id bigint generated always as identity primary key,
+    district text not null,
+    pest_name text not null,
+    day date not null,
+    count integer not null default 0,
+    -- Target of the upserts in refresh_pest_trend_counts and the increment below
+    constraint pest_trend_counts_district_pest_day_key unique (district, pest_name, day)
+);
+
+create index if not exists pest_trend_counts_day_idx on public.pest_trend_counts (day);
+
+-- Adds a batch of counts in one statement; concurrent callers cannot lose updates.
+-- counts is a JSON array of {district, pest_name, day, count} objects.
+create or replace function public.increment_pest_trend_counts(counts jsonb)
+returns void
+language sql
+as $$
+    insert into public.pest_trend_counts (district, pest_name, day, count)
+    select c.district, c.pest_name, c.day, sum(c.count)
+    from jsonb_to_recordset(counts) as c(district text, pest_name text, day date, count integer)
+    group by c.district, c.pest_name, c.day
+    on conflict (district, pest_name, day)
+    do update set count = public.pest_trend_counts.count + excluded.count;
+$$;
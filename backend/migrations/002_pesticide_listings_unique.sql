@@ -0,0 +1,25 @@
+-- One listing per supplier and pesticide.
+--
+-- The bulk inventory endpoint and the CSV/XLSX import upsert pesticide_listings
+-- with on_conflict=supplier_id,pesticide, which PostgREST can only resolve
+-- against a unique constraint on exactly those columns.
+
+-- Listings written twice before the constraint existed keep their newest row
+delete from public.pesticide_listings older
+using public.pesticide_listings newer
+where older.supplier_id = newer.supplier_id
+  and older.pesticide = newer.pesticide
+  and older.id < newer.id;
+
+do $$
+begin
+    if not exists (
+        select 1 from pg_constraint
+        where conname = 'pesticide_listings_supplier_id_pesticide_key'
+          and conrelid = 'public.pesticide_listings'::regclass
+    ) then
+        alter table public.pesticide_listings
+            add constraint pesticide_listings_supplier_id_pesticide_key unique (supplier_id, pesticide);
+    end if;
+end
+$$;
@@ -0,0 +1,93 @@
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from config import PEST_TRENDS_RETENTION_DAYS
+
+
+def detection_day(prediction_time=None):
+    """
+    Returns the UTC day (YYYY-MM-DD) of a prediction_time value, or today when it is missing.
+    """
+    if prediction_time:
+        try:
+            parsed = datetime.fromisoformat(str(prediction_time).replace('Z', '+00:00'))
+            if parsed.tzinfo is not None:
+                parsed = parsed.astimezone(timezone.utc)
+            return parsed.date().isoformat()
+        except ValueError:
+            pass
+    return datetime.now(timezone.utc).date().isoformat()
+
+
+class PestTrendRollup:
+    """
+    Detection counts per (district, pest, day), bucketed by day.
+
+    Used to count detections for the pest_trend_counts table and to turn the
+    stored counts of a window back into daily rows and totals. Not thread-safe;
+    each caller builds its own.
+    """
+
+    def __init__(self):
+        self._days = defaultdict(lambda: defaultdict(int))
+
+    def add(self, district, pest_name, day: str, count: int = 1):
+        self._days[day][(district or 'Unknown', pest_name)] += count
+
+    def rows(self):
+        """
+        Returns every count as a pest_trend_counts row.
+        """
+        return [
+            {'district': district, 'pest_name': pest_name, 'day': day, 'count': count}
+            for day, bucket in self._days.items()
+            for (district, pest_name), count in bucket.items()
+        ]
+
+    def query(self, days: int, district: str = None, pest_name: str = None):
+        """
+        Returns daily counts and window totals for the last `days` days, busiest first.
+
+        Args:
+            days (int): The window size in days, ending today (UTC).
+            district (str, optional): Only include this district.
+            pest_name (str, optional): Only include this pest.
+        """
+        today = datetime.now(timezone.utc).date()
+        daily = []
+        totals = defaultdict(int)
+        for offset in range(days):
+            day = (today - timedelta(days=offset)).isoformat()
+            bucket = self._days.get(day)
+            if not bucket:
+                continue
+            for (row_district, row_pest), count in bucket.items():
+                if district and row_district.lower() != district.lower():
+                    continue
+                if pest_name and row_pest.lower() != pest_name.lower():
+                    continue
+                daily.append({'district': row_district, 'pest_name': row_pest, 'day': day, 'count': count})
+                totals[(row_district, row_pest)] += count
+        daily.sort(key=lambda row: (row['day'], -row['count']))
+        return {
+            'days': days,
+            'daily': daily,
+            'totals': sorted(
+                [{'district': d, 'pest_name': p, 'count': c} for (d, p), c in totals.items()],
+                key=lambda row: -row['count']
+            )
+        }
+
+
+def retention_start():
+    """
+    Returns the earliest day kept in pest_trend_counts.
+    """
+    return (datetime.now(timezone.utc).date() - timedelta(days=PEST_TRENDS_RETENTION_DAYS)).isoformat()
+
+
+def window_start(days: int):
+    """
+    Returns the first day of a window of `days` days ending today (UTC).
+    """
+    return (datetime.now(timezone.utc).date() - timedelta(days=days - 1)).isoformat()
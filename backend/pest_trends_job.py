@@ -0,0 +1,33 @@
+"""
+Recounts pest detections per district, pest and day into the pest_trend_counts
+table read by /pest_trends.
+
+Logged detections already add to their counts as they are written. Run this
+once with --full to backfill the whole retention window, then on a schedule,
+e.g. hourly from cron, to correct counts the write path missed or repeated:
+
+    python pest_trends_job.py
+    python pest_trends_job.py --full
+"""
+import argparse
+import sys
+
+from config import PEST_TRENDS_REFRESH_DAYS, PEST_TRENDS_RETENTION_DAYS
+from utils import refresh_pest_trend_counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=int, default=PEST_TRENDS_REFRESH_DAYS, help="days to recount, ending today")
+    parser.add_argument('--full', action='store_true', help="recount the whole retention window")
+    args = parser.parse_args()
+    try:
+        refresh_pest_trend_counts(PEST_TRENDS_RETENTION_DAYS if args.full else args.days)
+    except Exception as e:
+        print(f"Error refreshing pest trend counts: {e}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,187 @@
+import re
+import threading
+from collections import defaultdict
+
+from config import db, PESTICIDE_INDEX_REFRESH_SECONDS, PESTICIDE_MATCH_THRESHOLD
+from refresher import PeriodicRefresh
+
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+
+
+def normalize(name: str):
+    """
+    Lowercases a pesticide name and reduces punctuation and spacing to single spaces.
+    """
+    return _NON_ALNUM.sub(' ', (name or '').lower()).strip()
+
+
+def trigrams(text: str):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class PesticideIndex:
+    """
+    An in-memory index of pesticide names searchable by tokens and trigram similarity.
+    """
+
+    def __init__(self, names=()):
+        self._names = []
+        self._ids = {}
+        self._by_normalized = {}
+        self._grams = []
+        self._tokens = []
+        self._gram_postings = {}
+        self._token_postings = {}
+        self._lock = threading.Lock()
+        self.add_all(names)
+
+    def __len__(self):
+        return len(self._names)
+
+    def add(self, name: str):
+        """
+        Adds a canonical name to the index if it is not already present.
+        """
+        if not name or name in self._ids:
+            return
+        self.add_all([name])
+
+    def add_all(self, names):
+        """
+        Adds the canonical names that are not already present, replacing each affected posting once.
+        """
+        # search() reads the postings without the lock, so a posting is never changed
+        # in place: the new ids are collected first, then each posting is replaced
+        # by a new frozenset
+        gram_ids = defaultdict(list)
+        token_ids = defaultdict(list)
+        with self._lock:
+            for name in names:
+                if not name or name in self._ids:
+                    continue
+                normalized = normalize(name)
+                if not normalized:
+                    continue
+                name_id = len(self._names)
+                self._names.append(name)
+                self._ids[name] = name_id
+                self._by_normalized.setdefault(normalized, name)
+                grams = trigrams(normalized)
+                tokens = set(normalized.split())
+                self._grams.append(grams)
+                self._tokens.append(tokens)
+                for gram in grams:
+                    gram_ids[gram].append(name_id)
+                for token in tokens:
+                    token_ids[token].append(name_id)
+            for gram, ids in gram_ids.items():
+                self._gram_postings[gram] = self._gram_postings.get(gram, frozenset()).union(ids)
+            for token, ids in token_ids.items():
+                self._token_postings[token] = self._token_postings.get(token, frozenset()).union(ids)
+
+    def search(self, query: str, limit: int = 10):
+        """
+        Returns up to limit (name, score) pairs ranked by similarity to the query.
+
+        The score averages trigram Jaccard similarity with the share of the query's
+        trigrams the name contains, plus a bonus for shared whole tokens. Only a
+        name that normalizes to the query scores 1.0.
+        """
+        normalized = normalize(query)
+        if not normalized:
+            return []
+        query_grams = trigrams(normalized)
+        query_tokens = set(normalized.split())
+        shared = defaultdict(int)
+        for gram in query_grams:
+            for name_id in self._gram_postings.get(gram, ()):
+                shared[name_id] += 1
+        token_hits = defaultdict(int)
+        for token in query_tokens:
+            for name_id in self._token_postings.get(token, ()):
+                token_hits[name_id] += 1
+        exact = self._by_normalized.get(normalized)
+        scored = []
+        for name_id, count in shared.items():
+            name = self._names[name_id]
+            if name == exact:
+                score = 1.0
+            else:
+                # Jaccard alone punishes names with extra tokens (e.g. "20% EC"), so blend in
+                # how much of the query the name covers
+                jaccard = count / (len(query_grams) + len(self._grams[name_id]) - count)
+                coverage = count / len(query_grams)
+                similarity = (jaccard + coverage) / 2
+                token_bonus = 0.2 * token_hits.get(name_id, 0) / len(query_tokens)
+                score = min(similarity + token_bonus, 0.99)
+            scored.append((name, round(score, 4)))
+        scored.sort(key=lambda pair: (-pair[1], pair[0]))
+        return scored[:limit]
+
+
+def _load_names(table: str, page_size: int = 1000):
+    names = set()
+    start = 0
+    while True:
+        result = db.table(table).select('pesticide').order('pesticide').range(start, start + page_size - 1).execute()
+        rows = result.data or []
+        names.update(row['pesticide'] for row in rows if row.get('pesticide'))
+        if len(rows) < page_size:
+            return names
+        start += page_size
+
+
+def _build_index():
+    names = _load_names('pesticide_listings') | _load_names('products_list')
+    index = PesticideIndex(sorted(names))
+    print(f"Pesticide index refreshed with {len(names)} names.")
+    return index
+
+
+_index = PeriodicRefresh('pesticide index', _build_index, PESTICIDE_INDEX_REFRESH_SECONDS, PesticideIndex())
+
+
+def refresh_index():
+    """
+    Rebuilds the index from the distinct names in pesticide_listings and products_list.
+    """
+    _index.refresh()
+
+
+def get_index():
+    """
+    Returns the current index. The first call builds it; once it is older than
+    PESTICIDE_INDEX_REFRESH_SECONDS it is rebuilt in the background while the old one keeps serving.
+    """
+    return _index.get()
+
+
+def add_names(names):
+    """
+    Adds newly written pesticide names to the loaded index without waiting for a refresh.
+    """
+    if not _index.loaded:
+        return
+    _index.value.add_all(names)
+
+
+def search_pesticides(query: str, limit: int = 10):
+    """
+    Returns ranked canonical pesticide names matching a possibly misspelled query.
+
+    Args:
+        query (str): The pesticide name as typed.
+        limit (int): The maximum number of matches.
+    """
+    return [{'name': name, 'score': score} for name, score in get_index().search(query, limit)]
+
+
+def resolve_pesticide_name(query: str):
+    """
+    Returns the best matching canonical name, or the query itself when nothing scores above PESTICIDE_MATCH_THRESHOLD.
+    """
+    matches = get_index().search(query, 1)
+    if matches and matches[0][1] >= PESTICIDE_MATCH_THRESHOLD:
+        return matches[0][0]
+    return query
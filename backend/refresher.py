@@ -0,0 +1,69 @@
+import threading
+import time
+
+
+class PeriodicRefresh:
+    """
+    Holds a value loaded from the database and rebuilds it once it is older than max_age seconds.
+
+    The first get() builds the value in the calling thread. Later rebuilds run
+    on a background thread while the old value keeps serving, and a failed
+    build keeps the old value.
+
+    Args:
+        name (str): What the value is, for thread names and log messages.
+        build (callable): Returns a freshly built value.
+        max_age (float): Seconds after which get() starts a rebuild.
+        initial: The value served before the first successful build.
+    """
+
+    def __init__(self, name: str, build, max_age: float, initial=None):
+        self.name = name
+        self.max_age = max_age
+        self.value = initial
+        self.loaded_at = None
+        self._build = build
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self.loaded_at is not None
+
+    def refresh(self):
+        """
+        Builds a new value and swaps it in.
+        """
+        try:
+            value = self._build()
+        except Exception as e:
+            print(f"Error refreshing {self.name}: {e}")
+            return
+        self.value = value
+        self.loaded_at = time.monotonic()
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def refresh():
+            try:
+                self.refresh()
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=refresh, name=f"{self.name.replace(' ', '-')}-refresh", daemon=True).start()
+
+    def get(self):
+        """
+        Returns the current value, building it on first use and starting a background rebuild once it is stale.
+        """
+        if self.loaded_at is None:
+            with self._lock:
+                if self.loaded_at is None:
+                    self.refresh()
+        elif time.monotonic() - self.loaded_at > self.max_age:
+            self._refresh_in_background()
+        return self.value
@@ -0,0 +1,133 @@
+import glob
+import json
+import os
+import threading
+import uuid
+
+_token = None
+_token_pid = None
+_token_lock = threading.Lock()
+
+
+def owner_id():
+    """
+    Returns the spool owner name of this process, "<pid>-<token>".
+
+    The token is random and regenerated after a fork, so a process that was
+    restarted with the PID of a crashed one (as in containers) is never
+    mistaken for its predecessor.
+    """
+    global _token, _token_pid
+    pid = os.getpid()
+    if _token_pid != pid:
+        with _token_lock:
+            if _token_pid != pid:
+                _token, _token_pid = uuid.uuid4().hex[:12], pid
+    return f"{pid}-{_token}"
+
+
+def _process_alive(pid: int):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def owner_alive(owner: str):
+    """
+    Checks whether the process that owns a spool file may still be running.
+
+    Args:
+        owner (str): The owner part of the file name.
+    """
+    if owner == owner_id():
+        return True
+    try:
+        pid = int(owner.split('-', 1)[0])
+    except ValueError:
+        return False
+    # Another owner with our PID is a process that ran before us
+    return pid != os.getpid() and _process_alive(pid)
+
+
+class SpoolDir:
+    """
+    A directory of files named <item_id>.<owner>.<extension>, one per queued item.
+
+    Each process writes files under its own owner name. Files whose owner is no
+    longer running are claimed by renaming them to the claiming process's name,
+    which is atomic, so every orphaned item is picked up by exactly one process.
+
+    Args:
+        path (str): The directory.
+        extension (str): The extension of the item files, e.g. 'json'.
+    """
+
+    def __init__(self, path: str, extension: str):
+        self.path = path
+        self.extension = extension
+
+    def ensure(self):
+        os.makedirs(self.path, exist_ok=True)
+
+    def item_path(self, item_id: str, owner: str = None):
+        return os.path.join(self.path, f"{item_id}.{owner or owner_id()}.{self.extension}")
+
+    def write_json(self, item_id: str, obj):
+        """
+        Atomically replaces this process's file for an item with obj as JSON.
+        """
+        path = self.item_path(item_id)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(obj, f)
+        os.replace(tmp_path, path)
+
+    def remove(self, item_id: str):
+        try:
+            os.remove(self.item_path(item_id))
+        except FileNotFoundError:
+            pass
+
+    def find(self, item_id: str):
+        """
+        Returns the path of an item's file whichever process owns it, or None.
+        """
+        matches = glob.glob(os.path.join(self.path, f"{glob.escape(item_id)}.*.{self.extension}"))
+        return matches[0] if matches else None
+
+    def entries(self):
+        """
+        Yields (item_id, owner, path) for every item file in the directory.
+        """
+        for filename in sorted(os.listdir(self.path)):
+            parts = filename.split('.')
+            if len(parts) != 3 or parts[2] != self.extension:
+                continue
+            yield parts[0], parts[1], os.path.join(self.path, filename)
+
+    def claim_orphans(self, rename=None):
+        """
+        Takes over the files of owners that are no longer running.
+
+        Args:
+            rename (callable, optional): Returns the new item ID for a claimed item,
+                for spools whose IDs are only unique per owner.
+
+        Yields:
+            tuple: The item ID and the path of each claimed file.
+        """
+        for item_id, owner, path in self.entries():
+            if owner_alive(owner):
+                continue
+            new_id = rename(item_id) if rename else item_id
+            claimed = self.item_path(new_id)
+            try:
+                os.rename(path, claimed)
+            except FileNotFoundError:
+                # Another process claimed it first
+                continue
+            yield new_id, claimed
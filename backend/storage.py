@@ -0,0 +1,98 @@
+import threading
+from io import BufferedReader, FileIO
+
+from config import db, IMAGE_STORAGE
+from metrics import upstream
+
+
+class SupabaseStorage:
+    """
+    Stores objects in a Supabase Storage bucket.
+
+    Args:
+        bucket (str): The bucket name.
+    """
+
+    def __init__(self, bucket: str = 'pest-images'):
+        self.bucket = bucket
+
+    def _bucket(self):
+        return db.storage.from_(self.bucket)
+
+    def upload(self, path: str, data, content_type: str, upsert: bool = False):
+        """
+        Uploads bytes or an open binary file to the given path.
+
+        Args:
+            path (str): The object's path inside the bucket.
+            data: The content, as bytes or a file opened in binary mode.
+            content_type (str): The object's content type.
+            upsert (bool): Overwrite an existing object, which makes retries safe.
+        """
+        if not isinstance(data, (bytes, BufferedReader, FileIO)):
+            # storage3 treats anything else as a filename, so read spooled files into memory
+            data = data.read()
+        with upstream('storage', 'upload'):
+            self._bucket().upload(path, data, {"content-type": content_type, "upsert": "true" if upsert else "false"})
+
+    def public_url(self, path: str):
+        """
+        Returns the public URL of an object. This is built locally and makes no request.
+        """
+        return self._bucket().get_public_url(path)
+
+    def exists(self, path: str):
+        """
+        Checks whether an object is still present in the bucket.
+        """
+        folder, name = path.rsplit('/', 1)
+        try:
+            with upstream('storage', 'list'):
+                items = self._bucket().list(folder, {"search": name, "limit": 100})
+        except Exception as e:
+            print(f"Error checking stored object {path}: {e}")
+            return False
+        return any(item.get('name') == name for item in items or [])
+
+
+class FakeStorage:
+    """
+    Keeps objects in memory instead of uploading them. Used for tests and local development.
+
+    Args:
+        bucket (str): The bucket name, used in the public URLs.
+        failures (int): The number of upload calls that raise before uploads succeed.
+    """
+
+    def __init__(self, bucket: str = 'pest-images', failures: int = 0):
+        self.bucket = bucket
+        self.failures = failures
+        self.objects = {}
+        self._lock = threading.Lock()
+
+    def upload(self, path: str, data, content_type: str, upsert: bool = False):
+        with self._lock:
+            if self.failures > 0:
+                self.failures -= 1
+                raise ConnectionError("Simulated storage failure")
+            if path in self.objects and not upsert:
+                raise ValueError(f"Object {path} already exists")
+            if not isinstance(data, bytes):
+                data = data.read()
+            self.objects[path] = (content_type, data)
+
+    def public_url(self, path: str):
+        return f"https://storage.invalid/object/public/{self.bucket}/{path}"
+
+    def exists(self, path: str):
+        with self._lock:
+            return path in self.objects
+
+
+def _default_storage():
+    if IMAGE_STORAGE == 'fake':
+        return FakeStorage()
+    return SupabaseStorage()
+
+
+image_storage = _default_storage()
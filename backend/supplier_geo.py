@@ -0,0 +1,191 @@
+import math
+import threading
+from collections import defaultdict
+
+import numpy as np
+
+from config import db, SUPPLIER_GEO_REFRESH_SECONDS, SUPPLIER_GEO_CELL_DEGREES
+from refresher import PeriodicRefresh
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 111.32
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float):
+    """
+    Returns the great-circle distance between two points in kilometres.
+    """
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def haversine_km_array(latitude: float, longitude: float, latitudes, longitudes):
+    """
+    Returns the great-circle distances in kilometres from one point to arrays of points.
+
+    Args:
+        latitude (float): The origin latitude.
+        longitude (float): The origin longitude.
+        latitudes (numpy.ndarray): The latitudes of the points.
+        longitudes (numpy.ndarray): The longitudes of the points, in the same order.
+    """
+    phi1 = math.radians(latitude)
+    phi2 = np.radians(latitudes)
+    a = np.sin((phi2 - phi1) / 2) ** 2 + math.cos(phi1) * np.cos(phi2) * np.sin(np.radians(longitudes - longitude) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _valid_point(latitude, longitude):
+    # Registration stores 0, 0 until the supplier sets their location
+    if latitude is None or longitude is None:
+        return False
+    latitude, longitude = float(latitude), float(longitude)
+    return -90 <= latitude <= 90 and -180 <= longitude <= 180 and (latitude, longitude) != (0.0, 0.0)
+
+
+class GridIndex:
+    """
+    A uniform latitude/longitude grid of supplier locations for radius queries.
+
+    Args:
+        cell_degrees (float): The side of a grid cell in degrees.
+    """
+
+    def __init__(self, cell_degrees: float = SUPPLIER_GEO_CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self._points = {}
+        self._cells = defaultdict(set)
+        # Cell -> (ids, coordinates array), built on first query and dropped when the cell changes
+        self._cell_arrays = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._points)
+
+    def _cell(self, latitude: float, longitude: float):
+        return int(math.floor(latitude / self.cell_degrees)), int(math.floor(longitude / self.cell_degrees))
+
+    def upsert(self, supplier_id, latitude: float, longitude: float):
+        with self._lock:
+            self._remove(supplier_id)
+            self._points[supplier_id] = (latitude, longitude)
+            cell = self._cell(latitude, longitude)
+            self._cells[cell].add(supplier_id)
+            self._cell_arrays.pop(cell, None)
+
+    def remove(self, supplier_id):
+        with self._lock:
+            self._remove(supplier_id)
+
+    def _remove(self, supplier_id):
+        point = self._points.pop(supplier_id, None)
+        if point is not None:
+            cell = self._cell(*point)
+            self._cells[cell].discard(supplier_id)
+            self._cell_arrays.pop(cell, None)
+            if not self._cells[cell]:
+                del self._cells[cell]
+
+    def nearby(self, latitude: float, longitude: float, radius_km: float, allowed=None):
+        """
+        Returns (supplier_id, distance_km) pairs within radius_km, nearest first.
+
+        Args:
+            latitude (float): The query latitude.
+            longitude (float): The query longitude.
+            radius_km (float): The search radius in kilometres.
+            allowed (set, optional): Only consider these supplier ids.
+        """
+        lat_span = radius_km / KM_PER_DEGREE_LAT
+        # Longitude degrees shrink towards the poles; clamp to avoid dividing by ~0
+        lon_span = radius_km / (KM_PER_DEGREE_LAT * max(math.cos(math.radians(latitude)), 0.01))
+        min_row, min_col = self._cell(latitude - lat_span, longitude - lon_span)
+        max_row, max_col = self._cell(latitude + lat_span, longitude + lon_span)
+        with self._lock:
+            # Scan whichever is smaller: the cells in range or the allowed ids
+            if allowed is not None and len(allowed) < (max_row - min_row + 1) * (max_col - min_col + 1):
+                ids = [i for i in allowed if i in self._points]
+                coordinates = self._coordinates(ids)
+            else:
+                cells = [self._cell_array(cell) for cell in (
+                    (row, col) for row in range(min_row, max_row + 1) for col in range(min_col, max_col + 1)
+                ) if cell in self._cells]
+                ids = [supplier_id for cell_ids, _ in cells for supplier_id in cell_ids]
+                coordinates = np.concatenate([array for _, array in cells]) if cells else self._coordinates([])
+                if allowed is not None:
+                    keep = [n for n, supplier_id in enumerate(ids) if supplier_id in allowed]
+                    ids, coordinates = [ids[n] for n in keep], coordinates[keep]
+        distances = haversine_km_array(latitude, longitude, coordinates[:, 0], coordinates[:, 1])
+        within = np.flatnonzero(distances <= radius_km)
+        within = within[np.argsort(distances[within], kind='stable')]
+        return [(ids[n], float(distances[n])) for n in within]
+
+    def _coordinates(self, ids):
+        return np.array([self._points[supplier_id] for supplier_id in ids], dtype=float).reshape(-1, 2)
+
+    def _cell_array(self, cell):
+        arrays = self._cell_arrays.get(cell)
+        if arrays is None:
+            ids = list(self._cells[cell])
+            arrays = self._cell_arrays[cell] = (ids, self._coordinates(ids))
+        return arrays
+
+
+def _build_index(page_size: int = 1000):
+    index = GridIndex()
+    start = 0
+    while True:
+        result = db.table('supplier_details').select('supplier_id, latitude, longitude').eq('approved', True).order('supplier_id').range(start, start + page_size - 1).execute()
+        rows = result.data or []
+        for row in rows:
+            if _valid_point(row.get('latitude'), row.get('longitude')):
+                index.upsert(row['supplier_id'], float(row['latitude']), float(row['longitude']))
+        if len(rows) < page_size:
+            break
+        start += page_size
+    print(f"Supplier location index refreshed with {len(index)} suppliers.")
+    return index
+
+
+_index = PeriodicRefresh('supplier location index', _build_index, SUPPLIER_GEO_REFRESH_SECONDS, GridIndex())
+
+
+def refresh_index():
+    """
+    Rebuilds the index from the approved suppliers in supplier_details.
+    """
+    _index.refresh()
+
+
+def get_index():
+    """
+    Returns the current index. The first call builds it; once it is older than
+    SUPPLIER_GEO_REFRESH_SECONDS it is rebuilt in the background while the old one keeps serving.
+    """
+    return _index.get()
+
+
+def update_supplier_location(supplier_id, latitude, longitude, approved):
+    """
+    Applies a supplier_details write to the loaded index.
+
+    Args:
+        supplier_id (str): The supplier's ID.
+        latitude (float): The stored latitude.
+        longitude (float): The stored longitude.
+        approved (bool): Whether the supplier is approved; unapproved suppliers are removed.
+    """
+    if not _index.loaded:
+        return
+    if approved and _valid_point(latitude, longitude):
+        _index.value.upsert(supplier_id, float(latitude), float(longitude))
+    else:
+        _index.value.remove(supplier_id)
+
+
+def remove_supplier(supplier_id):
+    if _index.loaded:
+        _index.value.remove(supplier_id)
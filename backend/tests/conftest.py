@@ -0,0 +1,41 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Settings must be in place before config is imported by the modules under test
+_state_dir = tempfile.mkdtemp(prefix='agri-tests-')
+os.environ.setdefault('SUPABASE_URL', 'https://project.supabase.co')
+os.environ.setdefault('SUPABASE_KEY', 'header.payload.signature')
+os.environ.update({
+    'MAIL_TRANSPORT': 'fake',
+    'IMAGE_STORAGE': 'fake',
+    'MAIL_SPOOL_DIR': os.path.join(_state_dir, 'mail_spool'),
+    'UPLOAD_SPOOL_DIR': os.path.join(_state_dir, 'upload_spool'),
+    'WRITE_BEHIND_JOURNAL_DIR': os.path.join(_state_dir, 'write_journal'),
+    'BCRYPT_ROUNDS': '4',
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+from metrics import InstrumentedClient  # noqa: E402
+from fake_supabase import FakeClient  # noqa: E402
+
+fake_client = FakeClient()
+# Modules bind db when they are imported, so it is replaced before any of them is
+config.db = InstrumentedClient(fake_client)
+
+import cache  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def fake_db():
+    """
+    Gives every test empty tables and empty read caches.
+    """
+    fake_client.reset()
+    for c in cache.CACHES:
+        c.clear()
+    yield fake_client
+    fake_client.reset()
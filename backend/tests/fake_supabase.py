@@ -0,0 +1,403 @@
+import asyncio
+import copy
+import functools
+import heapq
+import itertools
+import re
+import threading
+import time
+
+from postgrest.exceptions import APIError
+
+
+class FakeResult:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+def _split_top_level(expr: str):
+    """
+    Splits a PostgREST logic expression on the commas outside parentheses and quotes.
+    """
+    parts, depth, quoted, current = [], 0, False, ''
+    for char in expr:
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == '(':
+            depth += 1
+        elif not quoted and char == ')':
+            depth -= 1
+        elif not quoted and depth == 0 and char == ',':
+            parts.append(current)
+            current = ''
+            continue
+        current += char
+    parts.append(current)
+    return parts
+
+
+def _coerce(row_value, value):
+    if isinstance(row_value, bool) or row_value is None:
+        return value
+    if isinstance(row_value, (int, float)) and isinstance(value, str):
+        try:
+            return type(row_value)(value)
+        except ValueError:
+            return value
+    return value
+
+
+def _compare(op: str, row_value, value):
+    if op == 'eq':
+        return str(row_value) == str(value)
+    if op == 'neq':
+        return str(row_value) != str(value)
+    if op == 'is':
+        return row_value is None if value == 'null' else str(row_value).lower() == value
+    if row_value is None:
+        return False
+    value = _coerce(row_value, value)
+    if op == 'lt':
+        return row_value < value
+    if op == 'lte':
+        return row_value <= value
+    if op == 'gt':
+        return row_value > value
+    if op == 'gte':
+        return row_value >= value
+    raise ValueError(f"Unsupported operator {op}")
+
+
+def _parse_logic(expr: str):
+    """
+    Turns an or_() expression such as 'a.eq.1,and(b.lt."x",id.lt."5")' into a row predicate.
+    """
+    terms = []
+    for part in _split_top_level(expr):
+        if part.startswith('and(') and part.endswith(')'):
+            inner = _parse_logic(part[4:-1])
+            terms.append(lambda row, inner=inner: all(term(row) for term in inner.terms))
+            continue
+        column, op, value = part.split('.', 2)
+        negate = op == 'not'
+        if negate:
+            op, value = value.split('.', 1)
+        value = value[1:-1] if value.startswith('"') and value.endswith('"') else value
+        terms.append(lambda row, c=column, o=op, v=value, n=negate: _compare(o, row.get(c), v) != n)
+
+    def predicate(row):
+        return any(term(row) for term in terms)
+    predicate.terms = terms
+    return predicate
+
+
+class FakeQuery:
+    """
+    A PostgREST query builder over the in-memory tables of a FakeClient.
+    """
+
+    def __init__(self, client, table: str):
+        self._client = client
+        self._table = table
+        self._filters = []
+        self._operation = 'select'
+        self._payload = None
+        self._order = []
+        self._limit = None
+        self._range = None
+        self._on_conflict = None
+        self._count = None
+
+    def select(self, columns='*', count=None, **kwargs):
+        self._count = count
+        return self
+
+    def _filter(self, predicate):
+        self._filters.append(predicate)
+        return self
+
+    def eq(self, column, value):
+        return self._filter(lambda row: _compare('eq', row.get(column), value))
+
+    def neq(self, column, value):
+        return self._filter(lambda row: _compare('neq', row.get(column), value))
+
+    def lt(self, column, value):
+        return self._filter(lambda row: _compare('lt', row.get(column), value))
+
+    def lte(self, column, value):
+        return self._filter(lambda row: _compare('lte', row.get(column), value))
+
+    def gt(self, column, value):
+        return self._filter(lambda row: _compare('gt', row.get(column), value))
+
+    def gte(self, column, value):
+        return self._filter(lambda row: _compare('gte', row.get(column), value))
+
+    def in_(self, column, values):
+        values = {str(v) for v in values}
+        self._client.in_filters.append((self._table, values))
+        return self._filter(lambda row: str(row.get(column)) in values)
+
+    def ilike(self, column, pattern):
+        needle = pattern.strip('%').lower()
+        return self._filter(lambda row: needle in str(row.get(column) or '').lower())
+
+    def filter(self, column, operator, criteria):
+        if operator != 'imatch':
+            raise ValueError(f"Unsupported filter operator {operator}")
+        pattern = re.compile(criteria, re.IGNORECASE)
+        return self._filter(lambda row: row.get(column) is not None and pattern.search(str(row[column])) is not None)
+
+    def or_(self, expr):
+        return self._filter(_parse_logic(expr))
+
+    def order(self, column, desc=False):
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def range(self, start, end):
+        self._range = (start, end)
+        return self
+
+    def insert(self, payload, **kwargs):
+        self._operation, self._payload = 'insert', payload
+        return self
+
+    def upsert(self, payload, on_conflict=None, **kwargs):
+        self._operation, self._payload, self._on_conflict = 'upsert', payload, on_conflict
+        return self
+
+    def update(self, payload):
+        self._operation, self._payload = 'update', payload
+        return self
+
+    def delete(self):
+        self._operation = 'delete'
+        return self
+
+    def _sort_key(self):
+        """
+        Returns the sort key and direction for the query's order() calls.
+        """
+        directions = {desc for _, desc in self._order}
+        if len(directions) == 1:
+            columns = [column for column, _ in self._order]
+            # Nulls sort last in ascending order and first in descending order
+            return (lambda row: [(row.get(c) is None, row.get(c)) for c in columns]), directions.pop()
+        return functools.cmp_to_key(self._compare_rows), False
+
+    def _compare_rows(self, a, b):
+        for column, desc in self._order:
+            x, y = a.get(column), b.get(column)
+            if x == y:
+                continue
+            if x is None or y is None:
+                result = 1 if x is None else -1
+            else:
+                result = -1 if x < y else 1
+            return -result if desc else result
+        return 0
+
+    def _matches(self, row):
+        return all(predicate(row) for predicate in self._filters)
+
+    def execute(self):
+        if self._client.latency:
+            time.sleep(self._client.latency)
+        return self._run()
+
+    def _run(self):
+        client = self._client
+        with client.lock:
+            client.executed.append((self._table, self._operation))
+            failure = client.failures.get(self._table)
+            if failure is not None:
+                raise failure
+            rows = client.tables.setdefault(self._table, [])
+            reject = client.rejects.get(self._table)
+            if reject is not None and self._operation in ('insert', 'upsert'):
+                payload = self._payload if isinstance(self._payload, list) else [self._payload]
+                if any(reject(row) for row in payload):
+                    raise APIError({'message': 'new row violates check constraint', 'code': '23514'})
+            if self._operation == 'select':
+                found = (row for row in rows if self._matches(row))
+                key, reverse = self._sort_key()
+                if self._limit is not None and not self._range and not self._count:
+                    # Keep only the page in memory, so large tables can be paged through cheaply
+                    found = (heapq.nlargest if reverse else heapq.nsmallest)(self._limit, found, key=key)
+                    return FakeResult(copy.deepcopy(found))
+                found = sorted(found, key=key, reverse=reverse)
+                count = len(found)
+                if self._range:
+                    found = found[self._range[0]:self._range[1] + 1]
+                if self._limit is not None:
+                    found = found[:self._limit]
+                return FakeResult(copy.deepcopy(found), count if self._count else None)
+            payload = self._payload if isinstance(self._payload, list) else [self._payload]
+            if self._operation == 'insert':
+                stored = []
+                for row in payload:
+                    row = dict(row)
+                    row.setdefault('id', next(client.ids))
+                    rows.append(row)
+                    stored.append(row)
+                return FakeResult(copy.deepcopy(stored))
+            if self._operation == 'upsert':
+                keys = (self._on_conflict or 'id').split(',')
+                stored = []
+                # Reuse the conflict-key index of the last upsert while the table is unchanged,
+                # so repeated chunked upserts into a large table stay linear
+                index = client.upsert_indexes.get((self._table, tuple(keys)))
+                if index is not None and index[0] is rows and index[1] == len(rows):
+                    existing = index[2]
+                else:
+                    existing = {tuple(str(r.get(k)) for k in keys): r for r in rows}
+                for row in payload:
+                    key = tuple(str(row.get(k)) for k in keys)
+                    match = existing.get(key)
+                    if match is not None:
+                        match.update(row)
+                        stored.append(match)
+                    else:
+                        row = dict(row)
+                        row.setdefault('id', next(client.ids))
+                        rows.append(row)
+                        existing[key] = row
+                        stored.append(row)
+                client.upsert_indexes[(self._table, tuple(keys))] = (rows, len(rows), existing)
+                return FakeResult(copy.deepcopy(stored))
+            if self._operation == 'update':
+                updated = [row for row in rows if self._matches(row)]
+                client.upsert_indexes = {key: index for key, index in client.upsert_indexes.items() if key[0] != self._table}
+                for row in updated:
+                    row.update(self._payload)
+                return FakeResult(copy.deepcopy(updated))
+            if self._operation == 'delete':
+                deleted = [row for row in rows if self._matches(row)]
+                client.tables[self._table] = [row for row in rows if not self._matches(row)]
+                return FakeResult(deleted)
+        raise ValueError(f"Unsupported operation {self._operation}")
+
+
+class _FakeRpc:
+    """
+    A stored procedure call, run by the FakeClient procedure of the same name.
+    """
+
+    def __init__(self, client, name: str, params: dict):
+        self._client = client
+        self._name = name
+        self._params = params
+
+    def execute(self):
+        client = self._client
+        if client.latency:
+            time.sleep(client.latency)
+        with client.lock:
+            client.executed.append((self._name, 'rpc'))
+            failure = client.failures.get(self._name)
+            if failure is not None:
+                raise failure
+            return FakeResult(client.procedures[self._name](client, **self._params))
+
+
+def _increment_pest_trend_counts(client, counts):
+    # Mirrors migrations/001_pest_trend_counts.sql
+    rows = client.tables.setdefault('pest_trend_counts', [])
+    existing = {(row['district'], row['pest_name'], row['day']): row for row in rows}
+    for count in counts:
+        key = (count['district'], count['pest_name'], count['day'])
+        if key in existing:
+            existing[key]['count'] += count['count']
+        else:
+            existing[key] = dict(count, id=next(client.ids))
+            rows.append(existing[key])
+    return None
+
+
+class FakeClient:
+    """
+    An in-memory stand-in for the Supabase client that records every execute() call.
+
+    Attributes:
+        tables (dict): Table name -> list of row dicts.
+        executed (list): (table, operation) for every query executed, in order.
+        in_filters (list): (table, set of values) for every in_() filter built.
+        failures (dict): Table name -> exception raised by every query on that table.
+        rejects (dict): Table name -> predicate; an insert or upsert with a row it accepts
+            raises APIError, as a constraint violation would.
+        latency (float): Seconds each execute() sleeps, to simulate a network round trip.
+        procedures (dict): Name -> function(client, **params) run by rpc(); failures
+            keyed by the name make the call raise.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        self.tables = {}
+        self.executed = []
+        self.in_filters = []
+        self.failures = {}
+        self.rejects = {}
+        self.latency = 0
+        self.ids = itertools.count(1)
+        self.upsert_indexes = {}
+        self.procedures = {'increment_pest_trend_counts': _increment_pest_trend_counts}
+
+    def table(self, name: str):
+        return FakeQuery(self, name)
+
+    from_ = table
+
+    def rpc(self, name: str, params: dict = None):
+        return _FakeRpc(self, name, params or {})
+
+    def queries(self, table: str = None):
+        """
+        Returns the number of queries executed, optionally only those on one table.
+        """
+        return sum(1 for t, _ in self.executed if table is None or t == table)
+
+
+class _AsyncFakeQuery:
+    """
+    Wraps a FakeQuery so execute() is a coroutine, as with the async Supabase client.
+    """
+
+    def __init__(self, query):
+        self._query = query
+
+    def __getattr__(self, name):
+        attr = getattr(self._query, name)
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            return _AsyncFakeQuery(result) if isinstance(result, FakeQuery) else result
+        return call
+
+    async def execute(self):
+        if self._query._client.latency:
+            await asyncio.sleep(self._query._client.latency)
+        return self._query._run()
+
+
+class AsyncFakeClient:
+    """
+    An async view of a FakeClient's tables, standing in for supabase.acreate_client().
+    """
+
+    def __init__(self, client: FakeClient):
+        self._client = client
+
+    def table(self, name: str):
+        return _AsyncFakeQuery(self._client.table(name))
+
+    from_ = table
@@ -0,0 +1,90 @@
+import asyncio
+
+import httpx
+import pytest
+
+import async_utils
+from asgi import app
+from fake_supabase import AsyncFakeClient
+
+
+@pytest.fixture(autouse=True)
+def async_db(fake_db, monkeypatch):
+    async def create_client(url, key):
+        return AsyncFakeClient(fake_db)
+    monkeypatch.setattr(async_utils, 'acreate_client', create_client)
+
+
+def _request(method: str, path: str, **kwargs):
+    async def send():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return await client.request(method, path, **kwargs)
+    return asyncio.run(send())
+
+
+def _seed_contacts(fake_db):
+    fake_db.tables.update({
+        'suppliers_contacted': [
+            {'farmer_id': 'f1', 'supplier_id': 's1', 'pesticide_name': 'Neem Oil', 'contact_time': '2024-05-02'},
+            {'farmer_id': 'f1', 'supplier_id': 'shop-1', 'pesticide_name': 'Urea', 'contact_time': '2024-05-01'},
+        ],
+        'users': [{'id': 's1', 'name': 'Supplier One', 'phone': '1', 'email': 's1@x.in', 'role': 'supplier'}],
+        'supplier_details': [{'supplier_id': 's1', 'shop_name': 'Agro One', 'address': 'Main Road'}],
+        'shop_list': [{'id': 'shop-1', 'shop_name': 'Local Shop', 'address': None, 'phone': '2', 'district': 'Pune'}],
+    })
+
+
+def test_async_route_matches_flask_route(fake_db):
+    _seed_contacts(fake_db)
+    from main import app as flask_app
+
+    expected = flask_app.test_client().get('/last_contacted_suppliers/f1').get_json()
+    response = _request('GET', '/last_contacted_suppliers/f1')
+
+    assert response.status_code == 200
+    assert response.json() == expected
+
+
+def test_shop_list_is_queried_only_for_unregistered_suppliers(fake_db):
+    _seed_contacts(fake_db)
+
+    _request('GET', '/last_contacted_suppliers/f1')
+
+    lookups = dict(fake_db.in_filters)
+    assert lookups == {'users': {'s1', 'shop-1'}, 'supplier_details': {'s1'}, 'shop_list': {'shop-1'}}
+
+
+def test_other_routes_are_served_by_flask():
+    response = _request('GET', '/')
+
+    assert response.status_code == 200
+    assert 'Flask Backend' in response.text
+
+
+def test_cors_preflight_and_headers(fake_db):
+    preflight = _request('OPTIONS', '/user_info/1', headers={
+        'Origin': 'http://localhost:5173', 'Access-Control-Request-Method': 'GET'
+    })
+    fake_db.tables['users'] = [{'id': 1, 'name': 'A', 'role': 'admin'}]
+    response = _request('GET', '/user_info/1', headers={'Origin': 'http://localhost:5173'})
+
+    assert preflight.status_code == 200
+    assert preflight.headers['access-control-allow-origin'] == 'http://localhost:5173'
+    assert response.headers['access-control-allow-origin'] == 'http://localhost:5173'
+    assert response.json()['name'] == 'A'
+
+
+def test_invalid_json_body_is_rejected():
+    response = _request('POST', '/user_name', content=b'not json', headers={'Content-Type': 'application/json'})
+
+    assert response.status_code == 400
+
+
+def test_schemes_location_matches_any_case(fake_db):
+    fake_db.tables['weather_scheme_cache'] = [{'location': 'PUNE ', 'schemes': ['PM-KISAN']}]
+
+    response = _request('GET', '/schemes/pune')
+
+    assert response.status_code == 200
+    assert response.json() == {'schemes': ['PM-KISAN']}
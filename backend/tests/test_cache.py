@@ -0,0 +1,66 @@
+import asyncio
+import threading
+
+from cache import TTLCache, cached, cached_async
+
+
+def test_a_read_that_overlaps_a_delete_is_not_stored():
+    cache = TTLCache('test', ttl=60)
+    started, release = threading.Event(), threading.Event()
+    rows = {'k': 'old'}
+
+    @cached(cache, key=lambda k: k)
+    def load(k):
+        value = rows[k]
+        started.set()
+        release.wait(5)
+        return value
+
+    reader = threading.Thread(target=load, args=('k',))
+    reader.start()
+    started.wait(5)
+    # A write lands while the read is in flight and invalidates the key
+    rows['k'] = 'new'
+    cache.delete('k')
+    release.set()
+    reader.join()
+
+    assert cache.get('k') == (False, None)
+    assert load('k') == 'new'
+    assert cache.get('k') == (True, 'new')
+
+
+def test_async_read_that_overlaps_a_delete_is_not_stored():
+    cache = TTLCache('test', ttl=60)
+    rows = {'k': 'old'}
+
+    @cached_async(cache, key=lambda k: k)
+    async def load(k):
+        value = rows[k]
+        await asyncio.sleep(0.01)
+        return value
+
+    async def scenario():
+        read = asyncio.ensure_future(load('k'))
+        await asyncio.sleep(0)
+        rows['k'] = 'new'
+        cache.delete('k')
+        assert await read == 'old'
+        return await load('k')
+
+    assert asyncio.run(scenario()) == 'new'
+    assert cache.get('k') == (True, 'new')
+
+
+def test_generations_survive_eviction_and_clear():
+    cache = TTLCache('test', ttl=60, maxsize=2)
+    generation = cache.generation('a')
+    cache.delete('a')
+    # Evicting 'a' from the tracked generations must not bring back its old token
+    cache.delete('b', 'c', 'd')
+    assert not cache.set('a', 1, generation)
+
+    generation = cache.generation('e')
+    cache.clear()
+    assert not cache.set('e', 1, generation)
+    assert cache.set('e', 1, cache.generation('e'))
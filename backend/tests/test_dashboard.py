@@ -0,0 +1,51 @@
+from main import app
+
+
+def _seed(fake_db):
+    fake_db.tables.update({
+        'users': [
+            {'id': 'f1', 'name': 'Asha', 'role': 'farmer', 'district': None},
+            {'id': 's1', 'name': 'Agro Mart', 'role': 'supplier'},
+        ],
+        'pest_inference_results': [
+            {'id': 1, 'user_id': 'f1', 'image_url': 'https://x/a.jpg', 'pest_name': 'Aphid', 'confidence': 0.9,
+             'pesticide': 'Neem Oil', 'prediction_time': '2024-05-01T10:00:00'}
+        ],
+        'pesticide_listings': [{'supplier_id': 's1', 'pesticide': 'Neem Oil', 'price': 10, 'stock': 5}],
+    })
+
+
+def test_farmer_dashboard_names_each_failed_section(fake_db):
+    _seed(fake_db)
+    fake_db.failures['suppliers_contacted'] = RuntimeError('connection reset')
+
+    dashboard = app.test_client().get('/farmer_dashboard/f1').get_json()
+
+    assert dashboard['profile']['name'] == 'Asha'
+    assert len(dashboard['pest_history']) == 1
+    assert dashboard['last_contacted_suppliers'] == []
+    assert dashboard['errors'] == {'last_contacted_suppliers': 'connection reset'}
+
+
+def test_farmer_dashboard_reports_a_failed_profile_lookup(fake_db):
+    _seed(fake_db)
+    fake_db.failures['users'] = RuntimeError('connection reset')
+
+    dashboard = app.test_client().get('/farmer_dashboard/f1').get_json()
+
+    assert dashboard['profile'] is None
+    assert dashboard['errors']['profile'] == 'connection reset'
+
+
+def test_supplier_dashboard_is_not_cached_when_inventory_fails(fake_db):
+    _seed(fake_db)
+    fake_db.failures['pesticide_listings'] = RuntimeError('connection reset')
+    client = app.test_client()
+
+    failed = client.get('/supplier_dashboard/s1').get_json()
+    del fake_db.failures['pesticide_listings']
+    recovered = client.get('/supplier_dashboard/s1').get_json()
+
+    assert failed['errors'] == {'inventory': 'connection reset'}
+    assert recovered['errors'] == {}
+    assert [item['pesticide'] for item in recovered['inventory']] == ['Neem Oil']
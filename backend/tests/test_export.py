@@ -0,0 +1,65 @@
+import json
+import tracemalloc
+from datetime import datetime, timedelta
+
+import pytest
+
+from main import app
+
+ROWS = 12000
+# Holding all ROWS rows at once takes about 3.4 MB; a streamed export holds about one page
+MEMORY_CEILING = 1536 * 1024
+
+
+def _seed(fake_db, rows: int):
+    start = datetime(2024, 1, 1)
+    fake_db.tables['pest_inference_results'] = [
+        {
+            'id': i, 'user_id': 'u1', 'image_url': f"https://storage.invalid/pest-images/{i:08d}.jpg",
+            'pest_name': 'Fall Armyworm', 'confidence': 0.91, 'pesticide': 'Emamectin Benzoate',
+            'prediction_time': (start + timedelta(seconds=i // 3)).isoformat()
+        }
+        for i in range(1, rows + 1)
+    ]
+
+
+@pytest.mark.parametrize('fmt', ['ndjson', 'csv'])
+def test_large_export_streams_under_memory_ceiling(fake_db, fmt):
+    _seed(fake_db, ROWS)
+    client = app.test_client()
+
+    tracemalloc.start()
+    try:
+        response = client.get(f'/export/pest_inference_results?user_id=u1&format={fmt}', buffered=False)
+        lines = size = 0
+        last = b''
+        for chunk in response.response:
+            chunk = last + (chunk if isinstance(chunk, bytes) else chunk.encode())
+            size += len(chunk) - len(last)
+            *complete, last = chunk.split(b'\n')
+            lines += len(complete)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert response.status_code == 200
+    assert lines == ROWS + (1 if fmt == 'csv' else 0)
+    assert size > 1024 * 1024
+    assert peak < MEMORY_CEILING
+
+
+def test_export_is_complete_and_ordered(fake_db):
+    _seed(fake_db, 2500)
+
+    response = app.test_client().get('/export/pest_inference_results?user_id=u1')
+    ids = [json.loads(line)['id'] for line in response.get_data(as_text=True).splitlines()]
+
+    assert ids == list(range(2500, 0, -1))
+
+
+@pytest.mark.parametrize('table', ['pest_inference_results', 'suppliers_contacted'])
+def test_export_requires_a_scope(table):
+    response = app.test_client().get(f'/export/{table}')
+
+    assert response.status_code == 400
+    assert 'requires one of' in response.get_json()['error']
@@ -0,0 +1,100 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import bcrypt
+
+import hashing
+import utils
+
+
+def _wait_for(condition, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def _legacy_hash(password: str):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=hashing.BCRYPT_ROUNDS + 1)).decode('utf-8')
+
+
+def test_on_hashed_runs_off_the_bcrypt_pool():
+    called = threading.Event()
+    threads = []
+
+    def on_hashed(hashed):
+        threads.append(threading.current_thread().name)
+        called.set()
+
+    hashing.rehash_in_background('secret', on_hashed)
+
+    assert called.wait(5)
+    assert threads[0].startswith('rehash')
+
+
+def test_login_upgrades_legacy_hash(fake_db):
+    old_hash = _legacy_hash('secret')
+    fake_db.tables['users'] = [{'id': 1, 'email': 'a@b.in', 'name': 'A', 'phone': '1', 'password': old_hash, 'role': 'farmer', 'district': 'Pune'}]
+
+    assert utils.login_user('a@b.in', 'secret')['status'] == 'success'
+
+    _wait_for(lambda: fake_db.tables['users'][0]['password'] != old_hash)
+    assert not hashing.needs_rehash(fake_db.tables['users'][0]['password'])
+    assert hashing.check_password('secret', fake_db.tables['users'][0]['password'])
+
+
+def test_rehash_does_not_overwrite_a_changed_password(fake_db, monkeypatch):
+    old_hash = _legacy_hash('secret')
+    fake_db.tables['users'] = [{'id': 1, 'email': 'a@b.in', 'name': 'A', 'phone': '1', 'password': old_hash, 'role': 'farmer', 'district': 'Pune'}]
+    release = threading.Event()
+    real_hash = hashing._hash
+
+    def slow_hash(password):
+        release.wait(5)
+        return real_hash(password)
+
+    monkeypatch.setattr(hashing, '_hash', slow_hash)
+    assert utils.login_user('a@b.in', 'secret')['status'] == 'success'
+    # The user changes their password while the rehash is still running
+    fake_db.tables['users'][0]['password'] = 'new-hash'
+    release.set()
+
+    _wait_for(lambda: ('users', 'update') in fake_db.executed)
+    assert fake_db.tables['users'][0]['password'] == 'new-hash'
+
+
+def _farmer(password_hash: str):
+    return {'id': 1, 'email': 'a@b.in', 'name': 'A', 'phone': '1', 'password': password_hash, 'role': 'farmer', 'district': 'Pune'}
+
+
+def test_password_change_drops_the_cached_user(fake_db):
+    fake_db.tables['users'] = [_farmer(hashing.hash_password('secret'))]
+    old_hash = utils.get_user_info(1)['password']
+
+    assert utils.update_password('secret', 'changed', 1)['status'] == 'success'
+
+    cached_hash = utils.get_user_info(1)['password']
+    assert cached_hash != old_hash
+    assert hashing.check_password('changed', cached_hash)
+
+
+def test_password_reset_drops_the_cached_user(fake_db):
+    fake_db.tables['users'] = [_farmer(hashing.hash_password('secret'))]
+    fake_db.tables['otp_storage'] = [{'user_id': 1, 'email': 'a@b.in', 'otp': '123456', 'used': 'false',
+                                      'expiry_time': (datetime.now() + timedelta(minutes=5)).isoformat()}]
+    old_hash = utils.get_user_info(1)['password']
+
+    assert utils.verify_otp_and_reset_password('a@b.in', '123456', 'changed')['status'] == 'success'
+
+    assert utils.get_user_info(1)['password'] != old_hash
+
+
+def test_login_rehash_drops_the_cached_user(fake_db):
+    old_hash = _legacy_hash('secret')
+    fake_db.tables['users'] = [_farmer(old_hash)]
+    assert utils.get_user_info(1)['password'] == old_hash
+
+    assert utils.login_user('a@b.in', 'secret')['status'] == 'success'
+
+    _wait_for(lambda: utils.get_user_info(1)['password'] != old_hash)
@@ -0,0 +1,54 @@
+from main import app
+
+
+def _bulk(items):
+    return app.test_client().put('/supplier_inventory/s1/bulk', json=items)
+
+
+def test_bulk_update_inserts_and_updates_in_one_upsert(fake_db):
+    fake_db.tables['users'] = [{'id': 's1', 'role': 'supplier'}]
+    fake_db.tables['pesticide_listings'] = [{'id': 7, 'supplier_id': 's1', 'pesticide': 'Neem Oil', 'price': 10.0, 'stock': 5, 'name': None}]
+
+    response = _bulk([
+        {'pesticide': 'Neem Oil', 'price': 12, 'stock': 3},
+        {'pesticide': 'Imidacloprid', 'price': '20.5', 'stock': '4', 'name': 'Confidor'},
+    ])
+
+    assert response.status_code == 200
+    assert [r['status'] for r in response.get_json()['results']] == ['success', 'success']
+    listings = {row['pesticide']: row for row in fake_db.tables['pesticide_listings']}
+    assert len(fake_db.tables['pesticide_listings']) == 2
+    assert (listings['Neem Oil']['id'], listings['Neem Oil']['price'], listings['Neem Oil']['stock']) == (7, 12.0, 3)
+    assert (listings['Imidacloprid']['price'], listings['Imidacloprid']['stock']) == (20.5, 4)
+    assert fake_db.executed.count(('pesticide_listings', 'upsert')) == 1
+
+
+def test_bulk_update_reports_each_invalid_item(fake_db):
+    fake_db.tables['users'] = [{'id': 's1', 'role': 'supplier'}]
+
+    response = _bulk([
+        {'pesticide': 'Neem Oil', 'price': 10, 'stock': 5},
+        {'pesticide': ' ', 'price': 10, 'stock': 5},
+        {'pesticide': 'Mancozeb', 'price': 'cheap', 'stock': 5},
+        {'pesticide': 'Chlorpyrifos', 'price': 10, 'stock': -1},
+        'Neem Oil',
+        {'pesticide': 'Neem Oil', 'price': 11, 'stock': 6},
+    ])
+
+    results = response.get_json()['results']
+    assert response.status_code == 200
+    assert [(r['index'], r['status']) for r in results] == [
+        (0, 'skipped'), (1, 'error'), (2, 'error'), (3, 'error'), (4, 'error'), (5, 'success')
+    ]
+    assert results[1]['message'] == 'Pesticide name is required'
+    assert results[2]['message'] == 'Price must be a number and stock an integer'
+    assert results[3]['message'] == 'Price and stock cannot be negative'
+    assert results[4]['message'] == 'Item must be an object'
+    assert [(row['pesticide'], row['price']) for row in fake_db.tables['pesticide_listings']] == [('Neem Oil', 11.0)]
+
+
+def test_bulk_update_of_an_unknown_supplier_is_rejected(fake_db):
+    response = _bulk([{'pesticide': 'Neem Oil', 'price': 10, 'stock': 5}])
+
+    assert response.status_code == 404
+    assert 'pesticide_listings' not in fake_db.tables
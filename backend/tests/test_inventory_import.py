@@ -0,0 +1,65 @@
+import io
+
+import openpyxl
+
+from main import app
+
+
+def _seed(fake_db):
+    fake_db.tables['users'] = [{'id': 's1', 'role': 'supplier'}]
+
+
+def _xlsx(rows) -> bytes:
+    workbook = openpyxl.Workbook()
+    for row in rows:
+        workbook.active.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def _import(data: bytes, filename: str):
+    return app.test_client().post(
+        '/supplier_inventory/s1/import', data={'file': (io.BytesIO(data), filename)},
+        content_type='multipart/form-data'
+    )
+
+
+def test_csv_rows_superseded_in_a_chunk_are_reported_as_skipped(fake_db):
+    _seed(fake_db)
+    data = b"pesticide,price,stock\nNeem Oil,10,5\nImidacloprid,20,1\nNeem Oil,12,7\n"
+
+    result = _import(data, 'inventory.csv').get_json()
+
+    assert (result['rows_read'], result['rows_written'], result['rows_skipped']) == (3, 2, 1)
+    assert result['skipped'] == [{'row': 2, 'message': 'Superseded by a later row'}]
+    listings = {row['pesticide']: row for row in fake_db.tables['pesticide_listings']}
+    assert (listings['Neem Oil']['price'], listings['Neem Oil']['stock']) == (12, 7)
+
+
+def test_xlsx_import_matches_csv(fake_db):
+    _seed(fake_db)
+    data = _xlsx([
+        ['Pesticide', 'Price', 'Stock', 'Name'],
+        ['Neem Oil', 10.5, 5, 'Neem'],
+        [None, None, None, None],
+        ['Imidacloprid', 'abc', 1, None],
+        [1234, 20, 3.0, None],
+    ])
+
+    result = _import(data, 'inventory.XLSX').get_json()
+
+    assert (result['rows_read'], result['rows_written'], result['error_count']) == (3, 2, 1)
+    assert result['errors'][0]['row'] == 4
+    listings = {row['pesticide']: row for row in fake_db.tables['pesticide_listings']}
+    assert (listings['Neem Oil']['price'], listings['Neem Oil']['stock']) == (10.5, 5)
+    assert listings['1234']['stock'] == 3
+
+
+def test_unreadable_xlsx_is_rejected(fake_db):
+    _seed(fake_db)
+
+    response = _import(b"pesticide,price,stock\n", 'inventory.xlsx')
+
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Unreadable XLSX file'
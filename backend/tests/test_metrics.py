@@ -0,0 +1,105 @@
+import re
+
+import pytest
+
+import metrics
+from main import app
+
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)$')
+LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+
+
+def _samples(text: str):
+    """
+    Parses Prometheus text into (name, labels, value) tuples, failing on any malformed line.
+    """
+    samples = []
+    for line in text.splitlines():
+        if line.startswith('#'):
+            assert re.match(r'^# (HELP|TYPE) [a-zA-Z_:][a-zA-Z0-9_:]* .+$', line), line
+            continue
+        match = SAMPLE.match(line)
+        assert match, line
+        name, labels, value = match.groups()
+        samples.append((name, dict(LABEL.findall(labels or '')), float(value)))
+    return samples
+
+
+def _value(name: str, **labels):
+    for sample_name, sample_labels, value in _samples(metrics.render()):
+        if sample_name == name and sample_labels.items() >= labels.items():
+            return value
+    return 0
+
+
+def test_requests_are_labelled_by_route_template(fake_db):
+    client = app.test_client()
+    route = '/pest_history/<user_id>'
+    before = _value('agri_http_request_duration_seconds_count', route=route, method='GET', status='200')
+
+    for user_id in ('u1', 'u2', 'u3'):
+        assert client.get(f'/pest_history/{user_id}').status_code == 200
+
+    assert _value('agri_http_request_duration_seconds_count', route=route, method='GET', status='200') == before + 3
+    assert _value('agri_db_call_duration_seconds_count', route=route, table='pest_inference_results', operation='select') >= 3
+    routes = {labels.get('route') for _, labels, _ in _samples(metrics.render())}
+    assert not any(r and r.startswith('/pest_history/u') for r in routes)
+
+
+def test_unmatched_paths_share_one_series(fake_db):
+    client = app.test_client()
+    before = _value('agri_http_request_duration_seconds_count', route='unmatched', method='GET', status='404')
+
+    client.get('/no/such/path/1')
+    client.get('/no/such/path/2')
+
+    assert _value('agri_http_request_duration_seconds_count', route='unmatched', method='GET', status='404') == before + 2
+
+
+def test_failed_queries_are_counted(fake_db):
+    fake_db.failures['pest_inference_results'] = ConnectionError('database unavailable')
+    labels = {'route': '/pest_history/<user_id>', 'table': 'pest_inference_results', 'operation': 'select'}
+    before = _value('agri_db_call_errors_total', **labels)
+
+    app.test_client().get('/pest_history/u1')
+
+    assert _value('agri_db_call_errors_total', **labels) == before + 1
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram('test_seconds', 'Test.', ('route',))
+
+    for seconds in (0.001, 0.02, 0.02, 3, 60):
+        histogram.observe(('/a',), seconds)
+
+    samples = _samples('\n'.join(histogram.render()))
+    buckets = {labels['le']: value for name, labels, value in samples if name == 'test_seconds_bucket'}
+    assert (buckets['0.005'], buckets['0.025'], buckets['2.5'], buckets['5'], buckets['+Inf']) == (1, 3, 3, 4, 5)
+    assert list(buckets.values()) == sorted(buckets.values())
+    totals = {name: value for name, _, value in samples if not name.endswith('_bucket')}
+    assert totals == {'test_seconds_sum': pytest.approx(63.041), 'test_seconds_count': 5}
+
+
+def test_counter_escapes_label_values():
+    counter = metrics.Counter('test_total', 'Test.', ('route',))
+
+    counter.inc(('/say "hi"\\now',))
+    counter.inc(('/say "hi"\\now',), 2)
+
+    assert counter.render()[-1] == 'test_total{route="/say \\"hi\\"\\\\now"} 3'
+
+
+def test_metrics_endpoint_serves_prometheus_text(fake_db):
+    client = app.test_client()
+    client.get('/pest_history/u1')
+
+    response = client.get('/metrics')
+
+    assert response.status_code == 200
+    assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+    text = response.get_data(as_text=True)
+    assert text.endswith('\n')
+    names = {name for name, _, _ in _samples(text)}
+    assert {'agri_http_request_duration_seconds_bucket', 'agri_db_call_duration_seconds_count', 'agri_cache_entries'} <= names
+    assert '# TYPE agri_http_request_duration_seconds histogram' in text
+    assert '# TYPE agri_cache_hits_total counter' in text
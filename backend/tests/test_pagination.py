@@ -0,0 +1,95 @@
+import base64
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from main import app
+import utils
+
+
+def _seed_history(fake_db, rows: int, times: int):
+    start = datetime(2024, 1, 1)
+    fake_db.tables['pest_inference_results'] = [
+        {
+            'id': i, 'user_id': 'u1', 'image_url': f"https://storage.invalid/pest-images/{i}.jpg",
+            'pest_name': 'Aphids', 'pesticide': 'Imidacloprid',
+            'prediction_time': (start + timedelta(hours=i % times)).isoformat()
+        }
+        for i in range(1, rows + 1)
+    ]
+
+
+def _walk(path: str, key: str):
+    client = app.test_client()
+    seen, cursor = [], None
+    while True:
+        query = f'?limit=4&cursor={cursor}' if cursor else '?limit=4'
+        response = client.get(path + query)
+        assert response.status_code == 200
+        page = response.get_json()
+        assert len(page[key]) <= 4
+        seen.extend(page[key])
+        cursor = page['next_cursor']
+        if not cursor:
+            return seen
+
+
+def _cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip('=')
+
+
+def test_pages_through_tied_times_without_gaps_or_duplicates(fake_db):
+    _seed_history(fake_db, 25, 3)
+
+    history = _walk('/pest_history/u1', 'history')
+
+    expected = sorted(fake_db.tables['pest_inference_results'], key=lambda row: (row['prediction_time'], row['id']), reverse=True)
+    assert [row['img_url'] for row in history] == [row['image_url'] for row in expected]
+
+
+def test_rows_without_a_time_are_paged_first(fake_db):
+    # Four rows without a time, so the first page ends on one
+    fake_db.tables['suppliers_contacted'] = [
+        {'id': i, 'supplier_id': 's1', 'farmer_id': f'f{i}', 'pesticide_name': 'Neem Oil',
+         'contact_time': None if i % 3 == 0 else f'2024-01-0{1 + i % 2}T10:00:00'}
+        for i in range(1, 15)
+    ]
+
+    contacts = _walk('/contacts_for_supplier/s1', 'contacts')
+
+    assert len(contacts) == 14
+    assert len({row['farmer_id'] for row in contacts}) == 14
+    assert all(row['contact_time'] is None for row in contacts[:4])
+
+
+@pytest.mark.parametrize('cursor', [
+    'not-a-cursor',
+    _cursor(['2024-01-01T00:00:00', '1") or (id.gt."0']),
+    _cursor(['2024-01-01T00:00:00",id.gt."0', 5]),
+    _cursor(['yesterday', 5]),
+    _cursor(['2024-01-01T00:00:00', True]),
+    _cursor(['2024-01-01T00:00:00', None]),
+])
+def test_tampered_cursor_is_rejected(fake_db, cursor):
+    response = app.test_client().get(f'/pest_history/u1?cursor={cursor}')
+
+    assert response.status_code == 400
+    assert fake_db.queries('pest_inference_results') == 0
+
+
+def test_uuid_cursor_ids_are_accepted():
+    row_id = '1b4e28ba-2fa1-11d2-883f-0016d3cca427'
+
+    assert utils.decode_cursor(_cursor(['2024-01-01T00:00:00', row_id.upper()])) == ('2024-01-01T00:00:00', row_id)
+
+
+def test_requests_without_paging_get_the_full_list(fake_db):
+    _seed_history(fake_db, 25, 3)
+
+    response = app.test_client().get('/pest_history/u1')
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert set(body) == {'history'}
+    assert len(body['history']) == 25
@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta, timezone
+
+import utils
+
+
+def _detections(fake_db, per_day: dict):
+    now = datetime.now(timezone.utc)
+    rows = []
+    for (user_id, pest_name, days_ago), count in per_day.items():
+        for i in range(count):
+            rows.append({
+                'id': len(rows) + 1, 'user_id': user_id, 'image_url': 'x.jpg', 'pest_name': pest_name,
+                'pesticide': 'Neem Oil', 'prediction_time': (now - timedelta(days=days_ago, seconds=i)).isoformat()
+            })
+    fake_db.tables['pest_inference_results'] = rows
+
+
+def _seed(fake_db):
+    fake_db.tables['users'] = [
+        {'id': 'u1', 'district': 'Pune', 'role': 'farmer'},
+        {'id': 'u2', 'district': 'Nashik', 'role': 'farmer'},
+    ]
+    _detections(fake_db, {('u1', 'Aphid', 0): 3, ('u2', 'Aphid', 0): 1, ('u1', 'Thrips', 1): 2})
+
+
+def test_refresh_stores_one_count_per_district_pest_and_day(fake_db):
+    _seed(fake_db)
+
+    assert utils.refresh_pest_trend_counts(days=2) == 3
+
+    counts = {(row['district'], row['pest_name']): row['count'] for row in fake_db.tables['pest_trend_counts']}
+    assert counts == {('Pune', 'Aphid'): 3, ('Nashik', 'Aphid'): 1, ('Pune', 'Thrips'): 2}
+
+
+def test_refresh_is_idempotent_and_drops_stale_counts(fake_db):
+    _seed(fake_db)
+    utils.refresh_pest_trend_counts(days=2)
+    fake_db.tables['users'][1]['district'] = 'Satara'
+
+    utils.refresh_pest_trend_counts(days=2)
+
+    counts = {(row['district'], row['pest_name']): row['count'] for row in fake_db.tables['pest_trend_counts']}
+    assert counts == {('Pune', 'Aphid'): 3, ('Satara', 'Aphid'): 1, ('Pune', 'Thrips'): 2}
+
+
+def test_trends_are_read_from_the_counts_table(fake_db):
+    _seed(fake_db)
+    utils.refresh_pest_trend_counts(days=2)
+    fake_db.executed.clear()
+
+    trends = utils.get_pest_trends(7)
+
+    assert fake_db.executed == [('pest_trend_counts', 'select')]
+    assert trends['totals'][0] == {'district': 'Pune', 'pest_name': 'Aphid', 'count': 3}
+    assert utils.get_pest_trends(7, district='pune', pest_name='thrips')['totals'] == [
+        {'district': 'Pune', 'pest_name': 'Thrips', 'count': 2}
+    ]
+
+
+def test_logging_a_detection_updates_its_count(fake_db, monkeypatch):
+    monkeypatch.setattr(utils, 'WRITE_BEHIND', False)
+    fake_db.tables['users'] = [{'id': 'u1', 'district': 'Pune', 'role': 'farmer'}]
+
+    assert utils.log_pest_detection('u1', 'https://x/y.jpg', 'Aphid', 0.9, 'Neem Oil')
+    assert utils.log_pest_detection('u1', 'https://x/z.jpg', 'Aphid', 0.8, 'Neem Oil')
+
+    assert [(row['district'], row['pest_name'], row['count']) for row in fake_db.tables['pest_trend_counts']] == [
+        ('Pune', 'Aphid', 2)
+    ]
+    assert utils.get_pest_trends(1)['totals'] == [{'district': 'Pune', 'pest_name': 'Aphid', 'count': 2}]
+
+
+def test_buffered_detections_are_counted_when_flushed(fake_db, monkeypatch):
+    monkeypatch.setattr(utils, 'WRITE_BEHIND', True)
+    fake_db.tables['users'] = [
+        {'id': 'u1', 'district': 'Pune', 'role': 'farmer'},
+        {'id': 'u2', 'district': 'Nashik', 'role': 'farmer'},
+    ]
+
+    for user_id in ('u1', 'u1', 'u2'):
+        assert utils.log_pest_detection(user_id, 'https://x/y.jpg', 'Thrips', 0.9, 'Neem Oil')
+    utils.write_buffer.flush()
+
+    counts = {row['district']: row['count'] for row in fake_db.tables['pest_trend_counts']}
+    assert counts == {'Pune': 2, 'Nashik': 1}
+    # One district lookup and one increment for the whole flush
+    assert fake_db.queries('users') == 1
+    assert fake_db.queries('increment_pest_trend_counts') == 1
+
+
+def test_refresh_corrects_counts_the_write_path_repeated(fake_db):
+    _seed(fake_db)
+    utils.refresh_pest_trend_counts(days=2)
+    # A write-behind flush retried after a crash counts the same detections again
+    utils._record_pest_trends([row for row in fake_db.tables['pest_inference_results'] if row['user_id'] == 'u2'])
+    assert {row['district']: row['count'] for row in fake_db.tables['pest_trend_counts'] if row['pest_name'] == 'Aphid'}['Nashik'] == 2
+
+    utils.refresh_pest_trend_counts(days=2)
+
+    counts = {(row['district'], row['pest_name']): row['count'] for row in fake_db.tables['pest_trend_counts']}
+    assert counts == {('Pune', 'Aphid'): 3, ('Nashik', 'Aphid'): 1, ('Pune', 'Thrips'): 2}
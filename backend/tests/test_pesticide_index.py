@@ -0,0 +1,44 @@
+import sys
+import threading
+
+from pesticide_index import PesticideIndex
+
+
+def test_search_ranks_misspellings():
+    index = PesticideIndex(['Imidacloprid 17.8% SL', 'Emamectin Benzoate 5% SG', 'Neem Oil'])
+
+    assert index.search('imidacloprid 17.8% SL')[0] == ('Imidacloprid 17.8% SL', 1.0)
+    assert index.search('imidaclopride')[0][0] == 'Imidacloprid 17.8% SL'
+    assert index.search('neem')[0][0] == 'Neem Oil'
+
+
+def test_search_while_names_are_added():
+    # Switch threads often, so searches run while add() is updating postings
+    previous = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    index = PesticideIndex([f"Chlorpyrifos {i}% EC" for i in range(200)])
+    errors = []
+    done = threading.Event()
+
+    def search():
+        try:
+            while not done.is_set():
+                index.search('chlorpyrifos 5% ec')
+        except Exception as e:
+            errors.append(e)
+
+    searchers = [threading.Thread(target=search) for _ in range(4)]
+    for thread in searchers:
+        thread.start()
+    try:
+        for i in range(200, 1200):
+            index.add(f"Chlorpyrifos {i}% EC")
+    finally:
+        done.set()
+        for thread in searchers:
+            thread.join()
+        sys.setswitchinterval(previous)
+
+    assert errors == []
+    assert len(index) == 1200
+    assert index.search('Chlorpyrifos 1100% EC')[0] == ('Chlorpyrifos 1100% EC', 1.0)
@@ -0,0 +1,29 @@
+import json
+
+from main import app
+
+
+def _records(count: int):
+    return [{'user_phone': f"+91{i:010d}", 'query_type': 'price', 'message': f"message {i}"} for i in range(count)]
+
+
+def test_a_rejected_record_does_not_fail_its_chunk(fake_db):
+    fake_db.rejects['sms_logs'] = lambda row: row['message'] == 'message 7'
+
+    result = app.test_client().post('/sms/ingest', json=_records(20)).get_json()
+
+    assert (result['records_read'], result['records_written'], result['error_count']) == (20, 19, 1)
+    assert result['errors'][0]['index'] == 7
+    assert len(fake_db.tables['sms_logs']) == 19
+
+
+def test_ndjson_ingest_reports_invalid_lines(fake_db):
+    lines = [json.dumps(record) for record in _records(3)]
+    lines.insert(1, '{not json')
+    body = '\n'.join(lines) + '\n'
+
+    result = app.test_client().post('/sms/ingest', data=body, content_type='application/x-ndjson').get_json()
+
+    assert (result['records_read'], result['records_written'], result['error_count']) == (4, 3, 1)
+    assert result['errors'][0]['index'] == 1
+    assert fake_db.queries('sms_logs') == 1
@@ -0,0 +1,57 @@
+import pytest
+
+import utils
+
+
+def _seed(fake_db, listings: int):
+    users, details, listing_rows, shops, products = [], [], [], [], []
+    for i in range(listings):
+        supplier_id = f"supplier-{i}"
+        users.append({'id': supplier_id, 'name': f"Supplier {i}", 'role': 'supplier'})
+        details.append({'supplier_id': supplier_id, 'shop_name': f"Shop {i}", 'address': f"Street {i}"})
+        listing_rows.append({'supplier_id': supplier_id, 'pesticide': 'Neem Oil', 'price': 100 + i, 'stock': i})
+        shops.append({'id': f"shop-{i}", 'shop_name': f"Local {i}", 'address': None, 'phone': '99', 'district': 'Pune'})
+        products.append({'supplier_id': f"shop-{i}", 'pesticide': 'Neem Oil', 'price': 90, 'stock': 5})
+    fake_db.tables.update({
+        'users': users,
+        'supplier_details': details,
+        'pesticide_listings': listing_rows,
+        'shop_list': shops,
+        'products_list': products
+    })
+
+
+@pytest.mark.parametrize('listings', [1, 10, 80])
+def test_query_count_does_not_grow_with_listings(fake_db, listings):
+    _seed(fake_db, listings)
+
+    suppliers = utils.get_supplier_details('Neem Oil')
+
+    assert len(suppliers) == 2 * listings
+    # Listings, users, supplier_details, products_list and shop_list
+    assert fake_db.queries() == 5
+
+
+def test_suppliers_are_hydrated_from_bulk_lookups(fake_db):
+    _seed(fake_db, 2)
+
+    suppliers = utils.get_supplier_details('Neem Oil')
+
+    assert suppliers[0] == {
+        'supplier_id': 'supplier-0', 'supplier_name': 'Supplier 0', 'shop_name': 'Shop 0',
+        'address': 'Street 0', 'price': 100, 'stock': 0
+    }
+    assert suppliers[2]['shop_name'] == 'Local 0'
+    assert suppliers[2]['address'] == 'Not Available'
+
+
+def test_bulk_lookups_are_chunked(fake_db, monkeypatch):
+    monkeypatch.setattr(utils, 'IN_FILTER_CHUNK_SIZE', 25)
+    _seed(fake_db, 60)
+
+    suppliers = utils.get_supplier_details('Neem Oil')
+
+    assert len(suppliers) == 120
+    assert max(len(values) for _, values in fake_db.in_filters) == 25
+    # Two listing queries plus three chunks for each of the three lookups
+    assert fake_db.queries() == 2 + 3 * 3
@@ -0,0 +1,62 @@
+import random
+
+import numpy as np
+
+import supplier_geo
+from supplier_geo import GridIndex, haversine_km, haversine_km_array
+
+
+def _points(count: int, seed: int = 7):
+    rng = random.Random(seed)
+    return {f"s{i}": (rng.uniform(8, 35), rng.uniform(68, 97)) for i in range(count)}
+
+
+def test_vectorized_haversine_matches_scalar():
+    points = list(_points(500).values())
+    latitudes, longitudes = np.array(points).T
+
+    distances = haversine_km_array(18.52, 73.86, latitudes, longitudes)
+
+    expected = [haversine_km(18.52, 73.86, lat, lon) for lat, lon in points]
+    assert np.allclose(distances, expected, rtol=0, atol=1e-6)
+
+
+def test_nearby_matches_brute_force():
+    points = _points(5000)
+    index = GridIndex(cell_degrees=0.25)
+    for supplier_id, (lat, lon) in points.items():
+        index.upsert(supplier_id, lat, lon)
+    allowed = set(list(points)[::7])
+
+    for radius in (10, 50, 200):
+        expected = sorted(
+            (d, i) for i, (lat, lon) in points.items() if (d := haversine_km(21.0, 79.0, lat, lon)) <= radius
+        )
+        found = index.nearby(21.0, 79.0, radius)
+        assert [i for i, _ in found] == [i for _, i in expected]
+        assert [i for i, _ in index.nearby(21.0, 79.0, radius, allowed=allowed)] == [i for _, i in expected if i in allowed]
+
+
+def test_moved_and_removed_suppliers_are_not_found_at_their_old_location():
+    index = GridIndex()
+    index.upsert('s1', 18.52, 73.86)
+    assert [i for i, _ in index.nearby(18.52, 73.86, 5)] == ['s1']
+
+    index.upsert('s1', 28.61, 77.21)
+    index.upsert('s2', 18.53, 73.86)
+    assert [i for i, _ in index.nearby(18.52, 73.86, 5)] == ['s2']
+    index.remove('s2')
+    assert index.nearby(18.52, 73.86, 5) == []
+
+
+def test_a_failed_refresh_keeps_serving_the_loaded_index(fake_db, monkeypatch):
+    fake_db.tables['supplier_details'] = [{'supplier_id': 's1', 'latitude': 18.52, 'longitude': 73.86, 'approved': True}]
+    holder = supplier_geo.PeriodicRefresh('test index', supplier_geo._build_index, 3600)
+    monkeypatch.setattr(supplier_geo, '_index', holder)
+    loaded = supplier_geo.get_index()
+
+    fake_db.failures['supplier_details'] = RuntimeError('connection reset')
+    supplier_geo.refresh_index()
+
+    assert supplier_geo.get_index() is loaded
+    assert [i for i, _ in loaded.nearby(18.52, 73.86, 5)] == ['s1']
@@ -0,0 +1,68 @@
+import io
+import uuid
+
+from PIL import Image
+
+import main
+
+
+def _jpeg() -> bytes:
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), tuple(uuid.uuid4().bytes[:3])).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+def _post(files, pest_names, confidences, user_id='u1'):
+    body = {
+        'images': [(io.BytesIO(data), name) for name, data in files],
+        'pest_names': pest_names,
+        'confidences': confidences,
+        'pesticides': ['Neem Oil'] * len(files),
+        'user_id': user_id,
+    }
+    return main.app.test_client().post('/upload-images', data=body, content_type='multipart/form-data')
+
+
+def test_each_file_gets_its_own_result(fake_db):
+    files = [('a.jpg', _jpeg()), ('b.jpg', b'not an image'), ('c.jpg', _jpeg()), ('d.jpg', _jpeg()), ('e.jpg', _jpeg())]
+
+    response = _post(files, ['Aphid', 'Aphid', 'Thrips', 'Mites', 'Aphid'], ['0.9', '0.8', 'high', '1.5', '0.7'])
+
+    assert response.status_code == 200
+    results = response.get_json()['results']
+    assert [(r['index'], r['status'], r['logged']) for r in results] == [
+        (0, 'success', True), (1, 'error', False), (2, 'error', False), (3, 'error', False), (4, 'success', True)
+    ]
+    assert results[1]['message'] == 'Invalid image file'
+    assert results[2]['message'] == 'User ID, image URL, pest name, and confidence are required.'
+    assert results[3]['message'] == 'Confidence must be a float between 0.0 and 1.0.'
+    # Both stored images are logged with one insert
+    assert fake_db.executed.count(('pest_inference_results', 'insert')) == 1
+    logged = fake_db.tables['pest_inference_results']
+    assert [row['image_url'] for row in logged] == [results[0]['public_url'], results[4]['public_url']]
+    assert [row['confidence'] for row in logged] == [0.9, 0.7]
+
+
+def test_failed_log_is_reported_per_file(fake_db):
+    fake_db.failures['pest_inference_results'] = ConnectionError('database unavailable')
+
+    results = _post([('a.jpg', _jpeg())], ['Aphid'], ['0.9']).get_json()['results']
+
+    assert (results[0]['status'], results[0]['logged']) == ('success', False)
+    assert results[0]['message'] == 'Image uploaded but the detection was not logged'
+
+
+def test_mismatched_fields_are_rejected(fake_db):
+    response = _post([('a.jpg', _jpeg()), ('b.jpg', _jpeg())], ['Aphid'], ['0.9', '0.8'])
+
+    assert response.status_code == 400
+    assert 'pest_inference_results' not in fake_db.tables
+
+
+def test_too_many_files_are_rejected(fake_db, monkeypatch):
+    monkeypatch.setattr(main, 'UPLOAD_BATCH_MAX_FILES', 2)
+    files = [(f'{i}.jpg', _jpeg()) for i in range(3)]
+
+    response = _post(files, ['Aphid'] * 3, ['0.9'] * 3)
+
+    assert response.status_code == 400
@@ -0,0 +1,13 @@
+import io
+
+import main
+
+
+def test_oversized_upload_gets_a_json_413(monkeypatch):
+    monkeypatch.setattr(main, 'UPLOAD_MAX_BYTES', 1024 * 1024)
+    body = {'image': (io.BytesIO(b'\0' * (2 * 1024 * 1024)), 'pest.jpg'), 'pest_name': 'Aphid', 'user_id': 'u1'}
+
+    response = main.app.test_client().post('/upload-image', data=body, content_type='multipart/form-data')
+
+    assert response.status_code == 413
+    assert response.get_json() == {'error': 'Request body exceeds the 1 MB limit'}
@@ -0,0 +1,165 @@
+import io
+import os
+import threading
+import time
+import uuid
+
+import pytest
+from PIL import Image
+
+import images
+import main
+import upload_queue as upload_queue_module
+from storage import FakeStorage, image_storage
+from upload_queue import UploadQueue
+
+
+def _jpeg(size=(64, 48)) -> bytes:
+    # A random colour gives every test its own bytes, so uploads are not deduplicated across tests
+    colour = tuple(uuid.uuid4().bytes[:3])
+    buffer = io.BytesIO()
+    Image.new('RGB', size, colour).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+def _wait_for(condition, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+class _GatedStorage(FakeStorage):
+    """
+    Holds every upload until the gate is opened.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.gate = threading.Event()
+
+    def upload(self, path, data, content_type, upsert=False):
+        self.gate.wait(5)
+        super().upload(path, data, content_type, upsert)
+
+
+def _submit(queue, data: bytes, digest=None):
+    paths = images.image_paths(uuid.uuid4().hex, 'jpg')
+    urls = {variant: queue.storage.public_url(path) for variant, path in paths.items()}
+    return queue.submit(io.BytesIO(data), paths, urls, 'image/jpeg', digest=digest, size=len(data))
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(upload_queue_module, 'UPLOAD_RETRY_BACKOFF', 0)
+
+
+def test_jobs_move_from_queued_to_done(tmp_path):
+    storage = _GatedStorage()
+    queue = UploadQueue(storage, workers=1, spool_dir=str(tmp_path))
+
+    first = _submit(queue, _jpeg())
+    second = _submit(queue, _jpeg(), digest='ab' * 32)
+    _wait_for(lambda: queue.status(first['id'])['state'] == 'uploading')
+    assert queue.status(second['id'])['state'] == 'queued'
+
+    storage.gate.set()
+    queue.join()
+
+    for job in (first, second):
+        status = queue.status(job['id'])
+        assert (status['state'], status['uploaded'], status['error']) == ('done', ['original', 'display', 'thumbnail'], None)
+        assert all(path in storage.objects for path in job['paths'].values())
+        assert not os.path.exists(tmp_path / f"{job['id']}.bin")
+    found, stored = upload_queue_module.image_hash_cache.get('ab' * 32)
+    assert found and stored['urls'] == second['urls']
+
+
+def test_unreadable_image_fails_without_uploading(tmp_path):
+    storage = FakeStorage()
+    queue = UploadQueue(storage, workers=1, spool_dir=str(tmp_path))
+
+    job = _submit(queue, b'not an image')
+    queue.join()
+
+    status = queue.status(job['id'])
+    assert (status['state'], status['error']) == ('failed', 'Invalid image file')
+    assert storage.objects == {}
+
+
+def test_upload_is_retried_then_fails(tmp_path, no_backoff):
+    storage = FakeStorage(failures=upload_queue_module.UPLOAD_MAX_ATTEMPTS + 1)
+    queue = UploadQueue(storage, workers=1, spool_dir=str(tmp_path))
+
+    job = _submit(queue, _jpeg())
+    queue.join()
+
+    status = queue.status(job['id'])
+    assert (status['state'], status['attempts']) == ('failed', upload_queue_module.UPLOAD_MAX_ATTEMPTS)
+    assert status['error'] == 'Simulated storage failure'
+
+
+def test_upload_recovers_after_a_transient_failure(tmp_path, no_backoff):
+    storage = FakeStorage(failures=1)
+    queue = UploadQueue(storage, workers=1, spool_dir=str(tmp_path))
+
+    job = _submit(queue, _jpeg())
+    queue.join()
+
+    status = queue.status(job['id'])
+    assert (status['state'], status['attempts']) == ('done', 2)
+
+
+def test_async_upload_reports_its_status():
+    client = main.app.test_client()
+    body = {'image': (io.BytesIO(_jpeg()), 'pest.jpg'), 'pest_name': 'Aphid', 'user_id': 'u1', 'mode': 'async'}
+
+    response = client.post('/upload-image', data=body, content_type='multipart/form-data')
+
+    assert response.status_code == 202
+    accepted = response.get_json()
+    assert accepted['status'] == 'queued'
+    _wait_for(lambda: client.get(accepted['status_url']).get_json()['state'] == 'done')
+    assert client.get(accepted['status_url']).get_json()['urls']['display'] == accepted['public_url']
+
+
+@pytest.mark.parametrize('job_id', ['0' * 32, 'not-a-job-id'])
+def test_unknown_upload_status_is_404(job_id):
+    response = main.app.test_client().get(f'/upload-image/status/{job_id}')
+
+    assert response.status_code == 404
+
+
+def test_same_bytes_return_the_stored_urls():
+    client = main.app.test_client()
+    data = _jpeg()
+    before = images.dedup_stats()
+
+    def upload():
+        body = {'image': (io.BytesIO(data), 'pest.jpg'), 'pest_name': 'Aphid', 'user_id': 'u1'}
+        return client.post('/upload-image', data=body, content_type='multipart/form-data').get_json()
+
+    first, second = upload(), upload()
+
+    assert (first['deduplicated'], second['deduplicated']) == (False, True)
+    assert (second['public_url'], second['thumbnail_url'], second['original_url']) == (first['public_url'], first['thumbnail_url'], first['original_url'])
+    stats = images.dedup_stats()
+    assert stats['deduplicated'] == before['deduplicated'] + 1
+    assert stats['bytes_saved'] > before['bytes_saved']
+
+
+def test_deleted_image_is_uploaded_again():
+    client = main.app.test_client()
+    data = _jpeg()
+
+    def upload():
+        body = {'image': (io.BytesIO(data), 'pest.jpg'), 'pest_name': 'Aphid', 'user_id': 'u1'}
+        return client.post('/upload-image', data=body, content_type='multipart/form-data').get_json()
+
+    first = upload()
+    display_path = next(path for path in image_storage.objects if first['public_url'].endswith(path))
+    del image_storage.objects[display_path]
+    second = upload()
+
+    assert second['deduplicated'] is False
+    assert second['public_url'] != first['public_url']
@@ -0,0 +1,83 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import utils
+
+
+class _CountingWeatherApi:
+    def __init__(self, delay: float = 0.2):
+        self.delay = delay
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def forecast_weather(self, q, **kwargs):
+        with self._lock:
+            self.calls.append(q)
+        time.sleep(self.delay)
+        return {'location': {'name': q}}
+
+
+def test_concurrent_misses_make_one_upstream_call(fake_db, monkeypatch):
+    api = _CountingWeatherApi()
+    monkeypatch.setattr(utils, 'get_weather_api', lambda: api)
+    spellings = ['ludhiana', 'Ludhiana', ' LUDHIANA ', 'ludhiana  '] * 4
+    start = threading.Barrier(len(spellings))
+
+    def fetch(location):
+        start.wait()
+        return utils.update_weather_data(location)
+
+    with ThreadPoolExecutor(max_workers=len(spellings)) as pool:
+        results = list(pool.map(fetch, spellings))
+
+    assert len(api.calls) == 1
+    stored = [row['location'] for row in fake_db.tables['weather_scheme_cache']]
+    assert len(stored) == 1
+    assert all(result['location'] == stored[0] for result in results)
+
+
+def test_schemes_are_found_for_any_spelling(fake_db):
+    fake_db.tables['weather_scheme_cache'] = [{'location': 'New Delhi', 'schemes': ['PM-KISAN']}]
+
+    assert utils.get_schemes_by_location('new   delhi ') == ['PM-KISAN']
+    assert utils.get_schemes_by_location('NEW DELHI') == ['PM-KISAN']
+    # Both spellings share one cache entry
+    assert fake_db.queries('weather_scheme_cache') == 1
+
+
+def test_schemes_are_found_for_rows_stored_in_any_case(fake_db):
+    fake_db.tables['weather_scheme_cache'] = [
+        {'location': 'pune', 'schemes': ['PM-KISAN']},
+        {'location': 'PUNE ', 'schemes': None},
+        {'location': 'Nashik Road', 'schemes': ['KCC']},
+    ]
+
+    assert utils.get_schemes_by_location('Pune') == ['PM-KISAN']
+    assert utils.get_schemes_by_location(' nashik   ROAD') == ['KCC']
+    assert utils.get_schemes_by_location('Nashik') is None
+
+
+def test_weather_refresh_updates_the_existing_row(fake_db, monkeypatch):
+    api = _CountingWeatherApi(delay=0)
+    monkeypatch.setattr(utils, 'get_weather_api', lambda: api)
+    fake_db.tables['weather_scheme_cache'] = [{'location': 'NCR', 'schemes': ['PM-KISAN']}]
+
+    result = utils.update_weather_data('ncr ')
+
+    assert api.calls == ['NCR']
+    assert result['location'] == 'NCR'
+    assert fake_db.tables['weather_scheme_cache'] == [result]
+    assert result['schemes'] == ['PM-KISAN']
+    assert utils.get_schemes_by_location('Ncr') == ['PM-KISAN']
+
+
+def test_new_locations_keep_their_spelling(fake_db, monkeypatch):
+    api = _CountingWeatherApi(delay=0)
+    monkeypatch.setattr(utils, 'get_weather_api', lambda: api)
+
+    utils.update_weather_data('  NCR ')
+    utils.update_weather_data('ncr')
+
+    assert api.calls == ['NCR']
+    assert [row['location'] for row in fake_db.tables['weather_scheme_cache']] == ['NCR']
@@ -0,0 +1,113 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+import write_buffer as write_buffer_module
+from write_buffer import WriteBuffer, WriteBufferFull
+
+
+@pytest.fixture
+def buffer(tmp_path):
+    # Nothing is flushed in the background during a test
+    buffer = WriteBuffer(max_rows=1000, flush_ms=60000, max_pending=1000, journal_dir=str(tmp_path))
+    yield buffer
+    buffer.close()
+
+
+def _dead_rows(journal_dir):
+    path = os.path.join(journal_dir, 'dead.jsonl')
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_a_rejected_row_is_bisected_out_and_dead_lettered(fake_db, buffer):
+    fake_db.rejects['feedback'] = lambda row: row['n'] == 7
+    for n in range(20):
+        buffer.add('feedback', {'n': n})
+
+    assert buffer.flush() == 19
+
+    assert sorted(row['n'] for row in fake_db.tables['feedback']) == [n for n in range(20) if n != 7]
+    assert _dead_rows(buffer.journal_dir) == [{'table': 'feedback', 'row': {'n': 7}}]
+    assert buffer.pending() == 0
+
+
+def test_a_rejected_row_does_not_slow_down_later_writes(fake_db, buffer):
+    fake_db.rejects['feedback'] = lambda row: row.get('bad')
+    buffer.add('feedback', {'bad': True})
+    buffer.flush()
+
+    buffer.add('sms_logs', {'message': 'hi'})
+    buffer.flush()
+
+    assert buffer._failures == 0
+    assert fake_db.tables['sms_logs'] == [{'message': 'hi', 'id': 1}]
+
+
+def test_rows_are_retried_after_a_transport_error(fake_db, buffer):
+    fake_db.failures['feedback'] = ConnectionError('connection reset')
+    buffer.add('feedback', {'n': 1})
+
+    assert buffer.flush() == 0
+    assert buffer.pending() == 1
+    assert buffer._failures == 1
+    assert _dead_rows(buffer.journal_dir) == []
+
+    del fake_db.failures['feedback']
+    assert buffer.flush() == 1
+    assert buffer._failures == 0
+
+
+def test_journaled_rows_are_replayed_after_a_restart(fake_db, tmp_path):
+    # A segment left by a process that is no longer running, with a half written last line
+    with open(tmp_path / '1.99999999-0badc0ffee00.jsonl', 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'table': 'sms_logs', 'row': {'message': 'a'}}) + '\n')
+        f.write(json.dumps({'table': 'feedback', 'row': {'n': 1}}) + '\n')
+        f.write('{"table": "feedback", "ro')
+
+    buffer = WriteBuffer(max_rows=1000, flush_ms=60000, journal_dir=str(tmp_path))
+    try:
+        buffer.start()
+        assert buffer.pending() == 2
+        assert buffer.flush() == 2
+    finally:
+        buffer.close()
+
+    assert [row['message'] for row in fake_db.tables['sms_logs']] == ['a']
+    assert [row['n'] for row in fake_db.tables['feedback']] == [1]
+    assert not (tmp_path / '1.99999999-0badc0ffee00.jsonl').exists()
+
+
+def test_add_raises_when_the_buffer_stays_full(fake_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(write_buffer_module, 'WRITE_BEHIND_BLOCK_SECONDS', 0.05)
+    buffer = WriteBuffer(max_rows=1000, flush_ms=60000, max_pending=3, journal_dir=str(tmp_path))
+    try:
+        for n in range(3):
+            buffer.add('feedback', {'n': n})
+        started = time.monotonic()
+        with pytest.raises(WriteBufferFull):
+            buffer.add('feedback', {'n': 3})
+        assert time.monotonic() - started >= 0.05
+    finally:
+        buffer.close()
+
+
+def test_add_waits_for_a_flush_to_make_room(fake_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(write_buffer_module, 'WRITE_BEHIND_BLOCK_SECONDS', 5)
+    buffer = WriteBuffer(max_rows=1000, flush_ms=60000, max_pending=3, journal_dir=str(tmp_path))
+    try:
+        for n in range(3):
+            buffer.add('feedback', {'n': n})
+        threading.Timer(0.05, buffer.flush).start()
+
+        buffer.add('feedback', {'n': 3})
+
+        assert buffer.pending() == 1
+    finally:
+        buffer.close()
+    assert sorted(row['n'] for row in fake_db.tables['feedback']) == [0, 1, 2, 3]
@@ -0,0 +1,287 @@
+import glob
+import json
+import os
+import queue
+import re
+import shutil
+import threading
+import time
+import uuid
+
+from config import (
+    UPLOAD_WORKERS, UPLOAD_QUEUE_SIZE, UPLOAD_MAX_ATTEMPTS, UPLOAD_RETRY_BACKOFF, UPLOAD_RETRY_AFTER,
+    UPLOAD_STATUS_TTL, UPLOAD_SPOOL_DIR
+)
+from cache import image_hash_cache
+from images import make_variants
+from storage import image_storage
+from spool import SpoolDir
+
+_JOB_ID = re.compile(r'^[0-9a-f]{32}$')
+
+PENDING_STATES = ('queued', 'uploading')
+
+
+class UploadQueueFull(Exception):
+    """
+    Raised when UPLOAD_QUEUE_SIZE uploads are already waiting for a worker.
+
+    Args:
+        retry_after (int): Seconds the client should wait before retrying.
+    """
+
+    def __init__(self, retry_after: int = UPLOAD_RETRY_AFTER):
+        super().__init__("Upload queue is full, try again later")
+        self.retry_after = retry_after
+
+
+class UploadQueue:
+    """
+    Finishes image uploads in the background using a pool of worker threads.
+
+    Each accepted upload is written to the spool directory as <id>.bin, with its
+    job record in a spool.SpoolDir next to it. Workers render the display image
+    and thumbnail, upload every object with retries and keep the record's state
+    up to date, so the status of a job can be read by any process sharing the
+    spool directory.
+    Jobs left unfinished by a process that is no longer running are picked up by
+    the next one.
+
+    Args:
+        storage: The storage backend objects are uploaded to.
+        workers (int): The number of worker threads.
+        queue_size (int): The maximum number of uploads waiting for a worker.
+        spool_dir (str): The directory uploads and job records are kept in.
+    """
+
+    def __init__(self, storage, workers: int = UPLOAD_WORKERS, queue_size: int = UPLOAD_QUEUE_SIZE,
+                 spool_dir: str = UPLOAD_SPOOL_DIR):
+        self.storage = storage
+        self.workers = workers
+        self.spool_dir = spool_dir
+        self._spool = SpoolDir(spool_dir, 'json')
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._last_prune = 0
+
+    def start(self):
+        """
+        Starts the worker threads of this process and resumes uploads left behind by
+        processes that are no longer running. Safe to call more than once.
+        """
+        # Worker threads do not survive a fork, so start them once per process
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            self._pid = os.getpid()
+            self._spool.ensure()
+            for i in range(self.workers):
+                threading.Thread(target=self._work, name=f"uploader-{i}", daemon=True).start()
+            threading.Thread(target=self._recover_spool, name="uploader-recovery", daemon=True).start()
+
+    def _data_path(self, job_id: str):
+        return os.path.join(self.spool_dir, f"{job_id}.bin")
+
+    def _save(self, job: dict):
+        job['updated_at'] = time.time()
+        self._spool.write_json(job['id'], job)
+
+    def _discard(self, job_id: str):
+        self._spool.remove(job_id)
+        try:
+            os.remove(self._data_path(job_id))
+        except FileNotFoundError:
+            pass
+
+    def submit(self, fileobj, paths: dict, urls: dict, content_type: str, digest: str = None, size: int = None):
+        """
+        Spools an upload to disk and queues it for the workers.
+
+        Args:
+            fileobj: A binary file positioned at the start of the original image.
+            paths (dict): The storage paths of the 'original', 'display' and 'thumbnail' objects.
+            urls (dict): The public URLs of the same objects.
+            content_type (str): The original image's content type.
+            digest (str, optional): The SHA-256 of the image, remembered for deduplication once stored.
+            size (int, optional): The size of the original in bytes.
+
+        Returns:
+            dict: The queued job record.
+
+        Raises:
+            UploadQueueFull: If too many uploads are already waiting.
+        """
+        self.start()
+        job = {
+            'id': uuid.uuid4().hex,
+            'state': 'queued',
+            'paths': paths,
+            'urls': urls,
+            'content_type': content_type,
+            'digest': digest,
+            'size': size,
+            'uploaded': [],
+            'attempts': 0,
+            'error': None,
+            'created_at': time.time()
+        }
+        try:
+            with open(self._data_path(job['id']), 'wb') as f:
+                shutil.copyfileobj(fileobj, f)
+            self._save(job)
+            self._queue.put_nowait(job)
+            return job
+        except queue.Full:
+            self._discard(job['id'])
+            raise UploadQueueFull()
+        except Exception:
+            self._discard(job['id'])
+            raise
+
+    def status(self, job_id: str):
+        """
+        Returns the record of an upload job, or None if it is unknown or has expired.
+
+        Args:
+            job_id (str): The ID returned when the upload was accepted.
+        """
+        if not _JOB_ID.match(job_id or ''):
+            return None
+        path = self._spool.find(job_id)
+        if path is None:
+            return None
+        try:
+            with open(path) as f:
+                job = json.load(f)
+        except (FileNotFoundError, ValueError):
+            # Renamed by a claiming process or mid-write; the caller can poll again
+            return None
+        return {key: job.get(key) for key in ('id', 'state', 'urls', 'uploaded', 'attempts', 'error', 'created_at', 'updated_at')}
+
+    def _recover_spool(self):
+        """
+        Queues unfinished uploads left behind by processes that are no longer running.
+        """
+        self._prune()
+        for job_id, path in self._spool.claim_orphans():
+            try:
+                with open(path) as f:
+                    job = json.load(f)
+                if job.get('state') not in PENDING_STATES:
+                    # Finished jobs are claimed only so their status stays readable
+                    continue
+                job['state'] = 'queued'
+                self._save(job)
+                # Runs on its own thread, so waiting for room in the queue does not hold up startup
+                self._queue.put(job)
+                print(f"Recovered spooled upload {job_id}.")
+            except Exception as e:
+                print(f"Error recovering spooled upload {job_id}: {e}")
+
+    def _prune(self):
+        """
+        Removes finished job records older than UPLOAD_STATUS_TTL and spooled files
+        whose record is gone.
+        """
+        now = time.time()
+        if now - self._last_prune < 60:
+            return
+        self._last_prune = now
+        live = set()
+        for job_id, owner, path in self._spool.entries():
+            live.add(job_id)
+            try:
+                with open(path) as f:
+                    job = json.load(f)
+                if job.get('state') not in PENDING_STATES and now - job.get('updated_at', 0) > UPLOAD_STATUS_TTL:
+                    os.remove(path)
+                    live.discard(job_id)
+            except (FileNotFoundError, ValueError):
+                continue
+            except Exception as e:
+                print(f"Error pruning upload record {path}: {e}")
+        for path in glob.glob(os.path.join(self.spool_dir, '*.bin')):
+            job_id = os.path.basename(path)[:-len('.bin')]
+            try:
+                if job_id not in live and now - os.path.getmtime(path) > UPLOAD_STATUS_TTL:
+                    os.remove(path)
+            except FileNotFoundError:
+                continue
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._process(job)
+            except Exception as e:
+                print(f"Error processing upload {job['id']}: {e}")
+            finally:
+                self._queue.task_done()
+                self._prune()
+
+    def _process(self, job: dict):
+        job['state'] = 'uploading'
+        self._save(job)
+        data_path = self._data_path(job['id'])
+        try:
+            with open(data_path, 'rb') as f:
+                variants = make_variants(f)
+        except (ValueError, FileNotFoundError) as e:
+            self._finish(job, 'failed', str(e))
+            return
+
+        for attempt in range(1, UPLOAD_MAX_ATTEMPTS + 1):
+            job['attempts'] = attempt
+            try:
+                for variant in ('original', 'display', 'thumbnail'):
+                    if variant in job['uploaded']:
+                        continue
+                    if variant == 'original':
+                        with open(data_path, 'rb') as f:
+                            self.storage.upload(job['paths'][variant], f, job['content_type'], upsert=True)
+                    else:
+                        self.storage.upload(job['paths'][variant], variants[variant], 'image/jpeg', upsert=True)
+                    job['uploaded'].append(variant)
+                    self._save(job)
+                break
+            except Exception as e:
+                print(f"Error uploading {job['id']} (attempt {attempt}/{UPLOAD_MAX_ATTEMPTS}): {e}")
+                job['error'] = str(e)
+                self._save(job)
+                if attempt < UPLOAD_MAX_ATTEMPTS:
+                    time.sleep(UPLOAD_RETRY_BACKOFF * 2 ** (attempt - 1))
+        else:
+            self._finish(job, 'failed', job['error'])
+            return
+
+        if job.get('digest'):
+            image_hash_cache.set(job['digest'], {
+                'filename': os.path.basename(job['paths']['original']),
+                'paths': job['paths'],
+                'urls': job['urls'],
+                'bytes': (job.get('size') or 0) + len(variants['display']) + len(variants['thumbnail'])
+            })
+        self._finish(job, 'done', None)
+        print(f"Upload {job['id']} stored at {job['urls']['display']}")
+
+    def _finish(self, job: dict, state: str, error):
+        job['state'] = state
+        job['error'] = error
+        self._save(job)
+        try:
+            os.remove(self._data_path(job['id']))
+        except FileNotFoundError:
+            pass
+
+    def join(self):
+        """
+        Blocks until every queued upload has been handled.
+        """
+        self._queue.join()
+
+
+upload_queue = UploadQueue(image_storage)
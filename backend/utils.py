@@ -1,32 +1,62 @@
 from decimal import Decimal
-import bcrypt
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
 import random
+import re
 import string
 from dotenv import load_dotenv
 import os
 from datetime import datetime, timedelta
-import weatherapi
 from weatherapi.rest import ApiException
+from postgrest.exceptions import APIError
 import uuid
-
-from config import db
+import threading
+import time
+import base64
+import json
+import csv
+import io
+
+import openpyxl
+
+from config import (
+    db, WEATHER_FRESH_MINUTES, WEATHER_MAX_STALE_MINUTES, DASHBOARD_WORKERS,
+    PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX, EXPORT_PAGE_SIZE, BULK_CHUNK_SIZE,
+    IMPORT_MAX_ERRORS, NEARBY_MAX_RADIUS_KM, PEST_TRENDS_RETENTION_DAYS, PEST_TRENDS_REFRESH_DAYS,
+    UPLOAD_BATCH_WORKERS, WRITE_BEHIND, IN_FILTER_CHUNK_SIZE
+)
+from weather_client import get_weather_api, REQUEST_TIMEOUT
+from mailer import send_mail
+from hashing import HashingBusy, hash_password, check_password, needs_rehash, rehash_in_background
+from pesticide_index import add_names as add_pesticide_names, resolve_pesticide_name
+from supplier_geo import get_index as get_supplier_geo_index, update_supplier_location, remove_supplier
+import pest_trends
+from images import (
+    UploadTooLarge, read_capped, probe_image, make_variants, image_paths, thumbnail_url, record_dedup,
+    record_stale_dedup
+)
+from storage import image_storage
+from upload_queue import UploadQueueFull, upload_queue
+from write_buffer import WriteBufferFull, write_buffer
+from metrics import ContextThreadPoolExecutor, upstream
+from cache import (
+    cached, user_info_cache, user_name_cache, inventory_cache, schemes_cache, supplier_dashboard_cache,
+    image_hash_cache, pest_trends_cache
+)
 
 load_dotenv()
 
-SENDGRID_API_KEY = os.getenv("SENDGRID_API_KEY")
-SENDGRID_SENDER_EMAIL = os.getenv("SENDGRID_SENDER_EMAIL")
-
-WEATHER_API_KEY = os.getenv("WEATHER_API_KEY")
-
-if not SENDGRID_API_KEY:
-    raise ValueError("SENDGRID_API_KEY not found in environment variables.")
-if not SENDGRID_SENDER_EMAIL:
-    raise ValueError("SENDGRID_SENDER_EMAIL not found in environment variables.")
+def _invalidate_user_cache(user_id, email=None):
+    """
+    Drops the cached reads of a user after a write to their profile.
 
-configuration = weatherapi.Configuration()
-configuration.api_key['key'] = WEATHER_API_KEY
+    Args:
+        user_id (str): The user's ID.
+        email (str, optional): The user's email, used as a key by get_user_name.
+    """
+    user_info_cache.delete(user_id)
+    supplier_dashboard_cache.delete(user_id)
+    user_name_cache.delete(('id', user_id))
+    if email is not None:
+        user_name_cache.delete(('email', email))
 
 def register_user(name: str, email: str, phone: str, password: str, user_type: str, location: str):
     """
@@ -43,7 +73,7 @@ def register_user(name: str, email: str, phone: str, password: str, user_type: s
         return {"status": "error", "code": 2, "message": "User with this email or phone already exists"}
 
     try:
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        hashed_password = hash_password(password)
         # Create user in Supabase Auth (admin)
         auth_resp = db.auth.admin.create_user({
             "email": email,
@@ -56,15 +86,19 @@ def register_user(name: str, email: str, phone: str, password: str, user_type: s
         user_id = auth_resp.user.id
 
         # Insert into users table (store hashed password)
-        result = db.table('users').insert({
-            'id': user_id,
-            'name': name,
-            'email': email,
-            'phone': phone,
-            'password': hashed_password,
-            'role': user_type,
-            'district': location
-        }).execute()
+        try:
+            result = db.table('users').insert({
+                'id': user_id,
+                'name': name,
+                'email': email,
+                'phone': phone,
+                'password': hashed_password,
+                'role': user_type,
+                'district': location
+            }).execute()
+        finally:
+            # A lookup of this email before it was registered may have cached a miss
+            _invalidate_user_cache(user_id, email)
         result_details = None
         if user_type.lower() == 'farmer':
             result_details = db.table('farmer_details').insert({
@@ -87,6 +121,8 @@ def register_user(name: str, email: str, phone: str, password: str, user_type: s
         else:
             print(f"Error: Failed to insert user into database.")
             return {"status": "error", "code": 5, "message": "Failed to insert user into database"}
+    except HashingBusy:
+        raise
     except Exception as e:
         print(f"An unexpected error occurred during registration: {e}")
         return {"status": "error", "code": 6, "message": f"Error: {str(e)}"}
@@ -99,7 +135,16 @@ def login_user(email: str, password: str):
             return {"status": "error", "code": 1, "message": "Invalid email or password"}
 
         user = result.data[0]
-        if bcrypt.checkpw(password.encode('utf-8'), user['password'].encode('utf-8')):
+        if check_password(password, user['password']):
+            if needs_rehash(user['password']):
+                # Upgrade hashes made with an older cost factor while we have the plain password.
+                # The update only applies if the password was not changed in the meantime.
+                def store_rehash(hashed):
+                    try:
+                        db.table('users').update({'password': hashed}).eq('id', user['id']).eq('password', user['password']).execute()
+                    finally:
+                        _invalidate_user_cache(user['id'], email)
+                rehash_in_background(password, store_rehash)
             return {
                 "status": "success",
                 "user_id": user['id'],
@@ -113,6 +158,8 @@ def login_user(email: str, password: str):
         else:
             return {"status": "error", "code": 2, "message": "Invalid email or password"}
 
+    except HashingBusy:
+        raise
     except Exception as e:
         return {"status": "error", "code": 3, "message": f"Error: {str(e)}"}
 
@@ -127,7 +174,7 @@ def update_user_profile(user_id, name=None, phone=None, district=None):
         phone (str, optional): The new phone number for the user.
         district (str, optional): The new district for the user.
     """
-    user_result = db.table('users').select('id').eq('id', user_id).limit(1).execute()
+    user_result = db.table('users').select('id, email').eq('id', user_id).limit(1).execute()
     if not user_result.data:
         print(f"Error: User with ID {user_id} not found.")
         return False
@@ -145,7 +192,10 @@ def update_user_profile(user_id, name=None, phone=None, district=None):
         return "no_change"
 
     try:
-        result = db.table('users').update(update_fields).eq('id', user_id).execute()
+        try:
+            result = db.table('users').update(update_fields).eq('id', user_id).execute()
+        finally:
+            _invalidate_user_cache(user_id, user_result.data[0].get('email'))
         if result.data:
             print(f"User ID {user_id} profile updated successfully.")
             return True
@@ -191,7 +241,11 @@ def update_supplier_details(supplier_id, shop_name=None, address=None, latitude=
 
     try:
         result = db.table('supplier_details').update(update_fields).eq('supplier_id', supplier_id).execute()
+        user_info_cache.delete(supplier_id)
+        supplier_dashboard_cache.delete(supplier_id)
         if result.data:
+            row = result.data[0]
+            update_supplier_location(supplier_id, row.get('latitude'), row.get('longitude'), row.get('approved'))
             print(f"Supplier ID {supplier_id} details updated successfully.")
             return True
         else:
@@ -231,6 +285,7 @@ def update_farmer_details(farmer_id, farm_size=None, main_crop=None, irrigation_
 
     try:
         result = db.table('farmer_details').update(update_fields).eq('farmer_id', farmer_id).execute()
+        user_info_cache.delete(farmer_id)
         if result.data:
             print(f"Farmer ID {farmer_id} details updated successfully.")
             return True
@@ -250,7 +305,7 @@ def update_admin_details(admin_id: str, admin_level: int, department: str):
         admin_level (int): The authorization level of the admin.
         department (str): The department in which admin is working.
     """
-    admin_result = db.table('users').select('id').eq('id', admin_id).limit(1).execute()
+    admin_result = db.table('users').select('id, email').eq('id', admin_id).limit(1).execute()
     if not admin_result.data:
         print(f"Error: Admin with ID {admin_id} not found")
         return False
@@ -266,7 +321,10 @@ def update_admin_details(admin_id: str, admin_level: int, department: str):
         return False
 
     try:
-        result = db.table('users').update(update_fields).eq('id', admin_id).execute()
+        try:
+            result = db.table('users').update(update_fields).eq('id', admin_id).execute()
+        finally:
+            _invalidate_user_cache(admin_id, admin_result.data[0].get('email'))
         if result.data:
             print(f"User ID {admin_id} profile updated successfully.")
             return True
@@ -291,21 +349,39 @@ def submit_feedback(user_id: str, rating: int, comments: str):
         return False
 
     try:
-        result = db.table('feedback').insert({
+        row = {
             'user_id': user_id,
             'rating': rating,
             'comments': comments
-        }).execute()
+        }
+        if WRITE_BEHIND:
+            write_buffer.add('feedback', row)
+            print(f"Feedback queued for writing.")
+            return True
+        result = db.table('feedback').insert(row).execute()
         if result.data:
             print(f"Feedback submitted successfully.")
             return True
         else:
             print(f"Error: Failed to submit feedback to database.")
             return False
+    except WriteBufferFull:
+        raise
     except Exception as e:
         print(f"Error submitting feedback: {e}")
         return False
     
+def validate_sms_log(user_phone, query_type, message):
+    """
+    Checks the fields of an SMS log entry.
+
+    Returns:
+        str: The validation error, or None if the entry is valid.
+    """
+    if not user_phone or not query_type or not message:
+        return "User phone, query type, and message are required for SMS log."
+    return None
+
 def log_sms_interaction(user_phone: str, query_type: str, message: str, response: str):
     """
     Logs an SMS interaction, including the query, message, and response.
@@ -316,27 +392,139 @@ def log_sms_interaction(user_phone: str, query_type: str, message: str, response
         message (str): The content of the SMS message.
         response (str, optional): The response sent back, if any. Defaults to None.
     """
-    if not user_phone or not query_type or not message:
-        print("Error: User phone, query type, and message are required for SMS log.")
+    error = validate_sms_log(user_phone, query_type, message)
+    if error:
+        print(f"Error: {error}")
         return False
 
     try:
-        result = db.table('sms_logs').insert({
+        row = {
             'user_phone': user_phone,
             'query_type': query_type,
             'message': message,
             'response': response
-        }).execute()
+        }
+        if WRITE_BEHIND:
+            write_buffer.add('sms_logs', row)
+            print(f"SMS interaction queued for {user_phone}.")
+            return True
+        result = db.table('sms_logs').insert(row).execute()
         if result.data:
             print(f"SMS interaction logged for {user_phone}.")
             return True
         else:
             print(f"Error: Failed to log SMS interaction to database.")
             return False
+    except WriteBufferFull:
+        raise
     except Exception as e:
         print(f"Error logging SMS interaction: {e}")
         return False
 
+def iter_ndjson(stream):
+    """
+    Parses a binary NDJSON stream one line at a time, skipping blank lines.
+
+    Yields:
+        The decoded value of each line, or a ValueError for a line that is not valid JSON.
+    """
+    for line in io.TextIOWrapper(stream, encoding='utf-8-sig'):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield ValueError(f"Invalid JSON: {e}")
+
+def ingest_sms_logs(records):
+    """
+    Writes many SMS log records with bulk inserts of BULK_CHUNK_SIZE rows.
+
+    Records are validated like log_sms_interaction and consumed lazily, so an
+    NDJSON stream is never held in memory. Only the first IMPORT_MAX_ERRORS
+    record errors are reported.
+
+    Args:
+        records (iterable): Dicts with user_phone, query_type, message and an optional
+            response. A ValueError in place of a record is reported as that record's error.
+
+    Returns:
+        dict: The status, record counts and record-level errors (indexes count from 0).
+    """
+    summary = {"status": "success", "records_read": 0, "records_written": 0, "error_count": 0, "errors": []}
+
+    def add_error(index, message):
+        summary['error_count'] += 1
+        if len(summary['errors']) < IMPORT_MAX_ERRORS:
+            summary['errors'].append({'index': index, 'message': message})
+
+    def flush(chunk):
+        # A chunk the database rejects is split in halves, as in WriteBuffer._insert,
+        # so one bad record does not fail the rest of its chunk
+        try:
+            db.table('sms_logs').insert([row for _, row in chunk]).execute()
+            summary['records_written'] += len(chunk)
+        except APIError as e:
+            if len(chunk) == 1:
+                print(f"Error inserting SMS log record {chunk[0][0]}: {e}")
+                add_error(chunk[0][0], str(e))
+                return
+            middle = len(chunk) // 2
+            flush(chunk[:middle])
+            flush(chunk[middle:])
+        except Exception as e:
+            print(f"Error inserting SMS log chunk: {e}")
+            for index, _ in chunk:
+                add_error(index, str(e))
+
+    chunk = []
+    try:
+        for index, record in enumerate(records):
+            summary['records_read'] += 1
+            if isinstance(record, ValueError):
+                add_error(index, str(record))
+                continue
+            if not isinstance(record, dict):
+                add_error(index, "Expected a JSON object")
+                continue
+            error = validate_sms_log(record.get('user_phone'), record.get('query_type'), record.get('message'))
+            if error:
+                add_error(index, error)
+                continue
+            chunk.append((index, {
+                'user_phone': record['user_phone'],
+                'query_type': record['query_type'],
+                'message': record['message'],
+                'response': record.get('response')
+            }))
+            if len(chunk) >= BULK_CHUNK_SIZE:
+                flush(chunk)
+                chunk = []
+        if chunk:
+            flush(chunk)
+    except UnicodeDecodeError as e:
+        print(f"Error reading SMS log stream: {e}")
+        add_error(summary['records_read'], f"Unreadable input: {e}")
+        summary['status'] = 'error'
+        summary['message'] = 'Ingest stopped at an unreadable record'
+
+    summary['errors_truncated'] = summary['error_count'] > len(summary['errors'])
+    print(f"SMS log ingest: {summary['records_written']}/{summary['records_read']} records written.")
+    return summary
+
+def validate_pest_detection(user_id, image_url, pest_name, confidence):
+    """
+    Checks the fields of a pest detection log entry.
+
+    Returns:
+        str: The validation error, or None if the entry is valid.
+    """
+    if not user_id or not image_url or not pest_name or confidence is None:
+        return "User ID, image URL, pest name, and confidence are required."
+    if not isinstance(confidence, (int, float)) or not (0.0 <= confidence <= 1.0):
+        return "Confidence must be a float between 0.0 and 1.0."
+    return None
+
 def log_pest_detection(user_id: str, image_url: str, pest_name: str, confidence: float, pesticide: str = "Not specified"):
     """
     Logs the results of a pest detection inference.
@@ -348,11 +536,9 @@ def log_pest_detection(user_id: str, image_url: str, pest_name: str, confidence:
         confidence (float): The confidence score of the detection (0.0 to 1.0).
         pesticide (str): The recommended pesticide for the detected pest.
     """
-    if not user_id or not image_url or not pest_name or confidence is None:
-        print("Error: User ID, image URL, pest name, and confidence are required.")
-        return False
-    if not (0.0 <= confidence <= 1.0):
-        print("Error: Confidence must be a float between 0.0 and 1.0.")
+    error = validate_pest_detection(user_id, image_url, pest_name, confidence)
+    if error:
+        print(f"Error: {error}")
         return False
 
     try:
@@ -363,72 +549,227 @@ def log_pest_detection(user_id: str, image_url: str, pest_name: str, confidence:
             'confidence': confidence,
             'pesticide': pesticide
         }
-       
+        if WRITE_BEHIND:
+            write_buffer.add('pest_inference_results', data)
+            print(f"Pest detection queued for User ID {user_id}.")
+            return True
         result = db.table('pest_inference_results').insert(data).execute()
         if result.data:
             print(f"Pest detection logged for User ID {user_id}.")
+            _record_pest_trends(result.data)
             return True
         else:
             print(f"Error: Failed to log pest detection to database.")
             return False
+    except WriteBufferFull:
+        raise
     except Exception as e:
         print(f"Error logging pest detection: {e}")
         return False
     
+def _record_pest_trends(rows):
+    """
+    Adds written pest detections to their (district, pest, day) counts in pest_trend_counts.
+
+    The districts of all the rows' users are fetched with one query and the
+    counts are added in one increment_pest_trend_counts call, so concurrent
+    writers never overwrite each other. A failure is only logged: the counts
+    are reconciled by the next pest_trends_job.py run.
+    """
+    try:
+        districts = _fetch_rows_by_ids('users', 'id, district', 'id', [row.get('user_id') for row in rows])
+        rollup = pest_trends.PestTrendRollup()
+        for row in rows:
+            user = districts.get(row.get('user_id'), {})
+            rollup.add(user.get('district'), row.get('pest_name'), pest_trends.detection_day(row.get('prediction_time')))
+        db.rpc('increment_pest_trend_counts', {'counts': rollup.rows()}).execute()
+    except Exception as e:
+        print(f"Error updating pest trend counts: {e}")
+
+# Detections written by the write-behind buffer are counted once their flush succeeds
+write_buffer.on_insert('pest_inference_results', _record_pest_trends)
+
+def location_key(location: str):
+    """
+    Returns the key spelling variants of a location share in the schemes cache and weather refreshes.
+
+    Args:
+        location (str): The location as sent by the client (e.g. "PUNE ").
+
+    Returns:
+        str: The location with whitespace collapsed and case folded (e.g. "pune").
+    """
+    return ' '.join(location.split()).casefold()
+
+def first_schemes(rows):
+    """
+    Returns the schemes of the first weather_scheme_cache row that has any, or None.
+    """
+    for row in rows or []:
+        if row.get('schemes') is not None:
+            return row['schemes']
+    return None
+
+def location_pattern(location: str):
+    """
+    Returns a regex for an imatch filter that finds a location's weather_scheme_cache rows.
+
+    Stored locations are kept as they were first written ("pune", "PUNE ", "NCR"), so
+    lookups match them case-insensitively and ignore differences in whitespace.
+
+    Args:
+        location (str): The location as sent by the client.
+    """
+    return r'^\s*' + r'\s+'.join(re.escape(word) for word in location.split()) + r'\s*$'
+
+class _SingleFlight:
+    """
+    Coalesces concurrent calls for the same key into a single execution.
+
+    The first caller for a key runs the function; callers arriving while it is
+    running wait for it and receive the same result.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {'done': threading.Event(), 'result': None}
+        if not leader:
+            call['done'].wait()
+            return call['result']
+        try:
+            call['result'] = func()
+            return call['result']
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['done'].set()
+
+_weather_flight = _SingleFlight()
+
+def _refresh_weather_data(location: str):
+    """
+    Fetches the forecast for a location from the weather API and upserts it into the cache table.
+    Concurrent refreshes of the same location, in any spelling, share one upstream call.
+
+    Args:
+        location (str): The location as stored in weather_scheme_cache, or as it should be
+            stored when the location has no row yet.
+    """
+    return _weather_flight.do(location_key(location), lambda: _fetch_and_store_weather(location))
+
+def _fetch_and_store_weather(location: str):
+    """
+    Calls the weather API for a location and upserts the forecast into weather_scheme_cache.
+    The upsert only sets the weather columns, so the row's schemes are kept.
+    """
+    try:
+        with upstream('weather', 'forecast'):
+            api_response = get_weather_api().forecast_weather(q=' '.join(location.split()), days=3, aqi='yes', alerts='yes', _request_timeout=REQUEST_TIMEOUT)
+        result = db.table('weather_scheme_cache').upsert({
+            'location': location,
+            'weather_data': api_response,
+            'updated_at': datetime.now().replace(tzinfo=None).isoformat()
+        }, on_conflict="location").execute()
+        if result.data:
+            print(f"Weather data updated for {location}.")
+            return result.data[0]
+        else:
+            print(f"Error: Failed to update/insert weather data in database.")
+            return None
+    except ApiException as e:
+        print("Exception when calling APIsApi->forecast_weather: %s\n" % e)
+        return None
+    except Exception as e:
+        print(f"Error refreshing weather data: {e}")
+        return None
+
+_weather_refreshing = set()
+_weather_refreshing_lock = threading.Lock()
+
+def _refresh_weather_in_background(location: str):
+    """
+    Starts a background refresh of a location's weather data unless one is already running.
+
+    Args:
+        location (str): The geographical location.
+    """
+    key = location_key(location)
+    with _weather_refreshing_lock:
+        if key in _weather_refreshing:
+            return
+        _weather_refreshing.add(key)
+
+    def refresh():
+        try:
+            _refresh_weather_data(location)
+        finally:
+            with _weather_refreshing_lock:
+                _weather_refreshing.discard(key)
+
+    threading.Thread(target=refresh, name=f"weather-refresh-{location}", daemon=True).start()
+
 def update_weather_data(location: str):
     """
-    Updates or inserts weather data and associated schemes for a specific location in the cache.
+    Returns the cached weather data for a location, refreshing it from the weather API when needed.
+
+    Rows younger than WEATHER_FRESH_MINUTES are returned directly. Older rows within
+    WEATHER_MAX_STALE_MINUTES are returned immediately while a background refresh runs.
+    Missing or older rows are refreshed before returning.
 
     Args:
         location (str): The geographical location (e.g., city name, coordinates string).
     """
-    if not location:
+    if not location or not location.strip():
         print("Error: Location is required.")
         return False
     try:
         current_time = datetime.now().replace(tzinfo=None)
-        response = db.table('weather_scheme_cache').select('weather_data,updated_at').eq('location', location).limit(1).execute()
-        if response.data:
-            stored_time = datetime.fromisoformat(response.data[0]['updated_at'])
+        response = db.table('weather_scheme_cache').select('location,weather_data,updated_at').filter('location', 'imatch', location_pattern(location)).execute()
+        rows = response.data or []
+        forecasts = [row for row in rows if row.get('weather_data') and row.get('updated_at')]
+        if forecasts:
+            row = max(forecasts, key=lambda row: row['updated_at'])
+            location = row['location']
+            stored_time = datetime.fromisoformat(row['updated_at'])
             if stored_time.tzinfo is not None:
                 stored_time = stored_time.replace(tzinfo=None)
-            if current_time - stored_time < timedelta(minutes=30):
+            age = current_time - stored_time
+            if age < timedelta(minutes=WEATHER_FRESH_MINUTES):
                 print(f"Weather data is up to date for {location}.")
-                return response.data[0]
+                return row
+            if age < timedelta(minutes=WEATHER_FRESH_MINUTES + WEATHER_MAX_STALE_MINUTES):
+                print(f"Serving stale weather data for {location} while refreshing.")
+                _refresh_weather_in_background(location)
+                return row
+        elif rows:
+            # Refresh into the existing row (e.g. one seeded with schemes) rather than adding another
+            location = rows[0]['location']
         else:
-            api_instance = weatherapi.APIsApi(weatherapi.ApiClient(configuration))
-            try:
-                api_response = api_instance.forecast_weather(q=location, days=3, aqi='yes', alerts='yes')
-                result = db.table('weather_scheme_cache').upsert({
-                    'location': location,
-                    'weather_data': api_response,
-                    'updated_at': datetime.now().replace(tzinfo=None).isoformat()
-                }, on_conflict="location").execute()
-                if result.data:
-                    print(f"Weather data updated for {location}.")
-                    return result.data[0]
-                else:
-                    print(f"Error: Failed to update/insert weather data in database.")
-                    return None
-            except ApiException as e:
-                print("Exception when calling APIsApi->forecast_weather: %s\n" % e)
-                return None
+            location = ' '.join(location.split())
+        return _refresh_weather_data(location)
     except Exception as e:
         print(f"Error getting weather data cache: {e}")
         return None
 
+@cached(schemes_cache, key=lambda location: location_key(location))
 def get_schemes_by_location(location: str):
     """
     Retrieves schemes for a given location.
 
     Args:
-        location (str): The location string.
+        location (str): The location string, matched regardless of case and whitespace.
     """
-    result = db.table('weather_scheme_cache').select('schemes').eq('location', location).limit(1).execute()
-    if result.data:
-        return result.data[0].get('schemes')
-    return None
+    result = db.table('weather_scheme_cache').select('schemes').filter('location', 'imatch', location_pattern(location)).execute()
+    return first_schemes(result.data)
 
+@cached(user_name_cache, key=lambda user_id=None, email=None: ('id', user_id) if user_id is not None else ('email', email))
 def get_user_name(user_id=None, email=None):
     """
     Retrieves the name of a user by user_id or email.
@@ -449,89 +790,408 @@ def get_user_name(user_id=None, email=None):
 
 def get_last_4_pest_images(user_id: str):
     """
-    Retrieves the image URLs of the last 4 pests searched by a user.
+    Retrieves the thumbnail URLs of the last 4 pests searched by a user.
 
     Args:
         user_id (int): The user's ID.
     """
     result = db.table('pest_inference_results').select('image_url').eq('user_id', user_id).order('prediction_time', desc=True).limit(4).execute()
     if result.data:
-        return [row['image_url'] for row in result.data]
+        return [thumbnail_url(row['image_url']) for row in result.data]
     return []
 
 
-def get_pest_history(user_id: str):
+def _format_pest_history_row(row):
+    return {
+        'img_url': row['image_url'],
+        'pest_name': row['pest_name'],
+        'pesticide':row['pesticide'],
+        'prediction_time': row['prediction_time']
+    }
+
+def _fetch_pest_history(user_id: str):
     """
     Retrieves the pest detection history for a user.
 
+    Args:
+        user_id (int): The user's ID.
+    """
+    result = db.table('pest_inference_results').select('image_url, pest_name, pesticide, prediction_time').eq('user_id', user_id).order('prediction_time', desc=True).execute()
+    if result.data:
+        return [_format_pest_history_row(row) for row in result.data]
+    return []
+
+def get_pest_history(user_id: str):
+    """
+    Retrieves the pest detection history for a user, or an empty list when the lookup fails.
+
     Args:
         user_id (int): The user's ID.
     """
     try:
-        result = db.table('pest_inference_results').select('image_url, pest_name, pesticide, prediction_time').eq('user_id', user_id).order('prediction_time', desc=True).execute()
-        if result.data:
-            return [
-                {
-                    'img_url': row['image_url'],
-                    'pest_name': row['pest_name'],
-                    'pesticide':row['pesticide'],
-                    'prediction_time': row['prediction_time']
-                }
-                for row in result.data
-            ]
-        return []
+        return _fetch_pest_history(user_id)
     except Exception as e:
         print(f"Error retrieving pest history: {e}")
         return []
 
-def get_last_contacted_suppliers(farmer_id: str):
+def encode_cursor(row: dict, time_column: str):
+    """
+    Builds the opaque cursor pointing just after a row in (time, id) descending order.
+    """
+    raw = json.dumps([row.get(time_column), row.get('id')]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str):
+    """
+    Returns the (time, id) pair stored in a cursor.
+
+    The time is an ISO-8601 string, or None for a row without one, and the id is an
+    integer or a UUID string, so both are safe to put in a PostgREST filter.
+
+    Raises:
+        ValueError: If the cursor was not produced by encode_cursor.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        time_value, row_id = json.loads(raw)
+        if time_value is not None:
+            datetime.fromisoformat(time_value)
+        if isinstance(row_id, str):
+            row_id = str(uuid.UUID(row_id))
+        elif not isinstance(row_id, int) or isinstance(row_id, bool):
+            raise ValueError("Invalid cursor id")
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return time_value, row_id
+
+def page_size(limit=None):
+    """
+    Returns the requested page size clamped to 1..PAGE_SIZE_MAX, or PAGE_SIZE_DEFAULT if none was given.
+
+    Raises:
+        ValueError: If limit is not an integer.
+    """
+    if limit in (None, ''):
+        return PAGE_SIZE_DEFAULT
+    return max(1, min(int(limit), PAGE_SIZE_MAX))
+
+def _keyset_page(query, time_column: str, limit: int, cursor: str = None):
+    """
+    Fetches one page of a query ordered by (time_column, id) descending.
+
+    Args:
+        query: A filtered select on a table with an id column; it must select time_column and id.
+        time_column (str): The timestamp column to page on.
+        limit (int): The page size.
+        cursor (str, optional): The next_cursor of the previous page.
+
+    Returns:
+        tuple: The page's rows and the cursor of the next page, or None on the last page.
+    """
+    if cursor:
+        time_value, row_id = decode_cursor(cursor)
+        if time_value is None:
+            # Rows without a time sort first in descending order, so every row with a time is still to come
+            query = query.or_(f'{time_column}.not.is.null,and({time_column}.is.null,id.lt."{row_id}")')
+        else:
+            # Rows strictly after the cursor: earlier time, or same time and smaller id
+            query = query.or_(f'{time_column}.lt."{time_value}",and({time_column}.eq."{time_value}",id.lt."{row_id}")')
+    result = query.order(time_column, desc=True).order('id', desc=True).limit(limit + 1).execute()
+    rows = result.data or []
+    next_cursor = encode_cursor(rows[limit - 1], time_column) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+# Exportable tables: selected columns, the timestamp column paged on, and the columns callers may filter by
+EXPORT_TABLES = {
+    'suppliers_contacted': {
+        'columns': ['id', 'farmer_id', 'supplier_id', 'pesticide_name', 'contact_time'],
+        'time_column': 'contact_time',
+        'filters': ['farmer_id', 'supplier_id']
+    },
+    'pest_inference_results': {
+        'columns': ['id', 'user_id', 'image_url', 'pest_name', 'confidence', 'pesticide', 'prediction_time'],
+        'time_column': 'prediction_time',
+        'filters': ['user_id']
+    }
+}
+
+def iter_table_rows(table: str, filters: dict = None, page_size: int = EXPORT_PAGE_SIZE, since: str = None):
+    """
+    Yields every row of an exportable table, newest first, one keyset page at a time.
+
+    Args:
+        table (str): A key of EXPORT_TABLES.
+        filters (dict, optional): Equality filters on the table's filter columns.
+        page_size (int): The number of rows fetched per query.
+        since (str, optional): Only yield rows whose timestamp is at or after this ISO time.
+    """
+    spec = EXPORT_TABLES[table]
+    cursor = None
+    while True:
+        query = db.table(table).select(', '.join(spec['columns']))
+        for column, value in (filters or {}).items():
+            query = query.eq(column, value)
+        if since:
+            query = query.gte(spec['time_column'], since)
+        rows, cursor = _keyset_page(query, spec['time_column'], page_size, cursor)
+        yield from rows
+        if not cursor:
+            return
+
+def export_table(table: str, fmt: str = 'ndjson', filters: dict = None):
+    """
+    Streams the rows of one user, farmer or supplier from an exportable table as NDJSON or CSV text chunks.
+
+    Only one page of rows is held in memory at a time, whatever the table size.
+
+    Args:
+        table (str): A key of EXPORT_TABLES.
+        fmt (str): 'ndjson' or 'csv'.
+        filters (dict): Equality filters on the table's filter columns; at least one is required.
+
+    Raises:
+        ValueError: If the table, format or a filter column is not supported, or no filter is given.
+    """
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Table {table} cannot be exported")
+    if fmt not in ('ndjson', 'csv'):
+        raise ValueError(f"Unsupported export format {fmt}")
+    spec = EXPORT_TABLES[table]
+    for column in filters or {}:
+        if column not in spec['filters']:
+            raise ValueError(f"Cannot filter {table} by {column}")
+    if not any((filters or {}).get(column) for column in spec['filters']):
+        raise ValueError(f"Exporting {table} requires one of: {', '.join(spec['filters'])}")
+
+    def generate():
+        rows = iter_table_rows(table, filters)
+        if fmt == 'ndjson':
+            for row in rows:
+                yield json.dumps(row, default=str) + '\n'
+            return
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=spec['columns'], extrasaction='ignore')
+        writer.writeheader()
+        for i, row in enumerate(rows, 1):
+            writer.writerow(row)
+            if i % 500 == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    return generate()
+
+def _iter_pest_trend_counts(since_day: str, columns: str, district: str = None, pest_name: str = None,
+                            page_size: int = EXPORT_PAGE_SIZE):
+    """
+    Yields the pest_trend_counts rows from since_day on, one page at a time.
+    """
+    last_id = None
+    while True:
+        query = db.table('pest_trend_counts').select(columns).gte('day', since_day)
+        if district:
+            query = query.ilike('district', district)
+        if pest_name:
+            query = query.ilike('pest_name', pest_name)
+        if last_id is not None:
+            query = query.gt('id', last_id)
+        rows = query.order('id').limit(page_size).execute().data or []
+        yield from rows
+        if len(rows) < page_size:
+            return
+        last_id = rows[-1]['id']
+
+def refresh_pest_trend_counts(days: int = PEST_TRENDS_REFRESH_DAYS, page_size: int = EXPORT_PAGE_SIZE):
+    """
+    Recounts detections per district, pest and day over the last `days` days into pest_trend_counts.
+
+    Logged detections are added to their counts as they are written; this is run
+    by pest_trends_job.py to backfill the table and to correct counts the write
+    path missed (a failed increment) or repeated (a write-behind flush retried
+    after a crash). Counts are recomputed rather than incremented, so overlapping
+    or repeated runs are safe. See migrations/001_pest_trend_counts.sql.
+
+    Args:
+        days (int): The number of days to recount, ending today (UTC).
+        page_size (int): The number of detections fetched per query.
+
+    Returns:
+        int: The number of counts stored.
+    """
+    since_day = pest_trends.window_start(days)
+    rollup = pest_trends.PestTrendRollup()
+    batch = []
+
+    def add_batch(rows):
+        districts = _fetch_rows_by_ids('users', 'id, district', 'id', [row.get('user_id') for row in rows])
+        for row in rows:
+            user = districts.get(row.get('user_id'), {})
+            rollup.add(user.get('district'), row.get('pest_name'), pest_trends.detection_day(row.get('prediction_time')))
+
+    for row in iter_table_rows('pest_inference_results', page_size=page_size, since=since_day):
+        batch.append(row)
+        if len(batch) >= page_size:
+            add_batch(batch)
+            batch = []
+    if batch:
+        add_batch(batch)
+
+    counts = rollup.rows()
+    for start in range(0, len(counts), BULK_CHUNK_SIZE):
+        db.table('pest_trend_counts').upsert(counts[start:start + BULK_CHUNK_SIZE], on_conflict='district,pest_name,day').execute()
+    # Combinations that no longer occur, e.g. after a user changed district, are removed
+    current = {(row['district'], row['pest_name'], row['day']) for row in counts}
+    stale = [
+        row['id'] for row in _iter_pest_trend_counts(since_day, 'id, district, pest_name, day', page_size=page_size)
+        if (row['district'], row['pest_name'], row['day']) not in current
+    ]
+    for start in range(0, len(stale), IN_FILTER_CHUNK_SIZE):
+        db.table('pest_trend_counts').delete().in_('id', stale[start:start + IN_FILTER_CHUNK_SIZE]).execute()
+    db.table('pest_trend_counts').delete().lt('day', pest_trends.retention_start()).execute()
+    print(f"Stored {len(counts)} pest trend counts since {since_day}.")
+    return len(counts)
+
+@cached(pest_trends_cache, key=lambda days=7, district=None, pest_name=None: (str(days), (district or '').lower(), (pest_name or '').lower()))
+def get_pest_trends(days: int = 7, district: str = None, pest_name: str = None):
+    """
+    Returns detection counts per district, pest and day from pest_trend_counts.
+
+    The counts are updated as detections are written and reconciled by
+    pest_trends_job.py, so a request reads at most one row per district, pest
+    and day in its window.
+
+    Args:
+        days (int): The window size in days, capped at PEST_TRENDS_RETENTION_DAYS.
+        district (str, optional): Only include this district.
+        pest_name (str, optional): Only include this pest.
+
+    Returns:
+        dict: The daily counts and window totals, or None if they could not be read.
+
+    Raises:
+        ValueError: If days is not a positive integer.
+    """
+    days = int(days)
+    if days < 1:
+        raise ValueError("days must be positive")
+    days = min(days, PEST_TRENDS_RETENTION_DAYS)
+    try:
+        rollup = pest_trends.PestTrendRollup()
+        for row in _iter_pest_trend_counts(pest_trends.window_start(days), 'id, district, pest_name, day, count', district, pest_name):
+            rollup.add(row.get('district'), row.get('pest_name'), row.get('day'), row.get('count') or 0)
+        return rollup.query(days, district, pest_name)
+    except Exception as e:
+        print(f"Error retrieving pest trends: {e}")
+        return None
+
+def get_pest_history_page(user_id: str, limit=None, cursor: str = None):
+    """
+    Retrieves one page of a user's pest detection history, newest first.
+
+    Args:
+        user_id (int): The user's ID.
+        limit (int, optional): The page size, capped at PAGE_SIZE_MAX.
+        cursor (str, optional): The next_cursor returned with the previous page.
+
+    Raises:
+        ValueError: If limit or cursor is invalid.
+    """
+    limit = page_size(limit)
+    if cursor:
+        decode_cursor(cursor)
+    try:
+        query = db.table('pest_inference_results').select('id, image_url, pest_name, pesticide, prediction_time').eq('user_id', user_id)
+        rows, next_cursor = _keyset_page(query, 'prediction_time', limit, cursor)
+        return {'history': [_format_pest_history_row(row) for row in rows], 'next_cursor': next_cursor}
+    except Exception as e:
+        print(f"Error retrieving pest history page: {e}")
+        return {'history': [], 'next_cursor': None}
+
+def format_shop_value(val):
+    return val if val not in [None, '', 'null'] else 'Not Available'
+
+def _fetch_rows_by_ids(table: str, columns: str, key: str, ids, **filters):
+    """
+    Fetches the rows of a table whose key column is in ids.
+
+    The ids are sent IN_FILTER_CHUNK_SIZE at a time so the query URL stays within
+    server limits; lists up to that size take a single query.
+
+    Args:
+        table (str): The table to query.
+        columns (str): The columns to select, including the key column.
+        key (str): The column matched against ids.
+        ids (iterable): The ids to look up. Duplicates and None values are ignored.
+        **filters: Extra equality filters applied to the query.
+
+    Returns:
+        dict: The first row found for each id, keyed by id.
+    """
+    ids = list(dict.fromkeys(i for i in ids if i is not None))
+    rows = {}
+    for start in range(0, len(ids), IN_FILTER_CHUNK_SIZE):
+        query = db.table(table).select(columns).in_(key, ids[start:start + IN_FILTER_CHUNK_SIZE])
+        for column, value in filters.items():
+            query = query.eq(column, value)
+        result = query.execute()
+        for row in result.data or []:
+            rows.setdefault(row.get(key), row)
+    return rows
+
+def _fetch_last_contacted_suppliers(farmer_id: str):
     """
     Retrieves all suppliers contacted by a farmer.
     Args:
         farmer_id (int): The farmer's ID.
     """
+    result = db.table('suppliers_contacted').select('supplier_id, pesticide_name, contact_time').eq('farmer_id', farmer_id).order('contact_time', desc=True).limit(25).execute()
+    if not result.data:
+        return []
+    supplier_ids = [row.get('supplier_id') for row in result.data]
+    # Registered suppliers come from users, the rest from shop_list
+    users = _fetch_rows_by_ids('users', 'id, name, phone, email', 'id', supplier_ids, role='supplier')
+    details = _fetch_rows_by_ids('supplier_details', 'supplier_id, shop_name, address', 'supplier_id', list(users))
+    shops = _fetch_rows_by_ids('shop_list', 'id, shop_name, address, phone, district', 'id', [i for i in supplier_ids if i not in users])
+    contacts = []
+    for row in result.data:
+        supplier_id = row.get('supplier_id')
+        supplier = users.get(supplier_id)
+        if supplier:
+            supplier_details = details.get(supplier_id, {'shop_name': None, 'address': None})
+            contacts.append({
+                'supplier_id': supplier_id,
+                'supplier_name': supplier.get('name'),
+                'shop_name': supplier_details.get('shop_name'),
+                'address': supplier_details.get('address'),
+                'pesticide': row.get('pesticide_name'),
+                'contact_time': row.get('contact_time')
+            })
+        elif supplier_id in shops:
+            # Unregistered supplier from shop_list
+            shop = shops[supplier_id]
+            contacts.append({
+                'supplier_id': supplier_id,
+                'supplier_name': format_shop_value(shop.get('shop_name')),
+                'shop_name': format_shop_value(shop.get('shop_name')),
+                'address': format_shop_value(shop.get('address')),
+                'phone': format_shop_value(shop.get('phone')),
+                'district': format_shop_value(shop.get('district')),
+                'pesticide': row.get('pesticide_name'),
+                'contact_time': row.get('contact_time')
+            })
+        else:
+            print(f"Error: Supplier with ID {supplier_id} not found in users or shop_list.")
+    return contacts
+
+def get_last_contacted_suppliers(farmer_id: str):
+    """
+    Retrieves all suppliers contacted by a farmer, or an empty list when the lookup fails.
+    Args:
+        farmer_id (int): The farmer's ID.
+    """
     try:
-        result = db.table('suppliers_contacted').select('supplier_id, pesticide_name, contact_time').eq('farmer_id', farmer_id).order('contact_time', desc=True).limit(25).execute()
-        if not result.data:
-            return []
-        contacts = []
-        for row in result.data:
-            supplier_id = row.get('supplier_id')
-            # Try users table first
-            supplier_result = db.table('users').select('name, phone, email').eq('id', supplier_id).eq('role', 'supplier').limit(1).execute()
-            if supplier_result.data:
-                supplier = supplier_result.data[0]
-                supplier_detail = db.table('supplier_details').select('shop_name, address').eq('supplier_id', supplier_id).limit(1).execute()
-                supplier_details = supplier_detail.data[0] if supplier_detail.data else {'shop_name': None, 'address': None}
-                contacts.append({
-                    'supplier_id': supplier_id,
-                    'supplier_name': supplier.get('name'),
-                    'shop_name': supplier_details.get('shop_name'),
-                    'address': supplier_details.get('address'),
-                    'pesticide': row.get('pesticide_name'),
-                    'contact_time': row.get('contact_time')
-                })
-            else:
-                # Try shop_list for unregistered suppliers
-                shop_result = db.table('shop_list').select('shop_name, address, phone, district').eq('id', supplier_id).limit(1).execute()
-                if shop_result.data:
-                    shop = shop_result.data[0]
-                    def format_shop_value(val):
-                        return val if val not in [None, '', 'null'] else 'Not Available'
-                    contacts.append({
-                        'supplier_id': supplier_id,
-                        'supplier_name': format_shop_value(shop.get('shop_name')),
-                        'shop_name': format_shop_value(shop.get('shop_name')),
-                        'address': format_shop_value(shop.get('address')),
-                        'phone': format_shop_value(shop.get('phone')),
-                        'district': format_shop_value(shop.get('district')),
-                        'pesticide': row.get('pesticide_name'),
-                        'contact_time': row.get('contact_time')
-                    })
-                else:
-                    print(f"Error: Supplier with ID {supplier_id} not found in users or shop_list.")
-                    continue
-        return contacts
+        return _fetch_last_contacted_suppliers(farmer_id)
     except Exception as e:
         print(f"Error retrieving contacted suppliers: {e}")
         return []
@@ -551,19 +1211,60 @@ def get_contacts_for_supplier(supplier_id: str):
         print(f"Error retrieving contacts for supplier: {e}")
         return []
 
-def get_supplier_inventory(supplier_id):
+def get_contacts_for_supplier_page(supplier_id: str, limit=None, cursor: str = None):
+    """
+    Retrieves one page of a supplier's contact records, newest first.
+
+    Args:
+        supplier_id (str): The supplier's ID.
+        limit (int, optional): The page size, capped at PAGE_SIZE_MAX.
+        cursor (str, optional): The next_cursor returned with the previous page.
+
+    Raises:
+        ValueError: If limit or cursor is invalid.
+    """
+    limit = page_size(limit)
+    if cursor:
+        decode_cursor(cursor)
+    try:
+        query = db.table('suppliers_contacted').select('id, farmer_id, pesticide_name, contact_time').eq('supplier_id', supplier_id)
+        rows, next_cursor = _keyset_page(query, 'contact_time', limit, cursor)
+        contacts = [
+            {
+                'farmer_id': row.get('farmer_id'),
+                'pesticide_name': row.get('pesticide_name'),
+                'contact_time': row.get('contact_time')
+            }
+            for row in rows
+        ]
+        return {'contacts': contacts, 'next_cursor': next_cursor}
+    except Exception as e:
+        print(f"Error retrieving contacts page for supplier: {e}")
+        return {'contacts': [], 'next_cursor': None}
+
+@cached(inventory_cache, key=lambda supplier_id: supplier_id)
+def _fetch_supplier_inventory(supplier_id):
     """
     Retrieves supplier inventory information.
 
+    Args:
+        supplier_id: The supplier's ID (string UUID).
+    """
+    result = db.table('pesticide_listings').select('*').eq('supplier_id', supplier_id).execute()
+    
+    if result.data:
+        return result.data
+    return []
+
+def get_supplier_inventory(supplier_id):
+    """
+    Retrieves supplier inventory information, or an empty list when the lookup fails.
+
     Args:
         supplier_id: The supplier's ID (string UUID).
     """
     try:
-        result = db.table('pesticide_listings').select('*').eq('supplier_id', supplier_id).execute()
-        
-        if result.data:
-            return result.data
-        return []
+        return _fetch_supplier_inventory(supplier_id)
     except Exception as e:
         print(f"Error retrieving supplier inventory: {e}")
         return []
@@ -604,6 +1305,9 @@ def update_inventory(price: float, stock: int, pesticide: str, name: str, suppli
                 'name': name,
                 'stock': stock
             }).execute()
+        inventory_cache.delete(supplier_id)
+        supplier_dashboard_cache.delete(supplier_id)
+        add_pesticide_names([pesticide])
         
         if result.data:
             print(f"Inventory updated successfully for supplier ID {supplier_id}.")
@@ -615,25 +1319,264 @@ def update_inventory(price: float, stock: int, pesticide: str, name: str, suppli
         print(f"An unexpected error occurred during inventory update: {e}")
         return False
 
-def get_supplier_details(pesticide_name: str):
+def validate_inventory_item(item):
+    """
+    Validates one inventory item and returns the pesticide_listings fields to write.
+
+    Args:
+        item (dict): An item with pesticide, price, stock and an optional name.
+
+    Returns:
+        tuple: The cleaned fields, or None and an error message.
+    """
+    if not isinstance(item, dict):
+        return None, "Item must be an object"
+    pesticide = item.get('pesticide')
+    if not isinstance(pesticide, str) or not pesticide.strip():
+        return None, "Pesticide name is required"
+    try:
+        price = float(item.get('price'))
+        stock = int(item.get('stock'))
+    except (TypeError, ValueError):
+        return None, "Price must be a number and stock an integer"
+    if price < 0 or stock < 0:
+        return None, "Price and stock cannot be negative"
+    return {
+        'pesticide': pesticide.strip(),
+        'price': price,
+        'stock': stock,
+        'name': item.get('name')
+    }, None
+
+def upsert_inventory_rows(supplier_id: str, rows):
+    """
+    Writes inventory rows for a supplier with bulk upserts on (supplier_id, pesticide).
+
+    Args:
+        supplier_id (str): The supplier's ID.
+        rows (list): (key, fields) pairs, where fields come from validate_inventory_item.
+
+    Returns:
+        dict: An error message per key whose chunk failed to write.
+    """
+    errors = {}
+    for start in range(0, len(rows), BULK_CHUNK_SIZE):
+        chunk = rows[start:start + BULK_CHUNK_SIZE]
+        try:
+            db.table('pesticide_listings').upsert(
+                [dict(fields, supplier_id=supplier_id) for _, fields in chunk],
+                on_conflict='supplier_id,pesticide'
+            ).execute()
+        except Exception as e:
+            print(f"Error upserting inventory chunk for supplier ID {supplier_id}: {e}")
+            for key, _ in chunk:
+                errors[key] = str(e)
+    inventory_cache.delete(supplier_id)
+    supplier_dashboard_cache.delete(supplier_id)
+    add_pesticide_names(fields['pesticide'] for _, fields in rows)
+    return errors
+
+def bulk_update_inventory(supplier_id: str, items):
+    """
+    Adds or updates many inventory items for a supplier in a few round trips.
+
+    The supplier is checked once and all valid items are written with bulk
+    upserts of BULK_CHUNK_SIZE rows. When a pesticide appears more than once,
+    the last occurrence is written.
+
+    Args:
+        supplier_id (str): The supplier's ID.
+        items (list): Items with pesticide, price, stock and an optional name.
+
+    Returns:
+        dict: The overall status and a result per item, in request order.
+    """
+    supplier_result = db.table('users').select('id').eq('id', supplier_id).eq('role', 'supplier').limit(1).execute()
+    if not supplier_result.data:
+        print(f"Error: Supplier with ID {supplier_id} not found.")
+        return {"status": "error", "message": "Supplier not found", "results": []}
+
+    results = []
+    latest = {}
+    for index, item in enumerate(items):
+        fields, error = validate_inventory_item(item)
+        results.append({
+            'index': index,
+            'pesticide': item.get('pesticide') if isinstance(item, dict) else None,
+            'status': 'error' if error else 'success',
+            'message': error
+        })
+        if fields:
+            if fields['pesticide'] in latest:
+                earlier = latest[fields['pesticide']][0]
+                results[earlier].update(status='skipped', message='Superseded by a later item')
+            latest[fields['pesticide']] = (index, fields)
+
+    errors = upsert_inventory_rows(supplier_id, list(latest.values()))
+    for index, message in errors.items():
+        results[index].update(status='error', message=message)
+
+    written = sum(1 for r in results if r['status'] == 'success')
+    print(f"Bulk inventory update for supplier ID {supplier_id}: {written}/{len(items)} items written.")
+    return {"status": "success", "message": f"{written} items updated", "results": results}
+
+INVENTORY_IMPORT_FORMATS = ('csv', 'xlsx')
+
+def _read_inventory_csv(stream):
+    """
+    Returns the lower-cased header of an inventory CSV file and an iterator over its rows as dicts.
+    """
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    header = [column.strip().lower() for column in reader.fieldnames or []]
+    reader.fieldnames = header
+    return header, reader
+
+def _read_inventory_xlsx(stream):
+    """
+    Returns the lower-cased header of the first worksheet of an XLSX file and an iterator over its rows as dicts.
+
+    The workbook is opened read-only, so rows are parsed as they are iterated
+    instead of loading the whole sheet. Fully empty rows are yielded as empty dicts.
+    """
+    workbook = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+    rows = workbook.worksheets[0].iter_rows(values_only=True)
+    header = ['' if value is None else str(value).strip().lower() for value in next(rows, ())]
+
+    def generate():
+        try:
+            for values in rows:
+                if all(value is None for value in values):
+                    yield {}
+                    continue
+                row = {}
+                for column, value in zip(header, values):
+                    # Numeric cells stay numbers for price and stock; everything else is read as text
+                    if value is None:
+                        value = ''
+                    elif not (column in ('price', 'stock') and isinstance(value, (int, float))):
+                        value = str(value)
+                    row[column] = value
+                yield row
+        finally:
+            workbook.close()
+
+    return header, generate()
+
+def import_inventory(supplier_id: str, stream, fmt: str = 'csv'):
+    """
+    Imports a supplier's inventory from a CSV or XLSX file with pesticide, price, stock and optional name columns.
+
+    The file is read row by row and written in upserts of BULK_CHUNK_SIZE rows,
+    so memory depends on the chunk size rather than the file size. A row followed
+    by another row for the same pesticide in the same chunk is skipped, as in
+    bulk_update_inventory. Only the first IMPORT_MAX_ERRORS row errors and skipped
+    rows are listed.
+
+    Args:
+        supplier_id (str): The supplier's ID.
+        stream: A binary file-like object with the file contents; XLSX files must be seekable.
+        fmt (str): 'csv' or 'xlsx'.
+
+    Returns:
+        dict: The status, row counts, row-level errors and skipped rows (row numbers count the header as row 1).
+    """
+    if fmt not in INVENTORY_IMPORT_FORMATS:
+        return {"status": "error", "code": 2, "message": f"Unsupported import format {fmt}"}
+    supplier_result = db.table('users').select('id').eq('id', supplier_id).eq('role', 'supplier').limit(1).execute()
+    if not supplier_result.data:
+        print(f"Error: Supplier with ID {supplier_id} not found.")
+        return {"status": "error", "code": 1, "message": "Supplier not found"}
+
+    if fmt == 'xlsx':
+        try:
+            header, reader = _read_inventory_xlsx(stream)
+        except Exception as e:
+            print(f"Error opening inventory XLSX for supplier ID {supplier_id}: {e}")
+            return {"status": "error", "code": 2, "message": "Unreadable XLSX file"}
+    else:
+        header, reader = _read_inventory_csv(stream)
+    missing = {'pesticide', 'price', 'stock'} - set(header)
+    if missing:
+        return {"status": "error", "code": 2, "message": f"Missing columns: {', '.join(sorted(missing))}"}
+
+    summary = {
+        "status": "success", "rows_read": 0, "rows_written": 0, "rows_skipped": 0, "error_count": 0,
+        "errors": [], "skipped": []
+    }
+
+    def add_error(row_number, message):
+        summary['error_count'] += 1
+        if len(summary['errors']) < IMPORT_MAX_ERRORS:
+            summary['errors'].append({'row': row_number, 'message': message})
+
+    def flush(chunk):
+        # Later rows for the same pesticide win, as they would if written one by one
+        latest = {}
+        for row_number, fields in chunk:
+            if fields['pesticide'] in latest:
+                summary['rows_skipped'] += 1
+                if len(summary['skipped']) < IMPORT_MAX_ERRORS:
+                    summary['skipped'].append({'row': latest[fields['pesticide']][0], 'message': 'Superseded by a later row'})
+            latest[fields['pesticide']] = (row_number, fields)
+        rows = list(latest.values())
+        errors = upsert_inventory_rows(supplier_id, rows)
+        for row_number, message in errors.items():
+            add_error(row_number, message)
+        summary['rows_written'] += len(rows) - len(errors)
+
+    chunk = []
+    try:
+        for row_number, row in enumerate(reader, 2):
+            if not row:
+                continue
+            summary['rows_read'] += 1
+            fields, error = validate_inventory_item(row)
+            if error:
+                add_error(row_number, error)
+                continue
+            chunk.append((row_number, fields))
+            if len(chunk) >= BULK_CHUNK_SIZE:
+                flush(chunk)
+                chunk = []
+        if chunk:
+            flush(chunk)
+    except (UnicodeDecodeError, csv.Error) as e:
+        print(f"Error reading inventory CSV for supplier ID {supplier_id}: {e}")
+        add_error(summary['rows_read'] + 2, f"Unreadable CSV: {e}")
+        summary['status'] = 'error'
+        summary['message'] = 'Import stopped at an unreadable row'
+
+    summary['errors_truncated'] = summary['error_count'] > len(summary['errors'])
+    summary['skipped_truncated'] = summary['rows_skipped'] > len(summary['skipped'])
+    print(f"Inventory import for supplier ID {supplier_id}: {summary['rows_written']}/{summary['rows_read']} rows written.")
+    return summary
+
+def get_supplier_details(pesticide_name: str, fuzzy: bool = False):
     """
     Returns a list of suppliers who have the given pesticide.
 
+    Suppliers are resolved with bulk lookups, so the number of queries does not
+    grow with the number of listings.
+
     Args:
         pesticide_name (str): The name of the pesticide.
+        fuzzy (bool): Resolve the name to the closest known pesticide first.
     """
     try:
+        if fuzzy:
+            pesticide_name = resolve_pesticide_name(pesticide_name)
         suppliers = []
         # Registered suppliers
         result = db.table('pesticide_listings').select('supplier_id, price, stock').eq('pesticide', pesticide_name).execute()
         if result.data:
+            supplier_ids = [row.get('supplier_id') for row in result.data]
+            users = _fetch_rows_by_ids('users', 'id, name', 'id', supplier_ids, role='supplier')
+            details = _fetch_rows_by_ids('supplier_details', 'supplier_id, shop_name, address', 'supplier_id', list(users))
             for row in result.data:
                 supplier_id = row.get('supplier_id')
-                supplier_result = db.table('users').select('name').eq('id', supplier_id).eq('role', 'supplier').limit(1).execute()
-                if supplier_result.data:
-                    supplier = supplier_result.data[0]
-                    supplier_detail = db.table('supplier_details').select('shop_name, address').eq('supplier_id', supplier_id).limit(1).execute()
-                    supplier_details = supplier_detail.data[0] if supplier_detail.data else {'shop_name': None, 'address': None}
+                supplier = users.get(supplier_id)
+                if supplier:
+                    supplier_details = details.get(supplier_id, {'shop_name': None, 'address': None})
                     suppliers.append({
                         'supplier_id': supplier_id,
                         'supplier_name': supplier.get('name'),
@@ -645,12 +1588,10 @@ def get_supplier_details(pesticide_name: str):
         # Unregistered suppliers from product_list/shop_list
         product_result = db.table('products_list').select('supplier_id, pesticide, price, stock').eq('pesticide', pesticide_name).execute()
         if product_result.data:
+            shops = _fetch_rows_by_ids('shop_list', 'id, shop_name, address, phone, district', 'id', [row.get('supplier_id') for row in product_result.data])
             for row in product_result.data:
                 supplier_id = row.get('supplier_id')
-                shop_result = db.table('shop_list').select('shop_name, address, phone, district').eq('id', supplier_id).limit(1).execute()
-                shop = shop_result.data[0] if shop_result.data else {'shop_name': None, 'address': None, 'phone': None, 'district': None}
-                def format_shop_value(val):
-                    return val if val not in [None, '', 'null'] else 'Not Available'
+                shop = shops.get(supplier_id, {'shop_name': None, 'address': None, 'phone': None, 'district': None})
                 suppliers.append({
                     'supplier_id': supplier_id,
                     'supplier_name': format_shop_value(shop.get('shop_name')),
@@ -666,6 +1607,55 @@ def get_supplier_details(pesticide_name: str):
         print(f"Error retrieving supplier details: {e}")
         return []
 
+def get_nearby_suppliers(pesticide_name: str, latitude: float, longitude: float, radius_km: float, limit: int = 20):
+    """
+    Returns approved suppliers stocking a pesticide within radius_km of a point, nearest first.
+
+    Args:
+        pesticide_name (str): The name of the pesticide.
+        latitude (float): The farmer's latitude.
+        longitude (float): The farmer's longitude.
+        radius_km (float): The search radius, capped at NEARBY_MAX_RADIUS_KM.
+        limit (int): The maximum number of suppliers to return.
+
+    Raises:
+        ValueError: If the coordinates or radius are out of range.
+    """
+    latitude, longitude, radius_km = float(latitude), float(longitude), float(radius_km)
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError("Coordinates out of range")
+    if radius_km <= 0:
+        raise ValueError("Radius must be positive")
+    radius_km = min(radius_km, NEARBY_MAX_RADIUS_KM)
+    try:
+        result = db.table('pesticide_listings').select('supplier_id, price, stock').eq('pesticide', pesticide_name).execute()
+        listings = {}
+        for row in result.data or []:
+            listings.setdefault(row.get('supplier_id'), row)
+        nearby = get_supplier_geo_index().nearby(latitude, longitude, radius_km, allowed=set(listings))
+        supplier_ids = [supplier_id for supplier_id, _ in nearby]
+        users = _fetch_rows_by_ids('users', 'id, name', 'id', supplier_ids, role='supplier')
+        nearby = [(supplier_id, distance) for supplier_id, distance in nearby if supplier_id in users][:limit]
+        details = _fetch_rows_by_ids('supplier_details', 'supplier_id, shop_name, address, latitude, longitude', 'supplier_id', [i for i, _ in nearby])
+        suppliers = []
+        for supplier_id, distance in nearby:
+            supplier_details = details.get(supplier_id, {})
+            suppliers.append({
+                'supplier_id': supplier_id,
+                'supplier_name': users[supplier_id].get('name'),
+                'shop_name': supplier_details.get('shop_name'),
+                'address': supplier_details.get('address'),
+                'latitude': supplier_details.get('latitude'),
+                'longitude': supplier_details.get('longitude'),
+                'distance_km': round(distance, 2),
+                'price': listings[supplier_id].get('price'),
+                'stock': listings[supplier_id].get('stock')
+            })
+        return suppliers
+    except Exception as e:
+        print(f"Error retrieving nearby suppliers: {e}")
+        return []
+
 def call_supplier(supplier_id: str, farmer_id: str, pesticide: str):
     """
     Returns the phone number of the supplier with the given supplier_id.
@@ -683,6 +1673,7 @@ def call_supplier(supplier_id: str, farmer_id: str, pesticide: str):
                 'pesticide_name': pesticide
             }
             db.table('suppliers_contacted').insert(contact_details).execute()
+            supplier_dashboard_cache.delete(supplier_id)
             print(f"Supplier {supplier_id} contacted farmer {farmer_id} for pesticide {pesticide}.")
             return result.data[0]['phone']
         # Try unregistered supplier in shop_list
@@ -705,59 +1696,198 @@ def call_supplier(supplier_id: str, farmer_id: str, pesticide: str):
         print(f"Error retrieving supplier phone: {e}")
         return None
 
-def get_user_info(user_id):
+@cached(user_info_cache, key=lambda user_id: user_id)
+def _fetch_user_info(user_id):
     """
     Retrieves all user info and role-specific details.
     Args:
         user_id (int): The user's ID.
     """
+    user_result = db.table('users').select('*').eq('id', user_id).limit(1).execute()
+    if not user_result.data:
+        return None
+    user = user_result.data[0]
+    role = user.get('role', '').lower()
+    details = None
+    if role == 'farmer':
+        details_result = db.table('farmer_details').select('farm_size, main_crop, irrigation_type, soil_type').eq('farmer_id', user_id).limit(1).execute()
+        if details_result.data:
+            details = details_result.data[0]
+        else:
+            # Create default farmer details if none exist
+            details = {
+                'farm_size': None,
+                'main_crop': None,
+                'irrigation_type': None,
+                'soil_type': None,
+                
+            }
+        user['details'] = details
+    elif role == 'supplier':
+        details_result = db.table('supplier_details').select('*').eq('supplier_id', user_id).limit(1).execute()
+        if details_result.data:
+            # print(details_result.data)
+            details = details_result.data[0]
+        else:
+            # Create default supplier details if none exist
+            details = {
+                'shop_name': None,
+                'address': None,
+                'latitude': None,
+                'longitude': None,
+                'approved': False
+            }
+        user['details'] = details
+       
+    elif role == 'admin':
+        details_result = db.table('admin_details').select('*').eq('admin_id', user_id).limit(1).execute()
+        if details_result.data:
+            details = details_result.data[0]
+        user['details'] = details
+    return user
+
+def get_user_info(user_id):
+    """
+    Retrieves all user info and role-specific details, or None when the user is not found or the lookup fails.
+    Args:
+        user_id (int): The user's ID.
+    """
     try:
-        user_result = db.table('users').select('*').eq('id', user_id).limit(1).execute()
-        if not user_result.data:
-            return None
-        user = user_result.data[0]
-        role = user.get('role', '').lower()
-        details = None
-        if role == 'farmer':
-            details_result = db.table('farmer_details').select('farm_size, main_crop, irrigation_type, soil_type').eq('farmer_id', user_id).limit(1).execute()
-            if details_result.data:
-                details = details_result.data[0]
-            else:
-                # Create default farmer details if none exist
-                details = {
-                    'farm_size': None,
-                    'main_crop': None,
-                    'irrigation_type': None,
-                    'soil_type': None,
-                    
-                }
-            user['details'] = details
-        elif role == 'supplier':
-            details_result = db.table('supplier_details').select('*').eq('supplier_id', user_id).limit(1).execute()
-            if details_result.data:
-                # print(details_result.data)
-                details = details_result.data[0]
-            else:
-                # Create default supplier details if none exist
-                details = {
-                    'shop_name': None,
-                    'address': None,
-                    'latitude': None,
-                    'longitude': None,
-                    'approved': False
-                }
-            user['details'] = details
-           
-        elif role == 'admin':
-            details_result = db.table('admin_details').select('*').eq('admin_id', user_id).limit(1).execute()
-            if details_result.data:
-                details = details_result.data[0]
-            user['details'] = details
-        return user
+        return _fetch_user_info(user_id)
     except Exception as e:
         print(f"Error retrieving user info: {e}")
         return None
 
+_dashboard_executor = None
+_dashboard_executor_pid = None
+_dashboard_executor_lock = threading.Lock()
+
+def _get_dashboard_executor():
+    # Executor threads do not survive a fork, so create one per process
+    global _dashboard_executor, _dashboard_executor_pid
+    pid = os.getpid()
+    if _dashboard_executor is None or _dashboard_executor_pid != pid:
+        with _dashboard_executor_lock:
+            if _dashboard_executor is None or _dashboard_executor_pid != pid:
+                _dashboard_executor = ContextThreadPoolExecutor(max_workers=DASHBOARD_WORKERS, thread_name_prefix='dashboard')
+                _dashboard_executor_pid = pid
+    return _dashboard_executor
+
+def _section_result(future, errors: dict, name: str, default=None):
+    """
+    Waits for a dashboard section and records its failure instead of raising.
+
+    Sections must be loaded with functions that raise on failure, such as
+    _fetch_user_info rather than get_user_info, or the failure is never seen here.
+    """
+    try:
+        return future.result()
+    except Exception as e:
+        print(f"Error loading dashboard section {name}: {e}")
+        errors[name] = str(e)
+        return default
+
+def get_farmer_dashboard(farmer_id: str):
+    """
+    Retrieves everything the farmer dashboard shows in one call.
+
+    The profile, pest history, recent images and contacted suppliers are loaded
+    concurrently; schemes follow once the profile's district is known. A section
+    that fails is returned empty and named in 'errors'.
+
+    Args:
+        farmer_id (str): The farmer's ID.
+    """
+    executor = _get_dashboard_executor()
+    futures = {
+        'profile': executor.submit(_fetch_user_info, farmer_id),
+        'pest_history': executor.submit(_fetch_pest_history, farmer_id),
+        'last_pest_images': executor.submit(get_last_4_pest_images, farmer_id),
+        'last_contacted_suppliers': executor.submit(_fetch_last_contacted_suppliers, farmer_id)
+    }
+    errors = {}
+    profile = _section_result(futures['profile'], errors, 'profile')
+    if profile is None:
+        errors.setdefault('profile', 'User not found')
+        schemes = None
+    else:
+        try:
+            schemes = get_schemes_by_location(profile.get('district')) if profile.get('district') else None
+        except Exception as e:
+            print(f"Error loading dashboard section schemes: {e}")
+            errors['schemes'] = str(e)
+            schemes = None
+    return {
+        'farmer_id': farmer_id,
+        'profile': profile,
+        'pest_history': _section_result(futures['pest_history'], errors, 'pest_history', []),
+        'last_pest_images': _section_result(futures['last_pest_images'], errors, 'last_pest_images', []),
+        'last_contacted_suppliers': _section_result(futures['last_contacted_suppliers'], errors, 'last_contacted_suppliers', []),
+        'schemes': schemes,
+        'errors': errors
+    }
+
+def get_supplier_dashboard(supplier_id: str):
+    """
+    Retrieves everything the supplier dashboard shows in one call.
+
+    The profile, inventory and recent contacts are loaded concurrently, and the
+    contacting farmers' names and districts are resolved with one bulk query.
+    Complete results are cached until the supplier's next write or the TTL; a
+    section that fails is returned empty, named in 'errors' and not cached.
+
+    Args:
+        supplier_id (str): The supplier's ID.
+    """
+    found, dashboard = supplier_dashboard_cache.get(supplier_id)
+    if found:
+        return dashboard
+    generation = supplier_dashboard_cache.generation(supplier_id)
+    executor = _get_dashboard_executor()
+    futures = {
+        'profile': executor.submit(_fetch_user_info, supplier_id),
+        'inventory': executor.submit(_fetch_supplier_inventory, supplier_id),
+        'contacts': executor.submit(get_recent_contacts_for_supplier, supplier_id)
+    }
+    errors = {}
+    profile = _section_result(futures['profile'], errors, 'profile')
+    if profile is None:
+        errors.setdefault('profile', 'User not found')
+    dashboard = {
+        'supplier_id': supplier_id,
+        'profile': profile,
+        'inventory': _section_result(futures['inventory'], errors, 'inventory', []),
+        'contacts': _section_result(futures['contacts'], errors, 'contacts', []),
+        'errors': errors
+    }
+    if not errors:
+        supplier_dashboard_cache.set(supplier_id, dashboard, generation)
+    return dashboard
+
+def get_recent_contacts_for_supplier(supplier_id: str, limit: int = 25):
+    """
+    Retrieves a supplier's most recent contacts with the farmer's name and district.
+
+    Args:
+        supplier_id (str): The supplier's ID.
+        limit (int): The maximum number of contacts to return.
+    """
+    result = db.table('suppliers_contacted').select('farmer_id, pesticide_name, contact_time').eq('supplier_id', supplier_id).order('contact_time', desc=True).limit(limit).execute()
+    if not result.data:
+        return []
+    farmers = _fetch_rows_by_ids('users', 'id, name, district', 'id', [row.get('farmer_id') for row in result.data])
+    contacts = []
+    for row in result.data:
+        farmer = farmers.get(row.get('farmer_id'), {})
+        contacts.append({
+            'farmer_id': row.get('farmer_id'),
+            'farmer_name': farmer.get('name'),
+            'district': farmer.get('district'),
+            'pesticide_name': row.get('pesticide_name'),
+            'contact_time': row.get('contact_time')
+        })
+    return contacts
+
 def delete_account(user_id):
     """
     Deletes a user account and related details.
@@ -765,7 +1895,7 @@ def delete_account(user_id):
         user_id (int): The user's ID.
     """
     try:
-        user_result = db.table('users').select('id, role').eq('id', user_id).limit(1).execute()
+        user_result = db.table('users').select('id, role, email').eq('id', user_id).limit(1).execute()
         if not user_result.data:
             return False
         role = user_result.data[0].get('role', '').lower()
@@ -773,10 +1903,15 @@ def delete_account(user_id):
             db.table('farmer_details').delete().eq('farmer_id', user_id).execute()
         elif role == 'supplier':
             db.table('supplier_details').delete().eq('supplier_id', user_id).execute()
+            remove_supplier(user_id)
         elif role == 'admin':
             db.table('admin_details').delete().eq('admin_id', user_id).execute()
         
-        db.table('users').delete().eq('id', user_id).execute()
+        try:
+            db.table('users').delete().eq('id', user_id).execute()
+        finally:
+            _invalidate_user_cache(user_id, user_result.data[0].get('email'))
+            inventory_cache.delete(user_id)
         return True
     except Exception as e:
         print(f"Error deleting account: {e}")
@@ -792,24 +1927,29 @@ def update_password(old_password: str, new_password: str, user_id: str):
         user_id (int): The user's ID.
     """
     try:
-        result = db.table('users').select('password').eq('id', user_id).limit(1).execute()
+        result = db.table('users').select('password, email').eq('id', user_id).limit(1).execute()
         if not result.data:
             return {"status": "error", "message": "User not found"}
         
         current_password = result.data[0]['password']
         
-        if not bcrypt.checkpw(old_password.encode('utf-8'), current_password.encode('utf-8')):
+        if not check_password(old_password, current_password):
             return {"status": "error", "message": "Old password is incorrect"}
         
-        hashed_new_password = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        hashed_new_password = hash_password(new_password)
         
-        update_result = db.table('users').update({'password': hashed_new_password}).eq('id', user_id).execute()
+        try:
+            update_result = db.table('users').update({'password': hashed_new_password}).eq('id', user_id).execute()
+        finally:
+            _invalidate_user_cache(user_id, result.data[0].get('email'))
         
         if update_result.data:
             return {"status": "success", "message": "Password updated successfully"}
         else:
             return {"status": "error", "message": "Failed to update password"}
             
+    except HashingBusy:
+        raise
     except Exception as e:
         print(f"Error updating password: {e}")
         return {"status": "error", "message": f"Error: {str(e)}"}
@@ -822,7 +1962,7 @@ def generate_otp():
 
 def send_otp_email(user_id: str, email: str):
     """
-    Send OTP to user's email.
+    Stores a new OTP and queues it for delivery to the user's email.
 
     Args:
         user_id (str): The user's ID.
@@ -839,16 +1979,14 @@ def send_otp_email(user_id: str, email: str):
         }).execute()
         print(f"Stored OTP for {email}: {otp_code}, expires at {expires_at}")
 
-        message = Mail(
-            from_email=SENDGRID_SENDER_EMAIL,
-            to_emails=email,
+        queued = send_mail(
+            to=email,
             subject='Your One-Time Password (OTP) for AgroSaarthi',
-            html_content=f'<strong>Your OTP is: {otp_code}</strong><br>This code is valid for 5 minutes. Do not share it with anyone.'
+            html=f'<strong>Your OTP is: {otp_code}</strong><br>This code is valid for 5 minutes. Do not share it with anyone.'
         )
-        sg = SendGridAPIClient(SENDGRID_API_KEY)
-        response = sg.send(message)
-        print(f"OTP email sent to {email} with status code: {response.status_code}")
-        return True
+        if queued:
+            print(f"OTP email queued for {email}")
+        return queued
     except Exception as e:
         print(f"Error sending email: {e}")
         return False
@@ -909,9 +2047,12 @@ def verify_otp_and_reset_password(email: str, otp: str, new_password: str):
         if current_time > expiry_time:
             return {"status": "error", "message": "OTP has expired"}
         
-        hashed_password = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        hashed_password = hash_password(new_password)
         
-        update_result = db.table('users').update({'password': hashed_password}).eq('id', user_id).execute()
+        try:
+            update_result = db.table('users').update({'password': hashed_password}).eq('id', user_id).execute()
+        finally:
+            _invalidate_user_cache(user_id, email)
         
         if not update_result.data:
             return {"status": "error", "message": "Failed to update password"}
@@ -920,61 +2061,225 @@ def verify_otp_and_reset_password(email: str, otp: str, new_password: str):
         
         return {"status": "success", "message": "Password reset successfully"}
         
+    except HashingBusy:
+        raise
     except Exception as e:
         print(f"Error in verify OTP and reset password: {e}")
         return {"status": "error", "message": f"Error: {str(e)}"}
 
-def upload_image(image_file, pest_name, user_id=None):
+def _find_stored_image(digest: str):
     """
-    Uploads an image to Supabase Storage and returns the public URL.
-    
+    Returns the remembered upload with the given content hash if its objects still exist.
+
+    Entries whose display image has been deleted from storage are dropped, so the
+    image is uploaded again instead of handing out a dead URL.
+
+    Args:
+        digest (str): The SHA-256 of the uploaded bytes.
+    """
+    found, stored = image_hash_cache.get(digest)
+    if not found:
+        return None
+    if image_storage.exists(stored['paths']['display']):
+        return stored
+    image_hash_cache.delete(digest)
+    record_stale_dedup()
+    print(f"Stored image {stored['filename']} no longer exists, uploading again.")
+    return None
+
+
+def upload_image(image_file, pest_name, user_id=None, background=False):
+    """
+    Uploads a pest photo to Supabase Storage along with a display image and a thumbnail.
+
+    The upload is read in chunks up to UPLOAD_MAX_BYTES. The original is kept as sent,
+    while the display image and thumbnail are downscaled JPEGs stored under
+    pest-images/display/ and pest-images/thumbs/ with the same name. Bytes that were
+    already uploaded recently are not stored again; the earlier URLs are returned
+    with 'deduplicated' set.
+
+    With background set, only the image header is checked before the file is handed
+    to the upload queue. The URLs are returned straight away along with a job_id for
+    the status endpoint, and status is 'queued' until a worker has stored the objects.
+
     Args:
         image_file: The uploaded file object
         pest_name (str): Name of the pest for filename
         user_id (str, optional): User ID for logging
-    
+        background (bool): Queue the storage upload instead of waiting for it.
+
     Returns:
-        dict: Contains success status, filename, and public_url
+        dict: Contains success status, filename, and the public URLs. public_url is the
+        display image, which is what gets logged with the pest detection. On failure,
+        'code' is 'too_large', 'invalid_image' or 'error'.
+
+    Raises:
+        UploadQueueFull: If background is set and the upload queue is full.
     """
     try:
-        if not image_file.filename:
-            print("here")
-            return {"status": "error", "message": "Invalid filename"}
-            
-        
-        file_extension = image_file.filename.rsplit('.', 1)[1].lower()
-        unique_filename = f"{pest_name}_{uuid.uuid4()}.{file_extension}"
-        
-        # Define the path in your Supabase bucket
-        storage_path = f"pest-images/{unique_filename}"
-        print("here1")
+        if not image_file.filename or '.' not in image_file.filename:
+            return {"status": "error", "code": "invalid_image", "message": "Invalid filename"}
 
-        image_bytes = image_file.read()
+        file_extension = image_file.filename.rsplit('.', 1)[1].lower()
+        stem = f"{pest_name}_{uuid.uuid4()}"
+        unique_filename = f"{stem}.{file_extension}"
+        paths = image_paths(stem, file_extension)
+        urls = {variant: image_storage.public_url(path) for variant, path in paths.items()}
+
+        spool, size, digest = read_capped(image_file.stream)
+        with spool:
+            stored = _find_stored_image(digest)
+            if stored:
+                record_dedup(stored['bytes'])
+                print(f"Image {stored['filename']} already stored, skipped {stored['bytes']} bytes.")
+                return {
+                    "status": "success",
+                    "message": "Image already uploaded",
+                    "filename": stored['filename'],
+                    "public_url": stored['urls']['display'],
+                    "thumbnail_url": stored['urls']['thumbnail'],
+                    "original_url": stored['urls']['original'],
+                    "deduplicated": True
+                }
+            if background:
+                probe_image(spool)
+                job = upload_queue.submit(spool, paths, urls, image_file.content_type, digest=digest, size=size)
+                print(f"Queued upload {job['id']} ({size} bytes) for {urls['display']}")
+                return {
+                    "status": "queued",
+                    "message": "Image accepted for upload",
+                    "job_id": job['id'],
+                    "filename": unique_filename,
+                    "public_url": urls['display'],
+                    "thumbnail_url": urls['thumbnail'],
+                    "original_url": urls['original'],
+                    "deduplicated": False
+                }
+            variants = make_variants(spool)
+            spool.seek(0)
+            image_storage.upload(paths['original'], spool, image_file.content_type)
+
+        for variant in ('display', 'thumbnail'):
+            image_storage.upload(paths[variant], variants[variant], "image/jpeg")
+        image_hash_cache.set(digest, {
+            'filename': unique_filename,
+            'paths': paths,
+            'urls': urls,
+            'bytes': size + len(variants['display']) + len(variants['thumbnail'])
+        })
 
-        db.storage.from_("pest-images").upload(
-            storage_path,
-            image_bytes,
-            {"content-type": image_file.content_type}
-        )
-        # Upload the file to Supabase Storage
-        
-        print("here2")
-        # Get the public URL for the uploaded image
-        public_url = db.storage.from_("pest-images").get_public_url(storage_path)
-        print("here3")
         if user_id:
-            print(f"User {user_id} uploaded image. Public URL: {public_url}")
+            print(f"User {user_id} uploaded image ({size} bytes). Public URL: {urls['display']}")
         else:
-            print(f"Image uploaded to {public_url}")
+            print(f"Image uploaded to {urls['display']} ({size} bytes)")
 
         return {
             "status": "success",
             "message": "Image uploaded successfully",
             "filename": unique_filename,
-            "public_url": public_url
+            "public_url": urls['display'],
+            "thumbnail_url": urls['thumbnail'],
+            "original_url": urls['original'],
+            "deduplicated": False
         }
-        print("here4")
 
+    except UploadQueueFull:
+        raise
+    except UploadTooLarge as e:
+        return {"status": "error", "code": "too_large", "message": str(e)}
+    except ValueError as e:
+        return {"status": "error", "code": "invalid_image", "message": str(e)}
     except Exception as e:
         print(f"Error uploading image: {e}")
-        return {"status": "error", "message": f"Failed to upload image: {str(e)}"}
+        return {"status": "error", "code": "error", "message": f"Failed to upload image: {str(e)}"}
+
+
+_upload_executor = None
+_upload_executor_pid = None
+_upload_executor_lock = threading.Lock()
+
+def _get_upload_executor():
+    # Executor threads do not survive a fork, so create one per process
+    global _upload_executor, _upload_executor_pid
+    pid = os.getpid()
+    if _upload_executor is None or _upload_executor_pid != pid:
+        with _upload_executor_lock:
+            if _upload_executor is None or _upload_executor_pid != pid:
+                _upload_executor = ContextThreadPoolExecutor(max_workers=UPLOAD_BATCH_WORKERS, thread_name_prefix='upload')
+                _upload_executor_pid = pid
+    return _upload_executor
+
+
+def upload_pest_images(user_id: str, items):
+    """
+    Uploads several pest photos at once and logs a detection for each of them.
+
+    The images are uploaded concurrently on a pool of UPLOAD_BATCH_WORKERS threads
+    shared by all requests, and the detections of every stored image are written
+    with one bulk insert into pest_inference_results.
+
+    Args:
+        user_id (str): The ID of the user who took the photos.
+        items (list): One dict per photo with 'image' (the uploaded file object),
+            'pest_name', 'confidence' and an optional 'pesticide'.
+
+    Returns:
+        dict: The overall status and a result per photo, in request order. Each result
+        has the upload's URLs and whether its detection was logged.
+    """
+    results = []
+    pending = {}
+    executor = _get_upload_executor()
+    for index, item in enumerate(items):
+        result = {'index': index, 'pest_name': item.get('pest_name'), 'status': 'error', 'logged': False}
+        results.append(result)
+        # The image URL is not known yet, so validate the rest of the entry with a placeholder
+        error = validate_pest_detection(user_id, 'pending', item.get('pest_name'), item.get('confidence'))
+        if error:
+            result['message'] = error
+            continue
+        pending[index] = executor.submit(upload_image, item['image'], item['pest_name'], user_id)
+
+    rows = []
+    for index, future in pending.items():
+        result = results[index]
+        try:
+            upload = future.result()
+        except Exception as e:
+            upload = {"status": "error", "message": f"Failed to upload image: {str(e)}"}
+        if upload['status'] != 'success':
+            result['message'] = upload['message']
+            continue
+        result.update({
+            'status': 'success',
+            'filename': upload['filename'],
+            'public_url': upload['public_url'],
+            'thumbnail_url': upload['thumbnail_url'],
+            'original_url': upload['original_url'],
+            'deduplicated': upload['deduplicated']
+        })
+        rows.append((index, {
+            'user_id': user_id,
+            'image_url': upload['public_url'],
+            'pest_name': items[index]['pest_name'],
+            'confidence': items[index]['confidence'],
+            'pesticide': items[index].get('pesticide') or "Not specified"
+        }))
+
+    if rows:
+        try:
+            inserted = db.table('pest_inference_results').insert([row for _, row in rows]).execute().data or []
+            for index, _ in rows[:len(inserted)]:
+                results[index]['logged'] = True
+            if len(inserted) != len(rows):
+                print(f"Error: Only {len(inserted)} of {len(rows)} pest detections were logged.")
+        except Exception as e:
+            print(f"Error logging pest detections: {e}")
+        for index, _ in rows:
+            if not results[index]['logged']:
+                results[index]['message'] = "Image uploaded but the detection was not logged"
+
+    uploaded = sum(1 for r in results if r['status'] == 'success')
+    logged = sum(1 for r in results if r['logged'])
+    print(f"Batch upload for User ID {user_id}: {uploaded}/{len(items)} images uploaded, {logged} detections logged.")
+    return {"status": "success", "message": f"{uploaded} images uploaded", "results": results}
@@ -0,0 +1,95 @@
+import atexit
+import os
+import threading
+
+import certifi
+import urllib3
+import weatherapi
+from urllib3.util.retry import Retry
+from dotenv import load_dotenv
+
+from config import (
+    WEATHER_POOL_SIZE, WEATHER_CONNECT_TIMEOUT, WEATHER_READ_TIMEOUT, WEATHER_RETRIES, WEATHER_RETRY_BACKOFF
+)
+
+load_dotenv()
+
+WEATHER_API_KEY = os.getenv("WEATHER_API_KEY")
+
+# Timeout passed to every API call as (connect, read) seconds
+REQUEST_TIMEOUT = (WEATHER_CONNECT_TIMEOUT, WEATHER_READ_TIMEOUT)
+
+configuration = weatherapi.Configuration()
+configuration.api_key['key'] = WEATHER_API_KEY
+configuration.connection_pool_maxsize = WEATHER_POOL_SIZE
+
+_api = None
+_api_pid = None
+_lock = threading.Lock()
+
+
+def _build_api():
+    """
+    Builds an APIsApi whose HTTP pool keeps connections alive and retries idempotent failures.
+    """
+    api_client = weatherapi.ApiClient(configuration)
+    # Replace the generated client's pool manager with one that carries our retry policy
+    api_client.rest_client.pool_manager = urllib3.PoolManager(
+        num_pools=2,
+        maxsize=WEATHER_POOL_SIZE,
+        block=False,
+        cert_reqs='CERT_REQUIRED',
+        ca_certs=configuration.ssl_ca_cert or certifi.where(),
+        timeout=urllib3.Timeout(connect=WEATHER_CONNECT_TIMEOUT, read=WEATHER_READ_TIMEOUT),
+        retries=Retry(
+            total=WEATHER_RETRIES,
+            backoff_factor=WEATHER_RETRY_BACKOFF,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['GET']),
+            raise_on_status=False
+        )
+    )
+    return weatherapi.APIsApi(api_client)
+
+
+def get_weather_api():
+    """
+    Returns the process-wide weather API client, creating it on first use.
+
+    The client is rebuilt after a fork so worker processes never share
+    sockets with their parent.
+    """
+    global _api, _api_pid
+    pid = os.getpid()
+    if _api is not None and _api_pid == pid:
+        return _api
+    with _lock:
+        if _api is None or _api_pid != pid:
+            _api = _build_api()
+            _api_pid = pid
+        return _api
+
+
+def close_weather_api():
+    """
+    Closes the pooled connections of the weather API client.
+    """
+    global _api, _api_pid
+    with _lock:
+        if _api is not None and _api_pid == os.getpid():
+            _api.api_client.rest_client.pool_manager.clear()
+        _api = None
+        _api_pid = None
+
+
+def _reset_after_fork():
+    # The child inherits the parent's lock and sockets; drop both without closing them
+    global _api, _api_pid, _lock
+    _lock = threading.Lock()
+    _api = None
+    _api_pid = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+atexit.register(close_weather_api)
@@ -0,0 +1,286 @@
+import atexit
+import json
+import os
+import threading
+import time
+
+from postgrest.exceptions import APIError
+
+from spool import SpoolDir
+
+from config import (
+    db, BULK_CHUNK_SIZE, WRITE_BEHIND_MAX_ROWS, WRITE_BEHIND_FLUSH_MS, WRITE_BEHIND_MAX_PENDING,
+    WRITE_BEHIND_BLOCK_SECONDS, WRITE_BEHIND_MAX_ATTEMPTS, WRITE_BEHIND_RETRY_AFTER, WRITE_BEHIND_FSYNC,
+    WRITE_BEHIND_JOURNAL_DIR
+)
+
+
+class WriteBufferFull(Exception):
+    """
+    Raised when WRITE_BEHIND_MAX_PENDING rows are already waiting to be written.
+
+    Args:
+        retry_after (int): Seconds the client should wait before retrying.
+    """
+
+    def __init__(self, retry_after: int = WRITE_BEHIND_RETRY_AFTER):
+        super().__init__("Too many writes pending, try again later")
+        self.retry_after = retry_after
+
+
+class WriteBuffer:
+    """
+    Collects single-row inserts per table and writes them as bulk inserts in the background.
+
+    A flush runs once max_rows rows are pending or flush_ms has passed since the
+    previous one. Every row is appended to a journal segment in the journal
+    directory before add() returns, and a segment is removed only after all of its
+    rows were inserted, so rows accepted before a crash are written by the next
+    process. Delivery is at least once: a crash in the middle of a flush can
+    insert some rows twice.
+
+    A row the database rejects on its own (an APIError for a single-row insert,
+    e.g. a constraint violation) is moved to dead.jsonl in the journal directory
+    straight away, since retrying cannot help. Rows whose insert failed for any
+    other reason, such as a lost connection, are retried with exponential backoff
+    for up to WRITE_BEHIND_MAX_ATTEMPTS flushes and then moved to dead.jsonl.
+
+    Args:
+        max_rows (int): Pending rows that trigger a flush.
+        flush_ms (float): The longest time a row waits before a flush, in milliseconds.
+        max_pending (int): Pending rows above which add() blocks and then raises WriteBufferFull.
+        journal_dir (str): The directory journal segments are written to.
+    """
+
+    def __init__(self, max_rows: int = WRITE_BEHIND_MAX_ROWS, flush_ms: float = WRITE_BEHIND_FLUSH_MS,
+                 max_pending: int = WRITE_BEHIND_MAX_PENDING, journal_dir: str = WRITE_BEHIND_JOURNAL_DIR):
+        self.max_rows = max_rows
+        self.flush_interval = flush_ms / 1000
+        self.max_pending = max_pending
+        self.journal_dir = journal_dir
+        # Segments are named <sequence>.<owner>.jsonl
+        self._spool = SpoolDir(journal_dir, 'jsonl')
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._callbacks = {}
+        self._pid = None
+        self._reset()
+
+    def _reset(self):
+        # table -> list of [row, attempts]
+        self._pending = {}
+        self._count = 0
+        self._segments = []
+        self._journal = None
+        self._sequence = 0
+        self._closed = False
+        self._failures = 0
+        self._flushing = threading.Lock()
+
+    def on_insert(self, table: str, callback):
+        """
+        Registers a function called with the inserted rows after each bulk insert into table.
+        """
+        self._callbacks[table] = callback
+
+    def start(self):
+        """
+        Starts the flush thread of this process and loads the journaled rows of
+        processes that are no longer running. Safe to call more than once.
+        """
+        # The flush thread does not survive a fork, so start one per process
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._reset()
+            self._pid = os.getpid()
+            self._spool.ensure()
+            self._open_segment()
+            self._recover_journal()
+            threading.Thread(target=self._run, name='write-behind', daemon=True).start()
+
+    def _next_sequence(self, _=None):
+        # Callers hold self._lock
+        self._sequence += 1
+        return str(self._sequence)
+
+    def _open_segment(self):
+        # Callers hold self._lock
+        path = self._spool.item_path(self._next_sequence())
+        self._journal = open(path, 'a', encoding='utf-8')
+        self._segments.append(path)
+
+    def _append_journal(self, entries):
+        # Callers hold self._lock
+        for table, row in entries:
+            self._journal.write(json.dumps({'table': table, 'row': row}) + '\n')
+        self._journal.flush()
+        if WRITE_BEHIND_FSYNC:
+            os.fsync(self._journal.fileno())
+
+    def _recover_journal(self):
+        """
+        Loads the rows of journal segments left behind by processes that are no longer running.
+        """
+        # Sequences only need to be unique per owner, so claimed segments get new ones
+        for _, path in self._spool.claim_orphans(rename=self._next_sequence):
+            recovered = 0
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A crash can leave the last line half written
+                        continue
+                    self._pending.setdefault(entry['table'], []).append([entry['row'], 0])
+                    recovered += 1
+            self._count += recovered
+            self._segments.append(path)
+            print(f"Recovered {recovered} journaled rows from {os.path.basename(path)}.")
+
+    def add(self, table: str, row: dict):
+        """
+        Journals a row and queues it for the next bulk insert into table.
+
+        Raises:
+            WriteBufferFull: If the buffer stays full for WRITE_BEHIND_BLOCK_SECONDS.
+        """
+        self.start()
+        with self._lock:
+            if self._count >= self.max_pending:
+                deadline = time.monotonic() + WRITE_BEHIND_BLOCK_SECONDS
+                while self._count >= self.max_pending:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise WriteBufferFull()
+                    self._not_full.wait(remaining)
+            self._append_journal([(table, row)])
+            self._pending.setdefault(table, []).append([row, 0])
+            self._count += 1
+            if self._count >= self.max_rows and not self._failures:
+                self._wakeup.notify()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if self._failures:
+                    # Back off while the database keeps failing instead of retrying every interval
+                    self._wakeup.wait(min(self.flush_interval * 2 ** self._failures, 30))
+                elif self._count < self.max_rows and not self._closed:
+                    self._wakeup.wait(self.flush_interval)
+                if self._closed:
+                    return
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing buffered writes: {e}")
+
+    def _insert(self, table: str, chunk):
+        """
+        Inserts a chunk of entries.
+
+        A chunk the database rejects is split in halves, so one bad row does not
+        hold back the rest of its chunk.
+
+        Returns:
+            tuple: The entries to retry and the entries the database rejected.
+        """
+        try:
+            result = db.table(table).insert([row for row, _ in chunk]).execute()
+        except APIError as e:
+            if len(chunk) == 1:
+                print(f"Error: {table} rejected a buffered row: {e}")
+                return [], chunk
+            middle = len(chunk) // 2
+            first_failed, first_rejected = self._insert(table, chunk[:middle])
+            second_failed, second_rejected = self._insert(table, chunk[middle:])
+            return first_failed + second_failed, first_rejected + second_rejected
+        except Exception as e:
+            print(f"Error writing {len(chunk)} buffered rows to {table}: {e}")
+            return chunk, []
+        callback = self._callbacks.get(table)
+        if callback and result.data:
+            try:
+                callback(result.data)
+            except Exception as e:
+                print(f"Error in insert callback for {table}: {e}")
+        return [], []
+
+    def flush(self):
+        """
+        Writes every pending row with bulk inserts of at most BULK_CHUNK_SIZE rows.
+
+        Returns:
+            int: The number of rows inserted.
+        """
+        with self._flushing:
+            with self._lock:
+                if not self._count:
+                    return 0
+                batch, segments = self._pending, self._segments
+                self._pending, self._count, self._segments = {}, 0, []
+                self._journal.close()
+                self._open_segment()
+                self._not_full.notify_all()
+
+            inserted = 0
+            retry = []
+            dead = []
+            for table, entries in batch.items():
+                for start in range(0, len(entries), BULK_CHUNK_SIZE):
+                    chunk = entries[start:start + BULK_CHUNK_SIZE]
+                    failed, rejected = self._insert(table, chunk)
+                    inserted += len(chunk) - len(failed) - len(rejected)
+                    dead.extend((table, entry) for entry in rejected)
+                    for entry in failed:
+                        entry[1] += 1
+                        (dead if entry[1] >= WRITE_BEHIND_MAX_ATTEMPTS else retry).append((table, entry))
+
+            with self._lock:
+                # Only failures to reach the database back off; rejected rows are already dead
+                self._failures = min(self._failures + 1, 10) if retry else 0
+                if retry:
+                    # The failed rows move to the current segment before the old ones are removed
+                    self._append_journal([(table, entry[0]) for table, entry in retry])
+                    for table, entry in retry:
+                        self._pending.setdefault(table, []).append(entry)
+                    self._count += len(retry)
+                if dead:
+                    with open(os.path.join(self.journal_dir, 'dead.jsonl'), 'a', encoding='utf-8') as f:
+                        for table, entry in dead:
+                            f.write(json.dumps({'table': table, 'row': entry[0]}) + '\n')
+                    print(f"Error: Gave up on {len(dead)} buffered rows, see dead.jsonl.")
+            for path in segments:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            return inserted
+
+    def pending(self):
+        """
+        Returns the number of rows waiting to be written.
+        """
+        with self._lock:
+            return self._count
+
+    def close(self):
+        """
+        Stops the flush thread and writes the remaining rows.
+        """
+        if self._pid != os.getpid():
+            return
+        with self._lock:
+            self._closed = True
+            self._wakeup.notify_all()
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Error flushing buffered writes on shutdown: {e}")
+
+
+write_buffer = WriteBuffer()
+atexit.register(write_buffer.close)